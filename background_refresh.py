@@ -0,0 +1,150 @@
+"""
+Load-on-first-use and background-refresh scheduling for the process-wide caches.
+
+The search index, substitution index, inventory snapshot, stall monitor and sentiment
+rollups are loaded from the warehouse once per process and refreshed while pages keep
+reading them. Each subclasses ``BackgroundRefresh`` and implements ``refresh(session)``;
+``ensure_fresh`` decides when that runs:
+
+* the first load runs on the calling thread, so the first page gets data, unless the
+  class sets ``load_in_background`` (e.g. a slow full scan);
+* once the data is older than ``refresh_seconds``, one background thread refreshes it
+  while readers keep the previous data;
+* a failed load or refresh is logged and never raised to the page. Until
+  ``retry_seconds`` have passed, no new attempt starts, so a failing warehouse is not
+  hit with a full load on every rerun. Callers check the return value (or their own
+  empty state) and fall back, e.g. to the value their page query already returned.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# Seconds after a failed load or refresh before the next attempt.
+RETRY_SECONDS = 30.0
+
+
+class BackgroundRefresh:
+    """
+    Base for process-wide data loaded on first use and refreshed in the background.
+
+    Subclasses implement ``refresh(session)``, which sets ``refreshed_at`` when it
+    succeeds, and may override the class attributes below.
+
+    Args:
+        refresh_seconds (float): Age after which ``ensure_fresh`` starts a background refresh.
+        retry_seconds (float): Seconds after a failure before the next attempt.
+    """
+
+    # Used in the refresh thread's name and in log messages.
+    thread_name = "background-refresh"
+    description = "Cache"
+
+    # Whether the first load also runs in the background, leaving callers without data until it ends.
+    load_in_background = False
+
+    def __init__(self, refresh_seconds, retry_seconds=RETRY_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self.refreshed_at = None
+        self.failed_at = None  # Time of the last failure, cleared by the next success
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+
+    def refresh(self, session):
+        raise NotImplementedError
+
+    def _backing_off(self):
+        return self.failed_at is not None and time.time() - self.failed_at < self.retry_seconds
+
+    def _try_refresh(self, session):
+        try:
+            self.refresh(session)
+        except Exception as e:
+            self.failed_at = time.time()
+            logger.warning(f"{self.description} {'refresh' if self.refreshed_at else 'load'} failed, "
+                           f"retrying in {self.retry_seconds:.0f}s: {e}")
+        else:
+            self.failed_at = None
+
+    def _refresh_in_background(self, session):
+        try:
+            self._try_refresh(session)
+        finally:
+            self._refreshing = False
+
+    def ensure_fresh(self, session):
+        """
+        Loads the data on first use; afterwards starts a background refresh when it is stale.
+
+        Args:
+            session: Snowflake session used for the load or refresh.
+
+        Returns:
+            bool: Whether any data is loaded; False until the first load succeeds.
+        """
+        if self._backing_off():
+            return self.refreshed_at is not None
+        if self.refreshed_at is None and not self.load_in_background:
+            with self._refresh_lock:
+                # Sessions that waited here use the load that just ended, or its failure
+                if self.refreshed_at is None and not self._backing_off():
+                    self._try_refresh(session)
+        elif self.refreshed_at is None or time.time() - self.refreshed_at > self.refresh_seconds:
+            with self._refresh_lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, args=(session,),
+                                     name=self.thread_name, daemon=True).start()
+        return self.refreshed_at is not None
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    class _Counter(BackgroundRefresh):
+        """Counts refreshes; raises while ``failing`` is set."""
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.calls = 0
+            self.failing = None
+
+        def refresh(self, session):
+            self.calls += 1
+            time.sleep(0.05)
+            if self.failing:
+                raise self.failing
+            self.refreshed_at = time.time()
+
+    # A failed first load returns False without raising, and is not retried until the backoff ends.
+    cache = _Counter(refresh_seconds=60, retry_seconds=0.2)
+    cache.failing = ConnectionError("warehouse unreachable")
+    with ThreadPoolExecutor(20) as pool:
+        loaded = list(pool.map(lambda _: cache.ensure_fresh(None), range(20)))
+    assert not any(loaded) and cache.calls == 1, (loaded, cache.calls)
+    cache.failing = None
+    assert not cache.ensure_fresh(None) and cache.calls == 1
+    time.sleep(0.2)
+    assert cache.ensure_fresh(None) and cache.calls == 2 and cache.failed_at is None
+    print("failed first load: 20 concurrent callers, 1 attempt, reloaded after the backoff")
+
+    # A stale cache refreshes in the background, once, and a failure keeps the previous data.
+    cache.refreshed_at -= 61
+    cache.failing = TimeoutError("statement timed out")
+    assert all(cache.ensure_fresh(None) for _ in range(10))
+    while cache._refreshing:
+        time.sleep(0.01)
+    assert cache.calls == 3 and cache.ensure_fresh(None) and cache.calls == 3
+    print("stale refresh: one background attempt, previous data kept on failure")
+
+    # With load_in_background, even the first load leaves the caller without waiting.
+    cache = _Counter(refresh_seconds=60)
+    cache.load_in_background = True
+    started = time.perf_counter()
+    assert not cache.ensure_fresh(None) and time.perf_counter() - started < 0.05
+    while cache._refreshing:
+        time.sleep(0.01)
+    assert cache.ensure_fresh(None) and cache.calls == 1
+    print("background first load: caller returned at once")
@@ -1,10 +1,14 @@
 import streamlit as st
-import matplotlib.pyplot as plt
-from matplotlib.patches import Patch
 import pandas as pd
 import os
 import logging
 import re
+from warehouse_fetch import fetch_arrow
+from result_schemas import normalize_sentiment
+from sentiment_rollups import get_sentiment_rollups
+from chart_rendering import chart_pool, render_sentiment_chart
+from page_templates import (sentiment_page_head, sentiment_metrics_html, sentiment_legend_html,
+                            SENTIMENT_COLORS, SENTIMENT_EXPLANATION_HTML)
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -18,46 +22,8 @@ def get_snowflake_session():
     logger.info("Session SUCCESSFULLY started...")
     return session
 
-# Include Poppins font from Google Fonts
-st.markdown(
-    """
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="https://fonts.googleapis.com/css2?family=Poppins:wght@400;500;600;700&display=swap" rel="stylesheet">
-    """,
-    unsafe_allow_html=True,
-)
-
-st.markdown("""
-    <link href="https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;600&display=swap" rel="stylesheet">
-    <style>
-        html, body, [class*="css"]  {
-            font-family: 'Poppins', sans-serif;
-        }
-        .centered-text {
-            text-align: center;
-        }
-        .bold-number {
-            font-weight: bold;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
-st.markdown("""
-    <style>
-        .metric-title {
-            color: #737373;
-            text-align: center;
-            margin-bottom: 0px; /* Remove default bottom margin */
-        }
-        .metric-number {
-            color: #000;
-            text-align: center;
-            margin-top: 0px;    /* Remove default top margin */
-            font-weight: bold;
-        }
-    </style>
-""", unsafe_allow_html=True)
+# Fonts, CSS and title, rendered once per process (see page_templates.py)
+st.markdown(sentiment_page_head(), unsafe_allow_html=True)
 
 # Function to fetch sentiment data from Snowflake
 def fetch_sentiment_data(session,customer_id):
@@ -96,9 +62,7 @@ def fetch_sentiment_data(session,customer_id):
     """
     
     try:
-        df = session.sql(query).to_pandas()
-        print("Data from Snowflake:")  # Add this line
-        print(df)  # And this line
+        df = normalize_sentiment(fetch_arrow(session, query).to_pandas())
         return df
     except Exception as e:
         logger.error(f"Error executing query: {e}")
@@ -107,52 +71,33 @@ def fetch_sentiment_data(session,customer_id):
     
 # --- Function to plot sentiment data ---
 def plot_sentiment_chart(sentiment_data):
-    sentiment_mapping = {
-        "Very Negative": "#ef6658",
-        "Negative": "#efad56",  # Changed from "#F0AD4E" to match the visual
-        "Neutral": "#b0ccca",  # Changed from "#FFD700" to match the visual
-        "Positive": "#53a69a",  # Changed from "#5CB85C" to match the visual
-        "Very Positive": "#63b075",  # Changed from "#2E8B57" to match the visual
-    }
-
-    # Ensure column names match case sensitivity
-    sentiment_data.columns = [col.lower() for col in sentiment_data.columns]
+    sentiment_mapping = SENTIMENT_COLORS  # Shared with the legend
 
+    # Column names, bucket aliases and dtypes are normalized once on fetch (see result_schemas.py)
     if "sentiment_bucket" not in sentiment_data.columns:
         st.error("Error: 'sentiment_bucket' column not found in query results.")
         return None
 
-    sentiment_data['call_date'] = pd.to_datetime(sentiment_data['call_date'])
-    sentiment_data["sentiment_bucket"] = sentiment_data["sentiment_bucket"].replace({
-    "Slightly Negative": "Negative",
-    "Very Negative": "Very Negative",  # Optional, you can include others too
-    # Add more mappings as needed
-    })
-
-    conversation_date_mapping = sentiment_data.set_index('conversation_id')['call_date'].drop_duplicates()
+    conversation_date_mapping = sentiment_data.drop_duplicates('conversation_id').set_index('conversation_id')['call_date']
 
     # Pivot DataFrame to get stacked values for bar chart
-    pivot_df = sentiment_data.pivot(index="conversation_id", columns="sentiment_bucket", values="percentage").fillna(0)
-
-    fig, ax = plt.subplots(figsize=(10, 2.8))  # Increased figsize to take more width
-
-    # Create stacked horizontal bar chart
-    bottom = None
-    for sentiment in sentiment_mapping.keys():
-        if sentiment in pivot_df:
-            ax.barh(pivot_df.index, pivot_df[sentiment], left=bottom, color=sentiment_mapping[sentiment], label=sentiment)
-            bottom = pivot_df[sentiment] if bottom is None else bottom + pivot_df[sentiment]
-
-    ax.set_xlim(0, 100)
-    ax.set_xlabel('')
-    ax.set_ylabel('')
-    ax.tick_params(left=False, bottom=False)
-    ax.set_xticks([])
-    ax.set_yticklabels(conversation_date_mapping[pivot_df.index].dt.strftime('%m/%d/%Y'), fontsize=16, color='#555')
-    ax.invert_yaxis()
-    ax.spines[['top', 'right', 'left', 'bottom']].set_visible(False)
-
-    return fig
+    pivot_df = sentiment_data.pivot_table(index="conversation_id", columns="sentiment_bucket", values="percentage",
+                                          aggfunc="sum", observed=True).fillna(0)
+
+    # Only the compact chart data goes to the render worker (see chart_rendering.py)
+    buckets = [sentiment for sentiment in sentiment_mapping if sentiment in pivot_df]
+    labels = tuple(conversation_date_mapping[pivot_df.index].dt.strftime('%m/%d/%Y'))
+    series = tuple((sentiment, sentiment_mapping[sentiment], tuple(pivot_df[sentiment].astype(float)))
+                   for sentiment in buckets)
+    image = chart_pool.render(render_sentiment_chart, labels, series)
+    if image is not None:
+        st.image(image, use_container_width=True)
+    else:
+        # Render pool busy or slow: a native chart, drawn by the browser, keeps the page responsive
+        fallback_df = pivot_df[buckets].rename(columns=str)
+        st.bar_chart(fallback_df, horizontal=True, stack=True, color=[sentiment_mapping[sentiment] for sentiment in buckets],
+                     x_label="", y_label="", height=60 + 40 * len(fallback_df))
+    return image
     
 def calculate_total_bucket_score(sentiment_data, sentiment_weights):
     total_bucket_score = 0
@@ -181,16 +126,9 @@ def calculate_sentiment_score(total_bucket_score, sentiment_data, sentiment_weig
     return sentiment_score
 
 # --- LAYOUT ---
-st.markdown("""
-<h2 style="margin-top: -50px; margin-bottom: 0.2rem;">Account Sentiment</h2>
-<div style="height: 4px; width: 100px; background-color: #0073e6; margin-bottom: 10px;"></div>
-<hr style="margin-top: -10px;">
-""", unsafe_allow_html=True)
-
 # Get URL query parameters
 query_params = st.query_params
 customer_id = query_params.get("customer_id")
-print(customer_id)
 
 if not customer_id: 
     customer_id = "CUST-0001"
@@ -198,13 +136,7 @@ if not customer_id:
 if customer_id:
     session = get_snowflake_session()
     if session: 
-        sentiment_data = fetch_sentiment_data(session,customer_id)
-        sentiment_data.columns = [col.lower() for col in sentiment_data.columns]  # Convert all column names to lowercase
-        sentiment_data["sentiment_bucket"] = sentiment_data["sentiment_bucket"].replace({
-        "Slightly Negative": "Negative",
-        "Very Negative": "Very Negative",  # Optional, you can include others too
-        # Add more mappings as needed
-        })
+        sentiment_data = fetch_sentiment_data(session,customer_id)  # Already normalized
 
         if not sentiment_data.empty:
             sentiment_weights = {
@@ -216,26 +148,11 @@ if customer_id:
                 }
 
             total_bucket_score = calculate_total_bucket_score(sentiment_data, sentiment_weights)
-            print(total_bucket_score)
             sentiment_score = calculate_sentiment_score(total_bucket_score, sentiment_data, sentiment_weights)
             call_total = sentiment_data["conversation_id"].nunique()
             positive_sentiment = sentiment_data[sentiment_data["sentiment_bucket"].isin(["Positive", "Very Positive"])]
             total_percentage = sentiment_data["percentage"].sum()
-            st.markdown(
-                f"""
-                <div style="display: flex; justify-content: center; align-items: center;">
-                    <div style="text-align: center; margin-right: 50px;">
-                        <h6 style="color: #737373; margin-bottom: 0px;">Call Total</h6>
-                        <h1 style="color:#000; margin-top: -25px; font-size: 2.0em; font-weight: bold;">{call_total}</h1>
-                    </div>
-                    <div style="text-align: center;">
-                        <h6 style="color: #737373; margin-bottom: 0px;">Sentiment Score</h6>
-                        <h1 style="color:#000; margin-top: -25px; font-size: 2.0em; font-weight: bold;">{sentiment_score}%</h1>
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+            st.markdown(sentiment_metrics_html(call_total, sentiment_score), unsafe_allow_html=True)
             # --- Call Total and Sentiment Score ---
             #col1, col2 = st.columns(2)
             #with col1:
@@ -251,43 +168,26 @@ if customer_id:
                 #st.markdown(f"<h1 style='color:#000; text-align: center; margin-top: -20px; font-weight: bold;'>{sentiment_score}%</h1>", unsafe_allow_html=True)
 
             # --- Chart Explanation ---
-            st.markdown("""
-            <div style='margin-top: 15px; margin-bottom: 15px; font-size: 0.9rem; color: #555; font-style: italic; text-align: center;'>
-            This line chart depicts the real-time shift in sentiment categories from a customer—ranging from very negative to very positive—as an agent interacts with a customer throughout the duration of a single call.
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(SENTIMENT_EXPLANATION_HTML, unsafe_allow_html=True)
 
             # --- Sentiment Bar Chart ---
-            st.pyplot(plot_sentiment_chart(sentiment_data), use_container_width=True)
+            plot_sentiment_chart(sentiment_data)
 
             # --- Custom Legend ---
-            st.markdown("""
-            <div style='margin-top: 10px;'>
-                <div style='font-size: medium; color: #555; margin-bottom: 5px;'>Sentiment</div>
-                <div style='display: flex; flex-direction: column; align-items: flex-start;'>
-                    <div style='display: flex; align-items: center; margin-bottom: 3px;'>
-                        <div style='width: 20px; height: 20px; background-color: #ef6658; margin-right: 5px;'></div>
-                        <div style='font-size: small; color: #555;'>Very Negative</div>
-                    </div>
-                    <div style='display: flex; align-items: center; margin-bottom: 3px;'>
-                        <div style='width: 20px; height: 20px; background-color: #efad56; margin-right: 5px;'></div>
-                        <div style='font-size: small; color: #555;'>Negative</div>
-                    </div>
-                    <div style='display: flex; align-items: center; margin-bottom: 3px;'>
-                        <div style='width: 20px; height: 20px; background-color: #b0ccca; margin-right: 5px;'></div>
-                        <div style='font-size: small; color: #555;'>Neutral</div>
-                    </div>
-                    <div style='display: flex; align-items: center; margin-bottom: 3px;'>
-                        <div style='width: 20px; height: 20px; background-color: #53a69a; margin-right: 5px;'></div>
-                        <div style='font-size: small; color: #555;'>Positive</div>
-                    </div>
-                    <div style='display: flex; align-items: center;'>
-                        <div style='width: 20px; height: 20px; background-color: #63b075; margin-right: 5px;'></div>
-                        <div style='font-size: small; color: #555;'>Very Positive</div>
-                    </div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(sentiment_legend_html(), unsafe_allow_html=True)
+
+            # --- Sentiment Trend (weekly rollups, one row per week) ---
+            try:
+                rollups = get_sentiment_rollups()
+                rollups.ensure_fresh(session)
+                trend_start = (sentiment_data["call_date"].max() - pd.DateOffset(months=12)).date()
+                trend = rollups.trend(customer_id, "weekly", start=trend_start)
+                if len(trend) > 1:
+                    st.markdown("<h6 style='color: #737373; margin-top: 20px;'>Sentiment Trend (last 12 months, weekly)</h6>",
+                                unsafe_allow_html=True)
+                    st.line_chart(trend.set_index("PERIOD_START")["SCORE"], height=200)
+            except Exception as e:
+                logger.error(f"Error loading sentiment trend: {e}")
         else:
             st.warning("No data found")
 
@@ -0,0 +1,313 @@
+"""
+Chart rasterization in a bounded pool of worker processes.
+
+Drawing and rasterizing a matplotlib figure is pure Python and C++ work that holds the
+GIL, so on the Streamlit script thread a large chart slows every other session's rerun
+in the same server process. ``ChartPool`` sends the compact chart data (labels and one
+tuple of values per series) to worker processes, which draw the figure and return PNG
+bytes. The page only embeds the image.
+
+The pool is bounded twice. A fixed number of worker processes caps the CPU used, and a
+cap on pending renders means a busy pool turns callers away instead of queueing them.
+A caller gets None when the pool is saturated, the render times out or the worker fails,
+and falls back to a native Streamlit chart. A worker that died is replaced at once.
+Finished images are memoized on their input, so a rerun with unchanged data does no
+rendering at all.
+
+Forking a threaded server process is unsafe, and a process started by ``multiprocessing``
+re-runs the parent's ``__main__``, which during a Streamlit script run is the page
+itself. So each worker is a plain ``python chart_worker.py`` process that runs only that
+small entry module, and takes requests over its stdin and stdout.
+"""
+import io
+import logging
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# Worker processes; rasterizing is CPU-bound, so more than the core count only queues.
+RENDER_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# Renders queued or running at once; beyond this callers get the fallback straight away.
+MAX_PENDING = RENDER_WORKERS * 2
+
+# Seconds a rerun waits for its image before falling back.
+RENDER_TIMEOUT = 5.0
+
+# Rendered images kept, least recently used evicted first.
+CACHE_SIZE = 256
+
+# Entry module of the worker processes, run by path so they import this directory's modules.
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chart_worker.py")
+
+
+###############################################################################
+# 1. Chart drawing (runs in the worker processes)
+###############################################################################
+def render_sentiment_chart(labels, series, dpi=100):
+    """
+    Draws the stacked horizontal sentiment bar chart and returns it as PNG bytes.
+
+    Args:
+        labels (tuple): One y-axis label (call date) per conversation, top to bottom.
+        series (tuple): ``(bucket, color, values)`` in stacking order; values are percentages.
+        dpi (int): Raster resolution.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+
+    # A bare Figure is never registered with pyplot, so nothing needs closing afterwards.
+    fig = Figure(figsize=(10, 2.8))
+    ax = fig.subplots()
+    positions = range(len(labels))
+    left = [0.0] * len(labels)
+    for bucket, color, values in series:
+        ax.barh(positions, values, left=left, color=color, label=bucket)
+        left = [total + value for total, value in zip(left, values)]
+
+    ax.set_xlim(0, 100)
+    ax.tick_params(left=False, bottom=False)
+    ax.set_xticks([])
+    ax.set_yticks(list(positions), labels, fontsize=16, color="#555")
+    ax.invert_yaxis()
+    ax.spines[["top", "right", "left", "bottom"]].set_visible(False)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+###############################################################################
+# 2. Bounded pool
+###############################################################################
+class _Worker:
+    """One ``chart_worker.py`` process, serving one render at a time."""
+
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, WORKER_SCRIPT], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE)
+        self.exited = False
+
+    def run(self, fn, args):
+        try:
+            pickle.dump((fn, args), self.process.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+            self.process.stdin.flush()
+            ok, value = pickle.load(self.process.stdout)
+        except (EOFError, OSError) as e:
+            self.exited = True
+            raise RuntimeError(f"chart worker {self.process.pid} exited") from e
+        if not ok:
+            raise RuntimeError(value)
+        return value
+
+    def close(self):
+        """Closes the worker's stdin; it exits once its current render, if any, is done."""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+
+class ChartPool:
+    """
+    Renders charts in worker processes, refusing work rather than queueing it when busy.
+
+    Args:
+        workers (int): Worker processes.
+        max_pending (int): Renders queued or running at once.
+        timeout (float): Default seconds a caller waits for its image.
+        cache_size (int): Rendered images memoized by input.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, max_pending=MAX_PENDING, timeout=RENDER_TIMEOUT,
+                 cache_size=CACHE_SIZE):
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._idle = None  # Workers not rendering; one per executor thread
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self.stats = {"rendered": 0, "cached": 0, "saturated": 0, "timeouts": 0, "errors": 0}
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Every worker starts now (and imports matplotlib), not during later renders
+                self._idle = queue.SimpleQueue()
+                for _ in range(self.workers):
+                    self._idle.put(_Worker())
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="chart-render")
+            return self._executor, self._idle
+
+    def _run(self, idle, fn, args):
+        """Runs on an executor thread, on whichever worker is idle."""
+        worker = idle.get()
+        try:
+            return worker.run(fn, args)
+        finally:
+            if worker.exited:
+                logger.warning(f"Chart worker {worker.process.pid} exited, starting a new one.")
+                worker = _Worker()
+            if idle is self._idle:
+                idle.put(worker)
+            else:
+                worker.close()  # The pool was shut down during the render
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def render(self, fn, *args, timeout=None):
+        """
+        Runs ``fn(*args)`` in a worker and returns its bytes, or None to signal a fallback.
+
+        Args:
+            fn (callable): Module-level function returning the image bytes.
+            *args: Picklable, hashable chart data.
+            timeout (float): Seconds to wait; defaults to the pool's timeout.
+
+        Returns:
+            bytes: The image, or None if the pool is saturated, the render timed out or failed.
+        """
+        key = (fn.__module__, fn.__qualname__, args)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats["cached"] += 1
+                return self._cache[key]
+        if not self._slots.acquire(blocking=False):
+            self._count("saturated")
+            logger.info("Chart pool saturated, using the fallback chart.")
+            return None
+        try:
+            executor, idle = self._pool()
+            future = executor.submit(self._run, idle, fn, args)
+        except Exception as e:
+            self._slots.release()
+            self._count("errors")
+            logger.warning(f"Could not submit chart render: {e}")
+            return None
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            image = future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            future.cancel()  # Only drops it if still queued; a running render finishes and frees its slot
+            self._count("timeouts")
+            logger.warning("Chart render timed out, using the fallback chart.")
+            return None
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Chart render failed, using the fallback chart: {e}")
+            return None
+        with self._lock:
+            self.stats["rendered"] += 1
+            self._cache[key] = image
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return image
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                while not self._idle.empty():
+                    self._idle.get().close()
+                self._executor = self._idle = None
+
+
+# Process-wide instance shared by every Streamlit session.
+chart_pool = ChartPool()
+
+
+###############################################################################
+# Benchmark
+###############################################################################
+def _benchmark():
+    """
+    Latency of light reruns in other sessions while heavy charts render, with the charts
+    drawn on the callers' threads (as st.pyplot did) versus in the pool.
+    """
+    import statistics
+    import time
+
+    colors = {"Very Negative": "#FF4D4D", "Negative": "#FF9999", "Neutral": "#D3D3D3",
+              "Positive": "#99CC99", "Very Positive": "#4CAF50"}
+    conversations = 200
+    labels = tuple(f"03/{i % 28 + 1:02d}/2025" for i in range(conversations))
+
+    def chart_data(variant):
+        """Distinct data per variant, so the memo never answers a heavy chart."""
+        return labels, tuple((bucket, color, tuple((i * 7 + j * 13) % 20 + variant / 1000 for i in range(conversations)))
+                             for j, (bucket, color) in enumerate(colors.items()))
+
+    def light_rerun():
+        started = time.perf_counter()
+        sum(i * i for i in range(20_000))  # A few milliseconds of pure-Python page work
+        return time.perf_counter() - started
+
+    def run(render, heavy=4, light=200):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(heavy + 1) as threads:
+            charts = [threads.submit(render, i) for i in range(heavy)]
+            latencies = sorted(threads.submit(lambda: [light_rerun() for _ in range(light)]).result())
+            for chart in charts:
+                chart.result()
+        return (statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.95)] * 1000,
+                time.perf_counter() - started)
+
+    baseline = sorted(light_rerun() for _ in range(200))
+    print(f"idle               p50 {statistics.median(baseline) * 1000:6.1f} ms  p95 {baseline[190] * 1000:6.1f} ms")
+
+    pool = ChartPool(max_pending=8, timeout=60)
+    pool.render(render_sentiment_chart, *chart_data(-1))  # Start the workers before measuring
+    renderers = [("inline (script)", lambda i: render_sentiment_chart(*chart_data(i))),
+                 ("process pool", lambda i: pool.render(render_sentiment_chart, *chart_data(100 + i)))]
+    for name, render in renderers:
+        p50, p95, seconds = run(render)
+        print(f"{name:<18} p50 {p50:6.1f} ms  p95 {p95:6.1f} ms  (alongside 4 heavy charts, {seconds:.1f}s)")
+
+    print(f"stats {pool.stats}")
+    pool.shutdown()
+
+    # Saturation: with the default cap, renders beyond the pending slots fall back at once.
+    pool = ChartPool(timeout=60)
+    burst = MAX_PENDING * 3
+    with ThreadPoolExecutor(burst) as threads:
+        results = list(threads.map(lambda i: pool.render(render_sentiment_chart, *chart_data(200 + i)), range(burst)))
+    print(f"burst of {burst} renders: {sum(result is None for result in results)} fell back; stats {pool.stats}")
+
+    # A worker that dies falls back for its render and is replaced; the pool keeps working.
+    pool = ChartPool(workers=1, timeout=60)
+    pool.render(render_sentiment_chart, *chart_data(-2))
+    crashed = pool._idle.get()
+    pool._idle.put(crashed)
+    assert pool.render(os._exit, 1) is None
+    assert pool.render(render_sentiment_chart, *chart_data(-3)) is not None
+    replacement = pool._idle.get()
+    assert replacement.process.pid != crashed.process.pid and crashed.process.wait(5) == 1
+    pool._idle.put(replacement)
+    print(f"after a worker crash: stats {pool.stats}")
+    pool.shutdown()
+    assert replacement.process.wait(5) == 0  # Shutdown closes the workers' stdin, so they exit
+
+
+if __name__ == "__main__":
+    # Run from the imported module: workers unpickle functions by module name, and this
+    # script's own name is "__main__".
+    import chart_rendering
+
+    chart_rendering._benchmark()
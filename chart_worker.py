@@ -0,0 +1,38 @@
+"""
+Entry point of the chart render workers started by ``ChartPool`` (see chart_rendering.py).
+
+Each worker is a plain ``python chart_worker.py`` process, so it runs this module and
+nothing of the server's ``__main__``, which during a Streamlit script run is a page. It
+reads pickled ``(fn, args)`` requests from stdin, one at a time, and writes back a
+pickled ``(ok, value)`` reply: the result, or the error message when ``fn`` raised. It
+exits when stdin closes, which also happens when the server process dies.
+"""
+import pickle
+import sys
+
+
+def main():
+    requests, replies = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr  # Stray prints must not corrupt the reply stream
+
+    # Pay for the matplotlib import at start-up, not during the first render
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.figure  # noqa: F401
+
+    while True:
+        try:
+            fn, args = pickle.load(requests)
+        except EOFError:
+            return
+        try:
+            reply = (True, fn(*args))
+        except Exception as e:
+            reply = (False, f"{type(e).__name__}: {e}")
+        pickle.dump(reply, replies, protocol=pickle.HIGHEST_PROTOCOL)
+        replies.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Embedded SQLite replica of the recent slice of the tables behind the order page.
+
+A background thread keeps the replica current with incremental pulls. Orders, Shipments
+and PRODUCTS carry a change column (``LAST_UPDATED``), so each pass pulls only the rows
+changed at or after the highest value seen, which catches in-place status updates.
+Tables without one follow a parent: ORDER_LINE_ITEMS are pulled for changed orders, and
+Tracking scans for changed shipments (a scan updates its shipment) plus any scan newer
+than the last one seen. Deletes leave no change row behind, so the recent slice is
+reloaded in full only every ``reconcile_seconds``, in one transaction.
+
+``lag_seconds`` is the age of the oldest table's last complete sync, not of the last
+pass, and ``query`` refuses to answer once it exceeds ``max_lag_seconds``, so the order
+page falls back to Snowflake instead of serving rows of unknown age. The replica uses
+the warehouse's table and column names, so the page can run its existing SQL against it.
+"""
+import datetime
+import decimal
+import functools
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import pyarrow as pa
+
+from warehouse_fetch import sql_literal
+
+logger = logging.getLogger("streamlit-snowflake")
+
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.datetime.fromisoformat(raw.decode()))
+
+# Seconds between background sync passes.
+SYNC_INTERVAL = 15.0
+
+# Seconds between full reloads of every table's recent slice, which drop deleted rows.
+RECONCILE_SECONDS = 3600.0
+
+# Lag past which the replica stops answering and the page reads from the warehouse.
+MAX_LAG_SECONDS = 150.0
+
+# How far back the replica reaches, by order date.
+RECENT_DAYS = 30
+
+# Replicated tables. ``window`` limits a table to the recent slice (``{cutoff}`` is the
+# oldest order date kept). ``watermark`` is a column that grows for every insert or
+# update; rows at the watermark are re-pulled on every pass and upserted on ``key``, so
+# ties are never lost. ``follows`` is ``(parent, condition)``: rows of a parent row changed
+# since the parent's watermark (``{since}``). ORDER_LINE_ITEMS is included because the
+# order lookup joins it.
+_RECENT_ORDERS = "ORDER_ID IN (SELECT ORDER_ID FROM Orders WHERE ORDER_DATE >= {cutoff})"
+
+REPLICA_TABLES = {
+    "Orders": {
+        "columns": {"ORDER_ID": "TEXT", "CUSTOMER_ID": "TEXT", "ORDER_STATUS": "TEXT",
+                    "ORDER_DATE": "TIMESTAMP", "EXPECTED_DELIVERY_DATE": "TIMESTAMP",
+                    "ACTUAL_DELIVERY_DATE": "TIMESTAMP", "LAST_UPDATED": "TIMESTAMP"},
+        "key": ["ORDER_ID"],
+        "window": "ORDER_DATE >= {cutoff}",
+        "watermark": "LAST_UPDATED",
+    },
+    "ORDER_LINE_ITEMS": {
+        "columns": {"ORDER_ID": "TEXT", "PRODUCT_ID": "TEXT"},
+        "key": ["ORDER_ID", "PRODUCT_ID"],
+        "window": _RECENT_ORDERS,
+        "follows": ("Orders", "ORDER_ID IN (SELECT ORDER_ID FROM Orders WHERE LAST_UPDATED >= {since})"),
+    },
+    "Shipments": {
+        "columns": {"SHIPMENT_ID": "TEXT", "ORDER_ID": "TEXT", "SHIPMENT_STATUS": "TEXT",
+                    "TRACKING_NUMBER": "TEXT", "LAST_UPDATED": "TIMESTAMP"},
+        "key": ["SHIPMENT_ID"],
+        "window": _RECENT_ORDERS,
+        "watermark": "LAST_UPDATED",
+    },
+    "Tracking": {
+        "columns": {"SHIPMENT_ID": "TEXT", "TRACKING_NUMBER": "TEXT", "STATUS_UPDATE": "TEXT",
+                    "LOCATION": "TEXT", "TIMESTAMP": "TIMESTAMP"},
+        "key": ["SHIPMENT_ID", "STATUS_UPDATE", "TIMESTAMP"],
+        "window": "TIMESTAMP >= {cutoff}",
+        "watermark": "TIMESTAMP",
+        "follows": ("Shipments", "SHIPMENT_ID IN (SELECT SHIPMENT_ID FROM Shipments WHERE LAST_UPDATED >= {since})"),
+    },
+    "PRODUCTS": {
+        "columns": {"PRODUCT_ID": "TEXT", "PRODUCT_NAME": "TEXT", "PRODUCT_DESCRIPTION": "TEXT",
+                    "PRICE": "REAL", "STOCK_QUANTITY": "INTEGER", "LAST_UPDATED": "TIMESTAMP"},
+        "key": ["PRODUCT_ID"],
+        "watermark": "LAST_UPDATED",
+    },
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _row_type(columns):
+    return namedtuple("Row", columns, rename=True)
+
+
+class HotReplica:
+    """
+    A local SQLite copy of the recent order data, kept current by a background sync.
+
+    Args:
+        path (str): SQLite database file (``":memory:"`` for a throwaway replica).
+        tables (dict): Table configuration, see ``REPLICA_TABLES``.
+        interval (float): Seconds between sync passes.
+        reconcile_seconds (float): Seconds between full reloads of every table.
+        max_lag_seconds (float): Lag past which ``query`` stops answering.
+        recent_days (int): Days of orders kept.
+    """
+
+    def __init__(self, path, tables=REPLICA_TABLES, interval=SYNC_INTERVAL, reconcile_seconds=RECONCILE_SECONDS,
+                 max_lag_seconds=MAX_LAG_SECONDS, recent_days=RECENT_DAYS):
+        self.tables = tables
+        self.interval = interval
+        self.reconcile_seconds = reconcile_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.recent_days = recent_days
+        self.last_sync = None
+        self.reconciled_at = None
+        self.synced_at = {}
+        self.watermarks = {}
+        self._session = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        # Nothing is served before the first full reload, so rows left in an existing file are never reused
+        for table, config in tables.items():
+            columns = ", ".join(f"{name} {kind}" for name, kind in config["columns"].items())
+            self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(f"CREATE TABLE {table} ({columns}, PRIMARY KEY ({', '.join(config['key'])}))")
+            if config.get("watermark"):
+                self._conn.execute(f"CREATE INDEX {table}_watermark ON {table} ({config['watermark']})")
+        self._conn.commit()
+
+    ###########################################################################
+    # Sync
+    ###########################################################################
+    def start(self, session):
+        """Starts the background sync if needed and points it at the caller's current session."""
+        self._session = session
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="hot-replica-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync_once(self._session)
+            except Exception as e:
+                logger.warning(f"Replica sync failed: {e}")
+            self._stop.wait(self.interval)
+
+    def sync_once(self, session):
+        """
+        Reloads every table when a full reload is due, otherwise pulls the rows changed since the last pass.
+
+        All tables are written in one transaction, so a reader never sees them out of step.
+
+        Returns:
+            dict: Number of rows pulled per table.
+        """
+        started = time.time()
+        full = self.reconciled_at is None or started - self.reconciled_at > self.reconcile_seconds
+        cutoff = sql_literal(datetime.datetime.now() - datetime.timedelta(days=self.recent_days))
+        results = {}
+        for table, config in self.tables.items():
+            conditions = [config["window"].format(cutoff=cutoff)] if config.get("window") else []
+            if not full:
+                changed = []
+                if config.get("watermark") and self.watermarks.get(table) is not None:
+                    changed.append(f"{config['watermark']} >= {sql_literal(self.watermarks[table])}")
+                if config.get("follows") and self.watermarks.get(config["follows"][0]) is not None:
+                    parent, condition = config["follows"]
+                    changed.append(condition.format(since=sql_literal(self.watermarks[parent])))
+                # A table with no watermark yet (it was empty) is pulled whole, which is cheap
+                if changed:
+                    conditions.append("(" + " OR ".join(changed) + ")")
+            query = f"SELECT {', '.join(config['columns'])} FROM {table}"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            results[table] = session.sql(query).collect()
+
+        with self._lock:
+            for table, rows in results.items():
+                config = self.tables[table]
+                if full:
+                    self._conn.execute(f"DELETE FROM {table}")
+                if rows:
+                    placeholders = ", ".join("?" for _ in config["columns"])
+                    self._conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})",
+                                           [tuple(row) for row in rows])
+            self._conn.commit()
+
+        # Parents' watermarks move only after every follower used the old ones
+        for table, rows in results.items():
+            config = self.tables[table]
+            if config.get("watermark"):
+                index = list(config["columns"]).index(config["watermark"])
+                values = [row[index] for row in rows if row[index] is not None]
+                if values:
+                    previous = None if full else self.watermarks.get(table)
+                    self.watermarks[table] = max(values) if previous is None else max(max(values), previous)
+            # Changes made while the pass ran may be missed, so a table is current as of the pass start
+            self.synced_at[table] = started
+        if full:
+            self.reconciled_at = started
+        self.last_sync = started
+        pulled = {table: len(rows) for table, rows in results.items()}
+        logger.debug(f"Replica {'reload' if full else 'sync'} pulled {pulled}")
+        return pulled
+
+    ###########################################################################
+    # Reads
+    ###########################################################################
+    def lag_seconds(self):
+        """Age of the least current table, in seconds, or None if the replica has never synced."""
+        if len(self.synced_at) < len(self.tables):
+            return None
+        return time.time() - min(self.synced_at.values())
+
+    def query(self, query, arrow=False):
+        """
+        Runs warehouse SQL against the replica.
+
+        Args:
+            query (str): SQL text.
+            arrow (bool): Return an Arrow table instead of Row tuples, like ``fetch_arrow``.
+
+        Returns:
+            list or pyarrow.Table: The result, or None if the replica has not synced yet, lags more
+                than ``max_lag_seconds`` or cannot answer the query.
+        """
+        lag = self.lag_seconds()
+        if lag is None or lag > self.max_lag_seconds:
+            return None
+        try:
+            with self._lock:
+                cursor = self._conn.execute(query)
+                columns = [description[0].upper() for description in cursor.description]
+                rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.debug(f"Replica could not answer query: {e}")
+            return None
+        if arrow:
+            return pa.table({column: [row[i] for row in rows] for i, column in enumerate(columns)})
+        make_row = _row_type(tuple(columns))
+        return [make_row(*row) for row in rows]
+
+
+_replicas = {}
+_replicas_lock = threading.Lock()
+
+
+def get_hot_replica(path):
+    """Returns the process-wide replica for ``path``, creating it on first use."""
+    with _replicas_lock:
+        if path not in _replicas:
+            _replicas[path] = HotReplica(path)
+        return _replicas[path]
+
+
+def format_lag(seconds):
+    """Formats a replica lag for display, e.g. ``"42s"`` or ``"3m 5s"``."""
+    if seconds is None:
+        return "not yet synced"
+    seconds = int(seconds)
+    return f"{seconds // 60}m {seconds % 60}s" if seconds >= 60 else f"{seconds}s"
+
+
+if __name__ == "__main__":
+    # Order lookups from the replica versus the warehouse, then the staleness guarantees,
+    # against the local fake session (its demo data is dated April 2025).
+    import statistics
+
+    from local_session import LocalSession
+
+    session = LocalSession(latency=0.05)
+    replica = HotReplica(":memory:", reconcile_seconds=3600, max_lag_seconds=3600, recent_days=3650)
+    started = time.perf_counter()
+    pulled = replica.sync_once(session)
+    print(f"full reload: {sum(pulled.values())} rows in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def order_query(order_id):
+        return f"""
+            SELECT o.ORDER_ID, o.ORDER_STATUS, o.ORDER_DATE, s.SHIPMENT_STATUS, s.TRACKING_NUMBER,
+                   o.EXPECTED_DELIVERY_DATE, oli.PRODUCT_ID
+            FROM Orders o
+            LEFT JOIN Shipments s ON o.ORDER_ID = s.ORDER_ID
+            JOIN ORDER_LINE_ITEMS oli ON o.ORDER_ID = oli.ORDER_ID
+            WHERE o.ORDER_ID = '{order_id}'
+        """
+
+    for name, run in (("warehouse (50 ms round trip)", lambda q: session.sql(q).collect()), ("replica", replica.query)):
+        timings = []
+        for o in range(1, 41):
+            query = order_query(f"ORD-{o:04d}")
+            began = time.perf_counter()
+            assert run(query)
+            timings.append((time.perf_counter() - began) * 1000)
+        timings.sort()
+        print(f"{name:<28} p50 {statistics.median(timings):7.2f} ms  p95 {timings[37]:7.2f} ms")
+
+    # An in-place status change, a shipment whose ID sorts below every existing one, and a
+    # late carrier scan all carry a change timestamp, so one incremental pass picks them up.
+    changed_at = "'2025-05-01 00:00:00'"
+    session._conn.execute(f"UPDATE Orders SET ORDER_STATUS = 'Delivered', LAST_UPDATED = {changed_at} "
+                          "WHERE ORDER_ID = 'ORD-0001'")
+    session._conn.execute(f"INSERT INTO Shipments VALUES ('SHP-0000', 'ORD-0001', 'Delivered', '1Z0', {changed_at})")
+    session._conn.execute("INSERT INTO Tracking VALUES ('SHP-0000', '1Z0', 'Picked Up', 'Memphis, TN', "
+                          "'2025-03-01 08:00:00')")
+    status = "SELECT ORDER_STATUS FROM Orders WHERE ORDER_ID = 'ORD-0001'"
+    pulled = replica.sync_once(session)
+    assert replica.query(status)[0].ORDER_STATUS == "Delivered" and replica.lag_seconds() < 1
+    assert replica.query("SELECT 1 FROM Shipments WHERE SHIPMENT_ID = 'SHP-0000'")
+    assert replica.query("SELECT 1 FROM Tracking WHERE SHIPMENT_ID = 'SHP-0000'")
+    assert sum(pulled.values()) < 20, pulled
+    print(f"incremental pass pulled {pulled}")
+
+    # A deleted order leaves no change row, so it goes at the next full reload.
+    session._conn.execute("DELETE FROM Orders WHERE ORDER_ID = 'ORD-0002'")
+    deleted = "SELECT 1 FROM Orders WHERE ORDER_ID = 'ORD-0002'"
+    replica.sync_once(session)
+    assert replica.query(deleted)
+    replica.reconciled_at -= replica.reconcile_seconds + 1
+    replica.sync_once(session)
+    assert not replica.query(deleted)
+
+    # A stock change has a real change timestamp, so an incremental pass keeps PRODUCTS current.
+    session._conn.execute("UPDATE PRODUCTS SET STOCK_QUANTITY = 999, LAST_UPDATED = '2025-04-09 00:00:00' "
+                          "WHERE PRODUCT_ID = 'PROD-0002'")
+    replica.sync_once(session)
+    assert replica.query("SELECT STOCK_QUANTITY FROM PRODUCTS WHERE PRODUCT_ID = 'PROD-0002'")[0].STOCK_QUANTITY == 999
+
+    # Past the freshness bound the replica stops answering, so the page reads from the warehouse.
+    replica.max_lag_seconds = 0.1
+    time.sleep(0.2)
+    assert replica.query(status) is None
+    print(f"lag {format_lag(replica.lag_seconds())}; stale replica declines queries")
@@ -0,0 +1,235 @@
+"""
+Process-wide, array-backed snapshot of product stock levels.
+
+Product IDs sit in one sorted NumPy array of ASCII bytes, with stock and last-update time
+in parallel ``int32``/``int64`` arrays, so a lookup is a binary search and a million
+products take about 23 MB. The snapshot is loaded in bulk on first use (see
+background_refresh.py; while that load fails, lookups find nothing). After that, a
+background refresh pulls only the rows whose ``LAST_UPDATED`` is at or past the highest
+value seen, plus a periodic full reload that drops deleted products. Every refresh
+builds new arrays and swaps them in as one tuple (copy-on-write), so readers in any
+session always see a consistent snapshot without taking a lock. Lookups never query the
+warehouse. ``age_seconds`` reports how stale the snapshot is.
+"""
+import logging
+import time
+from collections import namedtuple
+
+import numpy as np
+import pyarrow as pa
+
+from background_refresh import BackgroundRefresh
+from substitution_index import shipping_status
+from warehouse_fetch import fetch_arrow
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# Seconds before a lookup starts a background incremental refresh.
+REFRESH_SECONDS = 30
+
+# Seconds between full reloads, which also drop products deleted from PRODUCTS.
+FULL_RELOAD_SECONDS = 3600
+
+STOCK_QUERY = """
+    SELECT PRODUCT_ID, STOCK_QUANTITY, LAST_UPDATED
+    FROM PRODUCTS
+    {where}
+"""
+
+_Snapshot = namedtuple("_Snapshot", ["product_ids", "stock", "updated", "watermark"])
+
+_EMPTY = _Snapshot(np.array([], dtype="S1"), np.array([], dtype="int32"), np.array([], dtype="int64"), None)
+
+
+def _columns(table):
+    """Returns ``(ids, stock, updated_us)`` arrays for a stock query result, latest row per product, sorted by ID."""
+    ids = np.asarray(table["PRODUCT_ID"].to_numpy(zero_copy_only=False), dtype="S")
+    stock = table["STOCK_QUANTITY"].fill_null(0).to_numpy(zero_copy_only=False).astype("int32")
+    updated = table["LAST_UPDATED"].cast(pa.timestamp("us")).cast(pa.int64()).fill_null(0).to_numpy(zero_copy_only=False)
+    # Sort by ID, then update time, and keep the last row of each ID
+    order = np.lexsort((updated, ids))
+    ids, stock, updated = ids[order], stock[order], updated[order]
+    last = np.ones(len(ids), dtype=bool)
+    last[:-1] = ids[1:] != ids[:-1]
+    return ids[last], stock[last], updated[last]
+
+
+def _merged(old, ids, stock, updated):
+    """Returns a new snapshot with sorted ``ids`` upserted into ``old``; ``old`` is never modified."""
+    positions = np.searchsorted(old.product_ids, ids)
+    known = positions < len(old.product_ids)
+    known[known] = old.product_ids[positions[known]] == ids[known]
+
+    new_stock = old.stock.copy()
+    new_updated = old.updated.copy()
+    new_stock[positions[known]] = stock[known]
+    new_updated[positions[known]] = updated[known]
+    product_ids = old.product_ids
+    if not known.all():
+        inserted = positions[~known]
+        product_ids = np.insert(product_ids.astype(np.result_type(product_ids, ids)), inserted, ids[~known])
+        new_stock = np.insert(new_stock, inserted, stock[~known])
+        new_updated = np.insert(new_updated, inserted, updated[~known])
+    watermark = max(old.watermark or 0, int(updated.max())) if len(updated) else old.watermark
+    return _Snapshot(product_ids, new_stock, new_updated, watermark)
+
+
+class InventorySnapshot(BackgroundRefresh):
+    """
+    Stock level per product ID, shared by every session and refreshed incrementally.
+
+    Args:
+        refresh_seconds (float): Age after which a lookup starts a background refresh.
+        full_reload_seconds (float): Age of the last bulk load after which a refresh reloads everything.
+    """
+
+    thread_name = "inventory-refresh"
+    description = "Inventory snapshot"
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, full_reload_seconds=FULL_RELOAD_SECONDS):
+        super().__init__(refresh_seconds)
+        self.full_reload_seconds = full_reload_seconds
+        self.loaded_at = None
+        self._snapshot = _EMPTY
+
+    ###########################################################################
+    # Loading
+    ###########################################################################
+    def load(self, table):
+        """Replaces the snapshot with a bulk result of ``STOCK_QUERY``."""
+        self._snapshot = _merged(_EMPTY, *_columns(table))
+        self.loaded_at = self.refreshed_at = time.time()
+
+    def apply(self, table):
+        """Upserts changed rows (a ``STOCK_QUERY`` result) into a copy of the snapshot and swaps it in."""
+        if table.num_rows:
+            self._snapshot = _merged(self._snapshot, *_columns(table))
+        self.refreshed_at = time.time()
+
+    def refresh(self, session):
+        """Pulls rows changed since the watermark, or everything when a full reload is due."""
+        snapshot = self._snapshot
+        if self.loaded_at is None or time.time() - self.loaded_at > self.full_reload_seconds:
+            started = time.perf_counter()
+            self.load(fetch_arrow(session, STOCK_QUERY.format(where="")))
+            logger.info(f"Inventory snapshot loaded: {len(self._snapshot.product_ids):,} products "
+                        f"in {time.perf_counter() - started:.3f}s")
+            return
+        # Rows at the watermark are pulled again, so updates sharing its timestamp are never lost
+        watermark = pa.scalar(snapshot.watermark or 0, type=pa.timestamp("us")).as_py()
+        changed = fetch_arrow(session, STOCK_QUERY.format(where=f"WHERE LAST_UPDATED >= '{watermark.isoformat(' ')}'"))
+        self.apply(changed)
+        logger.debug(f"Inventory snapshot refreshed: {changed.num_rows} changed rows")
+
+    ###########################################################################
+    # Lookups
+    ###########################################################################
+    def age_seconds(self):
+        """Seconds since the last successful refresh, or None before the first load."""
+        return None if self.refreshed_at is None else time.time() - self.refreshed_at
+
+    def stock(self, product_id):
+        """Returns the product's stock quantity, or None if it is not in the snapshot."""
+        snapshot = self._snapshot
+        key = product_id.encode("ascii", "replace")
+        position = np.searchsorted(snapshot.product_ids, key)
+        if position < len(snapshot.product_ids) and snapshot.product_ids[position] == key:
+            return int(snapshot.stock[position])
+        return None
+
+    def stock_many(self, product_ids):
+        """
+        Vectorized ``stock`` for many products.
+
+        Returns:
+            np.ndarray: ``int32`` stock per product, -1 where the product is unknown.
+        """
+        snapshot = self._snapshot
+        product_ids = np.asarray(product_ids, dtype="S")  # Product IDs are ASCII
+        positions = np.searchsorted(snapshot.product_ids, product_ids).clip(max=max(len(snapshot.product_ids) - 1, 0))
+        if not len(snapshot.product_ids):
+            return np.full(len(product_ids), -1, dtype="int32")
+        found = snapshot.product_ids[positions] == product_ids
+        return np.where(found, snapshot.stock[positions], -1).astype("int32")
+
+    def availability(self, session, product_id):
+        """
+        Returns the product's stock and shipping label, never waiting on the warehouse after the first load.
+
+        Args:
+            session: Snowflake session used for the first load and background refreshes.
+            product_id (str): The product.
+
+        Returns:
+            tuple: ``(stock_quantity, shipping_status)``; ``(None, None)`` for an unknown product, or
+            while the snapshot could not be loaded, so the caller uses the stock its own query returned.
+        """
+        if not self.ensure_fresh(session):
+            return None, None
+        stock = self.stock(product_id)
+        return (None, None) if stock is None else (stock, shipping_status(stock))
+
+
+# Process-wide instance shared by every Streamlit session.
+inventory_snapshot = InventorySnapshot()
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Bulk load, incremental refresh and lookups on a million generated products, versus
+    # the same data held as a dict of Python ints.
+    count = 1_000_000
+    rng = np.random.default_rng(7)
+    ids = np.char.add("PROD-", np.char.zfill(np.arange(count).astype(str), 7)).tolist()
+    base = int(pa.scalar(np.datetime64("2025-04-01T00:00:00", "us")).value)
+    table = pa.table({"PRODUCT_ID": ids, "STOCK_QUANTITY": rng.integers(0, 200, count).astype("int32"),
+                      "LAST_UPDATED": pa.array(base + rng.integers(0, 10 ** 9, count), type=pa.timestamp("us"))})
+    inventory = InventorySnapshot()
+    started = time.perf_counter()
+    inventory.load(table)
+    print(f"bulk load of {count:,} products: {time.perf_counter() - started:.2f}s")
+    snapshot = inventory._snapshot
+    array_bytes = snapshot.product_ids.nbytes + snapshot.stock.nbytes + snapshot.updated.nbytes
+    as_dict = dict(zip(ids, table["STOCK_QUANTITY"].to_pylist()))
+    dict_bytes = sys.getsizeof(as_dict) + sum(sys.getsizeof(key) for key in as_dict)
+    print(f"arrays {array_bytes / 2 ** 20:.1f} MB vs dict of str -> int {dict_bytes / 2 ** 20:.1f} MB")
+
+    # 1,000 changed stock levels and 100 new products
+    changed = rng.choice(count, 1000, replace=False)
+    changed_ids = [ids[i] for i in changed]
+    new_ids = [f"PROD-{count + i}" for i in range(100)]
+    updates = pa.table({"PRODUCT_ID": changed_ids + new_ids,
+                        "STOCK_QUANTITY": np.zeros(1100, dtype="int32"),
+                        "LAST_UPDATED": pa.array(np.full(1100, base + 2 * 10 ** 9), type=pa.timestamp("us"))})
+    before = inventory._snapshot
+    started = time.perf_counter()
+    inventory.apply(updates)
+    print(f"incremental refresh of 1,100 rows: {(time.perf_counter() - started) * 1000:.1f} ms")
+    assert before.stock[changed].any() and not inventory.stock_many(changed_ids).any()  # Old snapshot untouched
+    assert inventory.stock(new_ids[0]) == 0 and len(inventory._snapshot.product_ids) == count + 100
+
+    lookups = 100_000
+    probe = [ids[i] for i in rng.integers(0, count, lookups)]
+    started = time.perf_counter()
+    for product_id in probe:
+        inventory.stock(product_id)
+    print(f"{lookups:,} lookups: {(time.perf_counter() - started) / lookups * 1e6:.2f} us each")
+    started = time.perf_counter()
+    inventory.stock_many(probe)
+    print(f"{lookups:,} lookups at once: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    # Against the local fake session: a stock change shows up after one incremental refresh.
+    from local_session import LocalSession
+
+    session = LocalSession()
+    inventory = InventorySnapshot()
+    inventory.ensure_fresh(session)
+    session._conn.execute("UPDATE PRODUCTS SET STOCK_QUANTITY = 3, LAST_UPDATED = '2025-04-09 00:00:00' "
+                          "WHERE PRODUCT_ID = 'PROD-0002'")
+    queries = session.query_count
+    inventory.refresh(session)
+    assert inventory.availability(session, "PROD-0002") == (3, "Low quantity available")
+    assert session.query_count == queries + 1
+    print(f"local session: PROD-0002 -> {inventory.availability(session, 'PROD-0002')}, "
+          f"age {inventory.age_seconds():.3f}s")
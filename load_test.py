@@ -0,0 +1,332 @@
+"""
+Multi-session load test for wismo_app.py and call_transcript.py.
+
+Many simulated agent sessions, each one Streamlit ``AppTest`` with its own session state,
+rerun the pages concurrently on a bounded thread pool. They all share one local fake
+session (see local_session.py) with injected per-query latency, as sessions share a
+warehouse connection in production. Each order-page session looks up a different order,
+drawn per rerun from the seeded data, and each sentiment session opens a different
+customer, so the warehouse and result caches see a realistic spread of keys. The report
+covers:
+
+* throughput and rerun latency percentiles per page;
+* thread-pool saturation: how long reruns queued for a worker, and worker utilization;
+* stale-serve counts and circuit-breaker state of the shared order-page result cache;
+* memory: RSS growth per live session, the size of what each session pins in
+  ``st.session_state``, RSS still held after the sessions are released, and matplotlib
+  figures left open.
+
+The JSON report (``--output``) records the git revision, so runs can be compared across
+versions.
+
+Usage:
+    python load_test.py --sessions 100 --workers 16 --latency 0.05 --output load_report.json
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pandas as pd
+import pyarrow as pa
+
+# One kind of agent session: the page it opens, the query listing what it may look up,
+# and where the looked-up value goes: the search box (changed on every rerun) or the
+# ``customer_id`` URL parameter (fixed for the session).
+SessionProfile = namedtuple("SessionProfile", ["name", "script", "lookups_query", "field"])
+
+PROFILES = [
+    SessionProfile("shipped order", "wismo_app.py",
+                   "SELECT ORDER_ID FROM Orders WHERE ORDER_STATUS = 'Shipped'", "search_value"),
+    SessionProfile("backordered order", "wismo_app.py",
+                   "SELECT ORDER_ID FROM Orders WHERE ORDER_STATUS = 'Backordered'", "search_value"),
+    SessionProfile("delivered order", "wismo_app.py",
+                   "SELECT ORDER_ID FROM Orders WHERE ORDER_STATUS = 'Delivered'", "search_value"),
+    SessionProfile("account sentiment", "call_transcript.py",
+                   "SELECT DISTINCT SPEAKER_ID FROM CALL_TRANSCRIPTS WHERE IS_CUSTOMER = 'TRUE'", "customer_id"),
+]
+
+RerunSample = namedtuple("RerunSample", ["profile", "queued", "latency", "ok"])
+
+
+###############################################################################
+# 1. Measurements
+###############################################################################
+def rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def deep_size(value, _seen=None):
+    """Approximate bytes held by a session-state value, counting DataFrames and Arrow data."""
+    _seen = set() if _seen is None else _seen
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else int(value.memory_usage(deep=True))
+    if isinstance(value, (pa.Table, pa.RecordBatch, pa.Array)):
+        return value.nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k, _seen) + deep_size(v, _seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, _seen) for item in value)
+    return size
+
+
+def session_state_bytes(app):
+    """Bytes pinned by one AppTest session's state, per key."""
+    return {str(key): deep_size(value) for key, value in app.session_state.filtered_state.items()}
+
+
+def open_figures():
+    import matplotlib.pyplot as plt
+
+    return len(plt.get_fignums())
+
+
+class _Sampler:
+    """Samples RSS and open matplotlib figures on a background thread while the load runs."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_figures = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="load-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+            self.peak_figures = max(self.peak_figures, open_figures())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentiles(values, points=(50, 95, 99)):
+    if not values:
+        return {f"p{point}": None for point in points} | {"max": None}
+    series = pd.Series(values)
+    return {f"p{point}": round(float(series.quantile(point / 100)) * 1000, 1) for point in points} | {
+        "max": round(float(series.max()) * 1000, 1)}
+
+
+###############################################################################
+# 2. Load generation
+###############################################################################
+def _shared_runtime():
+    """
+    Installs one mock Streamlit runtime for all concurrent AppTest runs.
+
+    ``AppTest.run`` installs a fresh mock runtime and clears it again when it finishes,
+    which breaks any other run still in flight. The returned patch points AppTest at a
+    subclass, so its per-run install and clear land on the subclass, while the real
+    ``Runtime`` keeps the shared instance.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    class _PerRunRuntime(Runtime):
+        _instance = None
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    return mock.patch("streamlit.testing.v1.app_test.Runtime", _PerRunRuntime)
+
+
+def _new_app(profile, value):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(profile.script, default_timeout=120)
+    if profile.field == "customer_id":
+        app.query_params["customer_id"] = value
+    else:
+        app.session_state[profile.field] = value
+    return app
+
+
+def run_load(sessions, reruns, workers, latency, profiles=PROFILES, orders=2000, seed=7):
+    """
+    Drives ``sessions`` concurrent page sessions through ``reruns`` reruns each.
+
+    Args:
+        sessions (int): Number of simulated agent sessions, kept alive until the end.
+        reruns (int): Reruns per session, including the first run.
+        workers (int): Thread-pool size shared by all sessions.
+        latency (float): Seconds of injected latency per warehouse query.
+        profiles (list): ``SessionProfile`` mix, assigned round-robin.
+        orders (int): Orders in the seeded data the sessions draw from.
+        seed (int): Seed for the data and for the lookups each session draws.
+
+    Returns:
+        dict: The report.
+    """
+    import streamlit as st
+
+    from local_session import LocalSession
+    from warehouse_resilience import order_cache
+
+    session = LocalSession(latency=latency, orders=orders, seed=seed)
+    rng = random.Random(seed)
+    lookups = {profile.name: sorted(row[0] for row in session._execute(profile.lookups_query)[1])
+               for profile in profiles}
+
+    class _Connection:
+        def session(self):
+            return session
+
+    samples, samples_lock = [], threading.Lock()
+    busy = {"now": 0, "peak": 0, "seconds": 0.0}
+
+    def rerun(app, profile, value, submitted):
+        started = time.perf_counter()
+        with samples_lock:
+            busy["now"] += 1
+            busy["peak"] = max(busy["peak"], busy["now"])
+        try:
+            if profile.field == "search_value":
+                app.session_state["search_value"] = value
+            app.run()
+            # The pages catch their own failures and render st.error instead of raising
+            ok = not app.exception and not app.error
+        except Exception:
+            ok = False
+        finished = time.perf_counter()
+        with samples_lock:
+            busy["now"] -= 1
+            busy["seconds"] += finished - started
+            samples.append(RerunSample(profile.name, started - submitted, finished - started, ok))
+
+    with mock.patch.object(st, "connection", lambda *args, **kwargs: _Connection()), _shared_runtime():
+        # Warm process-wide caches and imports so they are not charged to the sessions.
+        for profile in profiles:
+            warm = _new_app(profile, lookups[profile.name][0])
+            warm.run()
+        del warm
+        gc.collect()
+        baseline_rss, baseline_figures, baseline_queries = rss_bytes(), open_figures(), session.query_count
+
+        # Order-page sessions look up another order on every rerun; sentiment sessions keep their customer
+        session_profiles = [profiles[i % len(profiles)] for i in range(sessions)]
+        first = [rng.choice(lookups[profile.name]) for profile in session_profiles]
+        plan = [first] + [[rng.choice(lookups[profile.name]) if profile.field == "search_value" else value
+                           for profile, value in zip(session_profiles, first)] for _ in range(reruns - 1)]
+        apps = [(_new_app(profile, value), profile) for profile, value in zip(session_profiles, first)]
+        distinct = len({(profile.name, value) for values in plan for profile, value in zip(session_profiles, values)})
+
+        started = time.perf_counter()
+        with _Sampler() as sampler, ThreadPoolExecutor(workers, thread_name_prefix="load") as pool:
+            for values in plan:
+                submitted = time.perf_counter()
+                futures = [pool.submit(rerun, app, profile, value, submitted)
+                           for (app, profile), value in zip(apps, values)]
+                for future in futures:
+                    future.result()
+        wall = time.perf_counter() - started
+
+        gc.collect()
+        live_rss = rss_bytes()
+        state_bytes = {}
+        for app, profile in apps:
+            state_bytes.setdefault(profile.name, []).append(sum(session_state_bytes(app).values()))
+        figures = open_figures()
+        del apps, app
+        gc.collect()
+        released_rss = rss_bytes()
+
+    report = {
+        "config": {"sessions": sessions, "reruns": reruns, "workers": workers, "latency": latency,
+                   "orders": orders, "seed": seed, "profiles": [profile.name for profile in profiles]},
+        "distinct_lookups": distinct,
+        "throughput_reruns_per_second": round(len(samples) / wall, 2),
+        "wall_seconds": round(wall, 2),
+        "failed_reruns": sum(not sample.ok for sample in samples),
+        "warehouse_queries": session.query_count - baseline_queries,
+        "latency_ms": percentiles([sample.latency for sample in samples]),
+        "pages": {},
+        "warehouse_resilience": order_cache.metrics(),
+        "thread_pool": {
+            "queue_wait_ms": percentiles([sample.queued for sample in samples]),
+            "peak_busy_workers": busy["peak"],
+            "utilization": round(busy["seconds"] / (workers * wall), 3),
+        },
+        "memory": {
+            "baseline_rss_mb": round(baseline_rss / 2 ** 20, 1),
+            "rss_growth_per_session_kb": round((live_rss - baseline_rss) / sessions / 1024, 1),
+            "rss_retained_after_release_mb": round((released_rss - baseline_rss) / 2 ** 20, 1),
+            "session_state_kb": {name: round(sum(sizes) / len(sizes) / 1024, 1) for name, sizes in state_bytes.items()},
+            "peak_rss_mb": round(sampler.peak_rss / 2 ** 20, 1),
+            # Streamlit closes every pyplot figure when any script run ends, so figures only
+            # pile up while runs overlap; the peak shows how many were alive at once.
+            "peak_open_matplotlib_figures": sampler.peak_figures,
+            "open_matplotlib_figures_after": figures - baseline_figures,
+        },
+    }
+    for profile in profiles:
+        page_samples = [sample for sample in samples if sample.profile == profile.name]
+        report["pages"][profile.name] = {"reruns": len(page_samples),
+                                         "failed": sum(not sample.ok for sample in page_samples),
+                                         "latency_ms": percentiles([sample.latency for sample in page_samples])}
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Concurrent session load test for the Streamlit pages.")
+    parser.add_argument("--sessions", type=int, default=40, help="Simulated agent sessions.")
+    parser.add_argument("--reruns", type=int, default=3, help="Reruns per session.")
+    parser.add_argument("--workers", type=int, default=8, help="Thread-pool size.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Injected seconds per warehouse query.")
+    parser.add_argument("--orders", type=int, default=2000, help="Orders in the seeded data.")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the data and each session's lookups.")
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    args = parser.parse_args(argv)
+
+    # Measure warehouse-backed reruns; the optional local replica stays off.
+    os.environ.pop("WISMO_REPLICA_PATH", None)
+    report = {"revision": git_revision(), **run_load(args.sessions, args.reruns, args.workers, args.latency,
+                                                             orders=args.orders, seed=args.seed)}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    return 1 if report["failed_reruns"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,313 @@
+"""
+Local stand-in for the Snowpark session used by wismo_app.py and call_transcript.py.
+
+The fake session executes the apps' SQL against an in-memory SQLite database seeded
+with deterministic demo data (orders, shipments, tracking scans, products,
+substitutions and call transcripts), so tools can exercise the pages without a
+warehouse. Latency can be injected per query to emulate a slow or queued warehouse, and a
+fault to emulate a failing one.
+"""
+import datetime
+import functools
+import random
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+import pyarrow as pa
+
+
+###############################################################################
+# 1. SQLite type handling
+###############################################################################
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter("DATE", lambda raw: datetime.datetime.fromisoformat(raw.decode()))
+
+SCHEMA = """
+CREATE TABLE Customers (
+    CUSTOMER_ID TEXT PRIMARY KEY,
+    CUSTOMER_NAME TEXT
+);
+CREATE TABLE Orders (
+    ORDER_ID TEXT PRIMARY KEY,
+    CUSTOMER_ID TEXT,
+    ORDER_STATUS TEXT,
+    ORDER_DATE TIMESTAMP,
+    EXPECTED_DELIVERY_DATE TIMESTAMP,
+    ACTUAL_DELIVERY_DATE TIMESTAMP,
+    LAST_UPDATED TIMESTAMP
+);
+CREATE TABLE Shipments (
+    SHIPMENT_ID TEXT PRIMARY KEY,
+    ORDER_ID TEXT,
+    SHIPMENT_STATUS TEXT,
+    TRACKING_NUMBER TEXT,
+    LAST_UPDATED TIMESTAMP
+);
+CREATE TABLE Tracking (
+    SHIPMENT_ID TEXT,
+    TRACKING_NUMBER TEXT,
+    STATUS_UPDATE TEXT,
+    LOCATION TEXT,
+    TIMESTAMP TIMESTAMP
+);
+CREATE TABLE ORDER_LINE_ITEMS (
+    ORDER_ID TEXT,
+    PRODUCT_ID TEXT
+);
+CREATE TABLE PRODUCTS (
+    PRODUCT_ID TEXT PRIMARY KEY,
+    PRODUCT_NAME TEXT,
+    PRODUCT_DESCRIPTION TEXT,
+    PRICE REAL,
+    STOCK_QUANTITY INTEGER,
+    LAST_UPDATED TIMESTAMP
+);
+CREATE TABLE PRODUCT_SUBSTITUTIONS (
+    ORIGINAL_PRODUCT_ID TEXT,
+    SUBSTITUTE_PRODUCT_ID TEXT,
+    SUBSTITUTION_PRIORITY INTEGER
+);
+CREATE TABLE CALL_TRANSCRIPTS (
+    CONVERSATION_ID TEXT,
+    CALL_DATE TIMESTAMP,
+    SPEAKER_ID TEXT,
+    IS_CUSTOMER TEXT,
+    LINE_NUMBER INTEGER,
+    sentiment_bucket TEXT
+);
+CREATE INDEX tracking_shipment_ts ON Tracking (SHIPMENT_ID, TIMESTAMP);
+CREATE INDEX tracking_ts ON Tracking (TIMESTAMP);
+CREATE INDEX shipments_order ON Shipments (ORDER_ID);
+CREATE INDEX line_items_order ON ORDER_LINE_ITEMS (ORDER_ID);
+CREATE INDEX products_last_updated ON PRODUCTS (LAST_UPDATED);
+CREATE INDEX orders_last_updated ON Orders (LAST_UPDATED);
+CREATE INDEX shipments_last_updated ON Shipments (LAST_UPDATED);
+CREATE INDEX substitutions_original ON PRODUCT_SUBSTITUTIONS (ORIGINAL_PRODUCT_ID);
+CREATE INDEX transcripts_conversation ON CALL_TRANSCRIPTS (CONVERSATION_ID);
+"""
+
+TRACKING_STATUSES = [
+    "Label Created",
+    "Shipment Information Received",
+    "Picked Up",
+    "Departed from Origin Facility",
+    "In Transit",
+    "Arrived at Carrier Facility",
+    "Out for Delivery",
+    "Delivered",
+]
+
+DEMO_CITIES = [
+    "Boston, MA", "Los Angeles, CA", "Chicago, IL", "Denver, CO", "Memphis, TN",
+    "San Francisco, CA", "Houston, TX", "Atlanta, GA", "New York, NY", "Charlotte, NC",
+]
+
+SENTIMENT_BUCKETS = ["Very Negative", "Slightly Negative", "Neutral", "Positive", "Very Positive"]
+
+# The customers the pages pick default orders for (see wismo_app.py).
+DEMO_DEFAULT_ORDERS = {
+    "CUST-0001": ("ORD-0052", "Shipped"),
+    "CUST-0002": ("ORD-0013", "Backordered"),
+    "CUST-0003": ("ORD-0026", "Delivered"),
+}
+
+
+###############################################################################
+# 2. Demo data
+###############################################################################
+def seed_demo_data(conn, orders=60, products=20, customers=10, conversations_per_customer=4, seed=7):
+    """
+    Populates an empty SQLite database with deterministic demo data.
+
+    Args:
+        conn (sqlite3.Connection): Connection to seed.
+        orders (int): Number of orders to generate (at least 60 keeps the demo order IDs valid).
+        products (int): Number of catalogue products.
+        customers (int): Number of customers.
+        conversations_per_customer (int): Number of recorded calls per customer.
+        seed (int): Random seed, so every run produces the same rows.
+    """
+    rng = random.Random(seed)
+    now = datetime.datetime(2025, 4, 8, 12, 0, 0)
+    conn.executescript(SCHEMA)
+
+    customer_rows = [(f"CUST-{c:04d}", f"Customer {c:04d}") for c in range(1, customers + 1)]
+    conn.executemany("INSERT INTO Customers VALUES (?, ?)", customer_rows)
+
+    product_rows = []
+    for p in range(1, products + 1):
+        stock = 0 if p % 4 == 1 else rng.randint(1, 120)
+        product_rows.append((f"PROD-{p:04d}", f"Product {p:04d}", f"Demo description for product {p}",
+                             round(rng.uniform(5, 150), 2), stock, now - datetime.timedelta(hours=p % 72 + 1)))  # No rng draw; keeps later rows stable
+    conn.executemany("INSERT INTO PRODUCTS VALUES (?, ?, ?, ?, ?, ?)", product_rows)
+
+    substitution_rows = []
+    for p in range(1, products + 1):
+        candidates = [q for q in range(1, products + 1) if q != p]
+        for priority, q in enumerate(rng.sample(candidates, 3), start=1):
+            substitution_rows.append((f"PROD-{p:04d}", f"PROD-{q:04d}", priority))
+    conn.executemany("INSERT INTO PRODUCT_SUBSTITUTIONS VALUES (?, ?, ?)", substitution_rows)
+
+    defaults = {order_id: (customer, status) for customer, (order_id, status) in DEMO_DEFAULT_ORDERS.items()}
+    order_rows, shipment_rows, tracking_rows, line_rows = [], [], [], []
+    for o in range(1, orders + 1):
+        order_id = f"ORD-{o:04d}"
+        customer_id, status = defaults.get(order_id, (rng.choice(customer_rows)[0], None))
+        if status is None:
+            status = rng.choice(["Shipped", "Shipped", "Delivered", "Backordered"])
+        order_date = now - datetime.timedelta(days=rng.randint(1, 20), hours=rng.randint(0, 23))
+        expected = order_date + datetime.timedelta(days=7)
+        actual = expected if status == "Delivered" else None
+        order_rows.append([order_id, customer_id, status, order_date, expected, actual, order_date])
+        line_rows.append((order_id, f"PROD-{rng.randint(1, products):04d}"))
+        if status == "Backordered":
+            continue
+
+        shipment_id = f"SHP-{o:04d}"
+        tracking_number = f"1Z{o:06d}{rng.randint(1000, 9999)}"
+        last_rank = len(TRACKING_STATUSES) - 1 if status == "Delivered" else rng.randint(1, 6)
+        scan_time = order_date + datetime.timedelta(hours=2)
+        for rank in range(last_rank + 1):
+            tracking_rows.append((shipment_id, tracking_number, TRACKING_STATUSES[rank],
+                                  rng.choice(DEMO_CITIES), scan_time))
+            scan_time += datetime.timedelta(hours=rng.randint(3, 20))
+        # Each scan updates the shipment's status, and the order's when it is delivered
+        last_scan = tracking_rows[-1][-1]
+        shipment_rows.append((shipment_id, order_id, TRACKING_STATUSES[last_rank], tracking_number, last_scan))
+        order_rows[-1][-1] = last_scan
+    conn.executemany("INSERT INTO Orders VALUES (?, ?, ?, ?, ?, ?, ?)", order_rows)
+    conn.executemany("INSERT INTO Shipments VALUES (?, ?, ?, ?, ?)", shipment_rows)
+    conn.executemany("INSERT INTO Tracking VALUES (?, ?, ?, ?, ?)", tracking_rows)
+    conn.executemany("INSERT INTO ORDER_LINE_ITEMS VALUES (?, ?)", line_rows)
+
+    transcript_rows = []
+    conversation = 0
+    for customer_id, _ in customer_rows:
+        for _ in range(conversations_per_customer):
+            conversation += 1
+            call_date = now - datetime.timedelta(days=rng.randint(0, 60))
+            for line in range(rng.randint(8, 24)):
+                is_customer = line % 2 == 0
+                transcript_rows.append((
+                    f"CONV-{conversation:05d}",
+                    call_date,
+                    customer_id if is_customer else "AGENT-01",
+                    "TRUE" if is_customer else "FALSE",
+                    line,
+                    rng.choice(SENTIMENT_BUCKETS),
+                ))
+    conn.executemany("INSERT INTO CALL_TRANSCRIPTS VALUES (?, ?, ?, ?, ?, ?)", transcript_rows)
+    conn.commit()
+
+
+###############################################################################
+# 3. Session and DataFrame stand-ins
+###############################################################################
+@functools.lru_cache(maxsize=256)
+def row_type(columns):
+    """Returns a cached namedtuple type standing in for Snowpark's ``Row``."""
+    return namedtuple("Row", columns, rename=True)
+
+
+class LocalDataFrame:
+    """Lazy result handle mirroring the parts of ``snowflake.snowpark.DataFrame`` the apps use."""
+
+    def __init__(self, session, query):
+        self._session = session
+        self.query = query
+
+    def collect(self):
+        columns, rows = self._session._execute(self.query)
+        make_row = row_type(tuple(columns))
+        return [make_row(*row) for row in rows]
+
+    def to_pandas(self):
+        columns, rows = self._session._execute(self.query)
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def rows_to_arrow(columns, rows):
+    """Builds an Arrow table from DB-API rows."""
+    return pa.table({column: [row[i] for row in rows] for i, column in enumerate(columns)})
+
+
+class LocalCursor:
+    """Connector-style cursor supporting the Arrow fetch calls used by warehouse_fetch.py."""
+
+    def __init__(self, session):
+        self._session = session
+        self._columns = []
+        self._rows = []
+
+    def execute(self, query):
+        self._columns, self._rows = self._session._execute(query)
+        return self
+
+    def fetchall(self):
+        return self._rows
+
+    def fetch_arrow_all(self, force_return_table=False):
+        if not self._rows and not force_return_table:
+            return None
+        return rows_to_arrow(self._columns, self._rows)
+
+    def fetch_arrow_batches(self, batch_size=10_000):
+        for start in range(0, len(self._rows), batch_size):
+            yield rows_to_arrow(self._columns, self._rows[start:start + batch_size])
+
+    def close(self):
+        pass
+
+
+class LocalConnection:
+    def __init__(self, session):
+        self._session = session
+
+    def cursor(self):
+        return LocalCursor(self._session)
+
+
+class LocalSession:
+    """
+    A thread-safe, Snowpark-like session backed by a seeded SQLite database.
+
+    Args:
+        latency (float): Seconds every query waits before returning, emulating warehouse round trips.
+        fault (Exception): Raised by every query (after the latency) while set, emulating a failing warehouse.
+        **seed_options: Forwarded to ``seed_demo_data``.
+    """
+
+    def __init__(self, latency=0.0, fault=None, **seed_options):
+        self.latency = latency
+        self.fault = fault
+        self.query_count = 0
+        self.connection = LocalConnection(self)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        seed_demo_data(self._conn, **seed_options)
+
+    def sql(self, query):
+        return LocalDataFrame(self, query)
+
+    def _execute(self, query):
+        with self._lock:
+            self.query_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fault is not None:
+            raise self.fault
+        with self._lock:
+            cursor = self._conn.execute(query)
+            # Snowflake folds unquoted identifiers to upper case.
+            columns = [description[0].upper() for description in cursor.description]
+            rows = cursor.fetchall()
+        return columns, rows
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,701 @@
+"""
+Precompiled HTML templates for the order page and the Account Sentiment page.
+
+Rows and cards, which are filled many times per render, are f-strings in small functions,
+so a first render costs what the page's inline f-strings did; section wrappers are
+constant ``str.format`` strings. Fully static blocks, such as fonts, CSS, buttons,
+the sentiment legend and the status descriptions, are built once and memoized. Each
+dynamic section (the tracking timeline, the backorder summary, the substitution cards) is
+rendered into one HTML payload, so a rerun sends one markdown message per section instead
+of one per row, card or field. Section renderers are memoized on their inputs, so a rerun
+of an unchanged order reuses the previous payload.
+
+Values that come from the warehouse are HTML-escaped before substitution, with NULLs shown
+as empty text.
+"""
+import functools
+import html
+
+from result_schemas import STATUS_ORDER
+
+FONTS_HTML = """
+<link rel="preconnect" href="https://fonts.googleapis.com">
+<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
+<link href="https://fonts.googleapis.com/css2?family=Poppins:wght@400;500;600;700&display=swap" rel="stylesheet">
+"""
+
+
+###############################################################################
+# 1. Order page
+###############################################################################
+ORDER_PAGE_CSS = """
+/* Center the overall container */
+.main {
+    max-width: 1000px;
+    margin: 0 auto;
+}
+/* Basic styling for bullet statuses */
+.status-dot {
+    display: inline-block;
+    width: 10px;
+    height: 10px;
+    border-radius: 50%;
+    margin-right: 0.5rem;
+    margin-top: 0.3rem;
+}
+/* Colors for statuses */
+.status-dot.blue { background-color: #3781ad; }
+.status-dot.black { background-color: #2c3143; }
+.status-dot.gray { background-color: #b0ccca; }
+/* Text colors */
+body {
+    color: #2c3143;
+    font-family: 'Poppins', sans-serif !important; /* Apply Poppins to the entire body and use !important to increase specificity */
+}
+/* Header colors */
+h3 {
+    color: #3781ad;
+    font-family: 'Poppins', sans-serif !important; /* Ensure headers also use Poppins */
+}
+/* Map styling (example) */
+.stMap {
+    border-radius: 10px;
+}
+/* Style the search bar */
+.stTextInput>div>div>input {
+font-family: 'Poppins', sans-serif !important;
+border: 1px solid #ccc;
+border-radius: 8px;
+padding: 8px 10px;
+color: #2c3143;
+}
+/* Style the search bar label */
+.stTextInput label {
+    font-family: 'Poppins', sans-serif !important;
+    font-size: 0.9em; /* Matches the status description size */
+    color: gray;       /* Matches the status description color */
+}
+/* Style the search bar input text */
+.stTextInput>div>div>input {
+    font-family: 'Poppins', sans-serif !important;
+    font-size: 0.9em; /* Match the status description size */
+    color: #2c3143;
+    border: 1px solid #ccc;
+    border-radius: 5px;
+    padding: 8px 10px;
+}
+/* Style for Order Status, Order Date, Tracking # labels */
+.order-info-label {
+    font-family: 'Poppins', sans-serif !important;
+    font-size: 0.75em !important;
+    color: #737373 !important;
+    margin-bottom: 0 !important; /* Remove bottom margin */
+    margin-top: 0 !important;    /* Remove top margin as well */
+}
+
+/* Style for the values (Backordered, Date, Tracking Number) */
+.order-info-value {
+    font-family: 'Poppins', sans-serif !important;
+    font-size: 0.75em !important;
+    color: #737373 !important;
+    font-weight: normal;
+    margin-bottom: 0 !important; /* Remove bottom margin */
+    margin-top: 0 !important;    /* Remove top margin */
+}
+
+/* Style for the container div */
+.order-info-container {
+    margin-bottom: -4px !important; /* Reduce space below the whole div */
+    margin-top: -4px !important;    /* Reduce space above the whole div */
+    padding-top: -4px !important;   /* Reduce space inside div */
+    padding-bottom: -4px !important; /* Reduce space inside div */
+}
+
+ /* Style the outer container for product substitutions */
+.substitution-item {
+    border: 1px solid #ccc;
+    border-radius: 15px;
+    padding: 10px;
+    margin-bottom: 10px;
+    display: flex;
+    flex-direction: column;
+    /* Removed flex: 1; */
+    /* Optionally add min-height if you want a base height */
+    min-height: 380px;
+}
+/* Style the blue boxes in product substitutions with the desired gradient */
+.blue-box {
+    display: flex;
+    flex-direction: column;
+    justify-content: space-between;
+    font-family: 'Poppins', sans-serif !important;
+    min-height: 120px;
+    margin: -10px;
+    padding: 10px;
+    border-radius: 10px 10px 0 0;
+    margin-bottom: 15px;
+    /* Gradient Background from left to right */
+    background-image: linear-gradient(to right, #3781ad, #53a69a);
+    /* Optional: Add a subtle box-shadow for depth */
+    box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
+}
+
+
+
+/* Style the white boxes in product substitutions */
+.white-box {
+    display: flex;
+    flex-direction: column;
+    justify-content: space-between; /* Push the button to the bottom */
+    flex-grow: 1; /* Make it grow to fill available space */
+    font-family: 'Poppins', sans-serif !important;
+    min-height: 200px; /* Adjusted min-height */
+    padding: 0 10px; /* Keep the padding for internal content */
+}
+
+.white-box > div:first-child {
+margin-top: 15px; /* Adjust this value to control the spacing */
+}
+
+/* Decrease line spacing within blue boxes */
+.blue-box b,
+.blue-box p {
+    margin-bottom: 5px; /* Adjust as needed */
+    line-height: 1.2; /* Adjust as needed */
+}
+
+/* Decrease line spacing within white boxes */
+.white-box div,
+.white-box p {
+    margin-bottom: 5px; /* Adjust as needed */
+    line-height: 1.2; /* Adjust as needed */
+}
+
+/* Ensure the outer container takes up full height */
+.st-emotion-cache-16txtl3 { /* Adjust if needed */
+    display: flex;
+    flex-direction: column;
+    height: 100%;
+}
+
+/* Apply Poppins to markdown elements */
+div, p, span, a {
+    font-family: 'Poppins', sans-serif !important;
+}
+/* Style the order buttons */
+button {
+    font-family: 'Poppins', sans-serif !important;
+    font-size: 11px; /* Keep the font size small */
+    font-weight: 600;
+    border: none;
+    background-color: #2c3143;
+    color: white;
+    border-radius: 20px;
+    cursor: pointer;
+    padding: 10px 18px; /* Increase padding to make the button bigger */
+}
+"""
+
+STATUS_DESCRIPTIONS = {
+    "Label Created": "A shipping label has been created for the order.",
+    "Shipment Information Received": "The carrier has received shipment information.",
+    "Picked Up": "The package has been picked up by the carrier.",
+    "Departed from Origin Facility": "The package has left the origin facility.",
+    "In Transit": "The package is in transit to its destination.",
+    "Arrived at Carrier Facility": "The package has arrived at a carrier facility.",
+    "Out for Delivery": "The package is out for delivery.",
+    "Delivered": "The package has been delivered.",
+}
+
+TRACKING_BUTTONS_HTML = """
+<div style="display: grid; grid-template-columns: 1fr 1fr 1fr; gap: 10px;">
+    <button style="background-color: #2c3143; color: white; font-size: 14px; font-weight: 600; border: none; padding: 6px 12px; border-radius: 20px; cursor: pointer; width: 100%; box-sizing: border-box;">Invoice</button>
+    <button style="background-color: #2c3143; color: white; font-size: 14px; font-weight: 600; border: none; padding: 6px 12px; border-radius: 20px; cursor: pointer; width: 100%; box-sizing: border-box;">Contact</button>
+    <button style="background-color: #2c3143; color: white; font-size: 14px; font-weight: 600; border: none; padding: 6px 11px; border-radius: 20px; cursor: pointer; width: 100%; box-sizing: border-box;">Report</button>
+</div>
+"""
+
+TRACKING_HEADER = (
+    "<span style='font-size: 1.5em; color: #2c3143; font-weight: bold;'>Tracking # {tracking_number}</span>"
+)
+
+# The spacer lines the first status up with the map, replacing three separate spacer elements.
+TIMELINE_SPACER_HTML = '<div style="height: 5.2em;"></div>'
+
+def _timeline_row(dot_color, connector, text_color, status, display_text):
+    return f"""
+<div style="position: relative; display: flex; align-items: flex-start; margin-bottom: 10px;">
+    <div style="width: 10px; height: 10px; border-radius: 50%; background-color: {dot_color}; margin-right: 15px; margin-top: 5px; position: relative; z-index: 1;"></div>
+    {connector}
+    <div>
+        <div style="font-weight: bold; color: {text_color};">{status}</div>
+        <div style="font-size: 0.9em; color: gray;">{display_text}</div>
+    </div>
+</div>"""
+
+
+def _timeline_connector(line_color):
+    return (f'<div style="position: absolute; top: 10px; left: 4px; width: 2px; height: calc(100% + 5px); '
+            f'background-color: {line_color}; z-index: 0;"></div>')
+
+
+BACKORDER_SUMMARY = """
+<div style="display: grid; grid-template-columns: 0.8fr 1.5fr 1.5fr 1.3fr; gap: 1rem; align-items: start;">
+    <div style="background-color: #ef6658; color: white; padding: 8px 14px; border-radius: 4px; width: fit-content; text-align: center; font-size: 0.95em; font-family: 'Poppins', sans-serif; font-weight: 600;">
+        Out of Stock
+    </div>
+    <div>
+        <div style='text-align: left; font-size: 0.8em; color: #737373; font-weight: bold;'>{name}</div>
+        <div style='text-align: left; font-size: 0.75em; color: #737373;'>{subtitle}</div>
+        <div style='text-align: left; font-size: 0.75em; color: #737373; font-weight: bold;'>{price} / <span style='color: #ef6658;'>0 in Stock</span></div>
+    </div>
+    <div>
+        <div class='order-info-container' style='text-align: left;'> <span class='order-info-label' style='font-weight: 600;'>Order Status:</span> <span class='order-info-value'>Backordered</span></div>
+        <div class='order-info-container' style='text-align: left;'> <span class='order-info-label' style='font-weight: 600;'>Order Date:</span> <span class='order-info-value'>{order_date}</span></div>
+        <div class='order-info-container' style='text-align: left;'> <span class='order-info-label' style='font-weight: 600;'>Tracking #:</span> <span class='order-info-value'>{tracking_number}</span></div>
+    </div>
+    <div style='text-align: left;'>
+        <p style='font-size: 0.75em; font-style: italic; color: #737373; margin-bottom: 0;'>Original Est. Delivery</p>
+        <p style='font-weight: bold; font-size: 1.0em; color: #ef6658; margin-top: 0;'>{expected_delivery}</p>
+    </div>
+</div>
+<hr>
+"""
+
+SUBSTITUTIONS_HEADING_HTML = """
+<h6 style="font-size: 1.1em; color: #737373; text-decoration: underline; margin-top: -10px; margin-bottom: 10px;">Product Substitutions</h6>
+"""
+
+SUBSTITUTION_GRID = """
+<div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 1rem;">{cards}
+</div>
+"""
+
+def _substitution_card(name, description, price, stock_quantity, choice, cost_change_color, cost_change_text,
+                       shipping_status_color, shipping_status, review_count, stars, delivery_date):
+    return f"""
+<div class="substitution-item" style="border: 1px solid #ccc; border-radius: 15px; padding: 10px; margin-bottom: 10px; display: flex; flex-direction: column; height: 100%;">
+    <div class="blue-box" style="background-color: #53a69a; color: white; padding: 8px; border-radius: 10px; text-align: left; margin-bottom: 6px; flex-grow: 1; display: flex; flex-direction: column; justify-content: space-between;">
+        <div>
+            <b style="font-size: .95em; font-weight: 600; color: white; margin-bottom: 0px;">{name}</b>
+            <p style="font-size: 0.75em; color: white; margin-bottom: 0px; line-height: 1.0;">{description}</p>
+        </div>
+        <b style="font-size: 0.75em; color: white; font-weight: 600; margin-bottom: 0px;">{price} per unit / {stock_quantity} in Stock</b>
+    </div>
+    <div class="white-box" style="padding: 0 10px; display: flex; flex-direction: column; flex-grow: 1; justify-content: space-between;">
+        <div>
+            <div style="display: flex; align-items: center; margin-bottom: 5px;">
+                <div style="width: 10px; height: 10px; border-radius: 50%; background-color: #63b075; margin-right: 5px; font-size: 0.8em; line-height: 1; aspect-ratio: 1;"></div>
+                <p style="font-size: 0.8em; color: #333333; margin-bottom: 0;">{choice}</p>
+            </div>
+            <div style="display: flex; align-items: center; margin-bottom: 5px;">
+                <div style="width: 10px; height: 10px; border-radius: 50%; background-color: {cost_change_color}; margin-right: 5px; font-size: 0.8em; line-height: 1; aspect-ratio: 1;"></div>
+                <p style="font-size: 0.8em; color: #333333; margin-bottom: 0; line-height: 1.1;">{cost_change_text} per unit</p>
+            </div>
+            <div style="display: flex; align-items: center; margin-bottom: 5px;">
+                <div style="width: 10px; height: 10px; border-radius: 50%; background-color: {shipping_status_color}; margin-right: 5px; font-size: 0.8em; line-height: 1; aspect-ratio: 1;"></div>
+                <p style="font-size: 0.8em; color: #333333; margin-bottom: 0;">{shipping_status}</p>
+            </div>
+            <br>
+            <div style="display: flex; align-items: center; margin-top: 10px; margin-bottom: 5px;">
+                <p style="font-size: 0.8em; color: #333333; margin-bottom: 0;"><span style="font-weight: bold;">Reviews ({review_count})</span></p>
+                <span style="color: #efad56;">{stars}</span>
+            </div>
+        </div>
+        <div style="text-align: center;">
+            <p style="font-size: 0.75em; font-style: italic; color: #333333; margin-top: 6; margin-bottom: 0;">Estimated Delivery Date</p>
+            <p style="font-weight: bold; font-size: 1.2em; color: #3781ad; margin-top: 0; margin-bottom: 10px;">{delivery_date}</p>
+            <button style="background-color: #2c3143; color: white; font-size: 12px; font-weight: 600; border: none; padding: 12px 24px; border-radius: 20px; cursor: pointer;">Order</button>
+        </div>
+    </div>
+</div>"""
+
+
+@functools.cache
+def order_page_head():
+    """Fonts and CSS for the order page, as one payload."""
+    return f"{FONTS_HTML}<style>{ORDER_PAGE_CSS}</style>"
+
+
+def get_status_color(status, current_status):
+    """
+    Determines the color of the status dot based on the current status.
+
+    Args:
+        status (str): The status being checked.
+        current_status (str): The current status of the order.
+
+    Returns:
+        str: The color of the status dot ('blue', 'black', or 'gray').
+    """
+    if status == current_status:
+        return "#3781ad"
+    elif STATUS_ORDER.index(status) < STATUS_ORDER.index(current_status):
+        return "black"
+    else:
+        return "gray"
+
+
+def format_scan_time(timestamp):
+    return timestamp.strftime("%m/%d/%Y %I:%M%p EST") if hasattr(timestamp, "strftime") else "Timestamp not available"
+
+
+def tracking_header_html(tracking_number):
+    return TRACKING_HEADER.format(tracking_number=html.escape(str(tracking_number or "")))
+
+
+@functools.lru_cache(maxsize=1024)
+def timeline_html(current_status, scans):
+    """
+    Renders the whole status timeline as one payload.
+
+    Args:
+        current_status (str): The shipment's latest status.
+        scans (tuple): ``(location, timestamp)`` of the first scan for each status in
+            ``STATUS_ORDER``, ``(None, None)`` where there is none.
+
+    Returns:
+        str: HTML for the spacer and every status row.
+    """
+    rows = [TIMELINE_SPACER_HTML]
+    for i, (status, (location, timestamp)) in enumerate(zip(STATUS_ORDER, scans)):
+        color = get_status_color(status, current_status)
+        text_color, dot_color, line_color = "#2c3143", "gray", "gray"
+        if status == current_status:
+            text_color = dot_color = line_color = "#3781ad"
+        elif color == "black":
+            dot_color = line_color = "#3781ad"
+        else:
+            text_color = "gray"
+
+        # Statuses not reached yet show their description; reached ones show where and when
+        if color != "gray" and location:
+            display_text = html.escape(f"{location} - {format_scan_time(timestamp) if timestamp else ''}")
+        else:
+            display_text = STATUS_DESCRIPTIONS.get(status, "No description available.")
+        connector = _timeline_connector(line_color) if i < len(STATUS_ORDER) - 1 else ""
+        rows.append(_timeline_row(dot_color, connector, text_color, status, display_text))
+    return "".join(rows)
+
+
+@functools.lru_cache(maxsize=1024)
+def backorder_summary_html(name, subtitle, price, order_date, tracking_number, expected_delivery):
+    """Renders the backordered product and order facts as one payload."""
+    return BACKORDER_SUMMARY.format(
+        name=html.escape(name or ""), subtitle=html.escape(subtitle or ""), price=html.escape(price or ""),
+        order_date=order_date, tracking_number=html.escape(str(tracking_number or "")),
+        expected_delivery=expected_delivery,
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def substitution_cards_html(cards):
+    """
+    Renders the substitution heading and all cards as one payload.
+
+    Args:
+        cards (tuple): One tuple per card: ``(name, description, price, stock_quantity,
+            choice, cost_change, shipping_status, review_count, star_count, delivery_date)``,
+            where ``cost_change`` is the original price minus the substitute's.
+
+    Returns:
+        str: HTML for the heading and a three-column card grid.
+    """
+    rendered = []
+    for (name, description, price, stock_quantity, choice, cost_change, shipping_status,
+         review_count, star_count, delivery_date) in cards:
+        rendered.append(_substitution_card(
+            name=html.escape(name or ""),
+            description=html.escape(description or ""),
+            price=f"${price:.2f}",
+            stock_quantity=stock_quantity,
+            choice=choice,
+            cost_change_color="#63b075" if cost_change >= 0 else "#ef6658",
+            cost_change_text=f"Cost {'reduction' if cost_change > 0 else 'increase'} of ${abs(cost_change):.2f}",
+            shipping_status_color="#63b075" if shipping_status == "Ready to Ship" else "#ef6658",
+            shipping_status=shipping_status,
+            review_count=review_count,
+            stars="★" * star_count,
+            delivery_date=delivery_date,
+        ))
+    return SUBSTITUTIONS_HEADING_HTML + SUBSTITUTION_GRID.format(cards="".join(rendered))
+
+
+###############################################################################
+# 2. Account Sentiment page
+###############################################################################
+SENTIMENT_FONTS_HTML = """
+<link href="https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;600&display=swap" rel="stylesheet">
+"""
+
+SENTIMENT_PAGE_CSS = """
+html, body, [class*="css"]  {
+    font-family: 'Poppins', sans-serif;
+}
+.centered-text {
+    text-align: center;
+}
+.bold-number {
+    font-weight: bold;
+}
+.metric-title {
+    color: #737373;
+    text-align: center;
+    margin-bottom: 0px; /* Remove default bottom margin */
+}
+.metric-number {
+    color: #000;
+    text-align: center;
+    margin-top: 0px;    /* Remove default top margin */
+    font-weight: bold;
+}
+"""
+
+SENTIMENT_TITLE_HTML = """
+<h2 style="margin-top: -50px; margin-bottom: 0.2rem;">Account Sentiment</h2>
+<div style="height: 4px; width: 100px; background-color: #0073e6; margin-bottom: 10px;"></div>
+<hr style="margin-top: -10px;">
+"""
+
+# Bar and legend colors per bucket, most negative first.
+SENTIMENT_COLORS = {
+    "Very Negative": "#ef6658",
+    "Negative": "#efad56",
+    "Neutral": "#b0ccca",
+    "Positive": "#53a69a",
+    "Very Positive": "#63b075",
+}
+
+SENTIMENT_EXPLANATION_HTML = """
+<div style='margin-top: 15px; margin-bottom: 15px; font-size: 0.9rem; color: #555; font-style: italic; text-align: center;'>
+This line chart depicts the real-time shift in sentiment categories from a customer—ranging from very negative to very positive—as an agent interacts with a customer throughout the duration of a single call.
+</div>
+"""
+
+SENTIMENT_METRICS = """
+<div style="display: flex; justify-content: center; align-items: center;">
+    <div style="text-align: center; margin-right: 50px;">
+        <h6 style="color: #737373; margin-bottom: 0px;">Call Total</h6>
+        <h1 style="color:#000; margin-top: -25px; font-size: 2.0em; font-weight: bold;">{call_total}</h1>
+    </div>
+    <div style="text-align: center;">
+        <h6 style="color: #737373; margin-bottom: 0px;">Sentiment Score</h6>
+        <h1 style="color:#000; margin-top: -25px; font-size: 2.0em; font-weight: bold;">{sentiment_score}%</h1>
+    </div>
+</div>
+"""
+
+LEGEND_ITEM = """
+        <div style='display: flex; align-items: center; margin-bottom: 3px;'>
+            <div style='width: 20px; height: 20px; background-color: {color}; margin-right: 5px;'></div>
+            <div style='font-size: small; color: #555;'>{bucket}</div>
+        </div>"""
+
+LEGEND = """
+<div style='margin-top: 10px;'>
+    <div style='font-size: medium; color: #555; margin-bottom: 5px;'>Sentiment</div>
+    <div style='display: flex; flex-direction: column; align-items: flex-start;'>{items}
+    </div>
+</div>
+"""
+
+
+@functools.cache
+def sentiment_page_head():
+    """Fonts, CSS and the page title for the Account Sentiment page, as one payload."""
+    return f"{FONTS_HTML}{SENTIMENT_FONTS_HTML}<style>{SENTIMENT_PAGE_CSS}</style>{SENTIMENT_TITLE_HTML}"
+
+
+def sentiment_metrics_html(call_total, sentiment_score):
+    return SENTIMENT_METRICS.format(call_total=call_total, sentiment_score=sentiment_score)
+
+
+@functools.cache
+def sentiment_legend_html():
+    """The bucket color legend, built once from ``SENTIMENT_COLORS``."""
+    items = "".join(LEGEND_ITEM.format(color=color, bucket=bucket) for bucket, color in SENTIMENT_COLORS.items())
+    return LEGEND.format(items=items)
+
+
+if __name__ == "__main__":
+    # Elements sent per rerun of each page, and the time to build the timeline and the
+    # substitution cards with the page's old per-row f-strings versus the templates.
+    import collections
+    import datetime
+    import sys
+    import time
+    from unittest import mock
+
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    from local_session import LocalSession
+
+    session = LocalSession()
+
+    class _Connection:
+        def session(self):
+            return session
+
+    def count_elements(node):
+        children = getattr(node, "children", None)
+        if children is None:
+            return 1
+        return 1 + sum(count_elements(child) for child in children.values())
+
+    print("page                         elements  markdown")
+    with mock.patch.object(st, "connection", lambda *args, **kwargs: _Connection()):
+        for script, customer_id, label in [("wismo_app.py", "CUST-0001", "order page (shipped)"),
+                                           ("wismo_app.py", "CUST-0002", "order page (backordered)"),
+                                           ("call_transcript.py", "CUST-0001", "account sentiment")]:
+            app = AppTest.from_file(script, default_timeout=60)
+            app.query_params["customer_id"] = customer_id
+            app.run()
+            print(f"{label:<28} {count_elements(app._tree) - 1:>8}  {len(app.markdown):>8}", file=sys.stderr)
+
+    # The pre-template page code, as it was in wismo_app.py, minus the st.markdown calls
+    current_status = "In Transit"
+    scans_by_status = {status: (f"City {i}", datetime.datetime(2025, 4, 1, 8 + i))
+                       for i, status in enumerate(STATUS_ORDER[:5])}
+    first_scans = tuple(scans_by_status.get(status, (None, None)) for status in STATUS_ORDER)
+    Substitute = collections.namedtuple("Substitute", ["name", "description", "price", "stock_quantity", "choice",
+                                                       "shipping_status"])
+    substitutes = [Substitute(f"Product {i}", "Demo description", 20.0 + i, 40 + i, "First Choice", "Ready to Ship")
+                   for i in range(3)]
+    original_product_price = 25.0
+    review_counts, star_counts, delivery_dates = [455, 222, 311], [5, 4, 4], ["April 10", "April 14", "April 12"]
+    cards = tuple((sub.name, sub.description, sub.price, sub.stock_quantity, sub.choice,
+                   original_product_price - sub.price, sub.shipping_status, review_counts[i], star_counts[i],
+                   delivery_dates[i]) for i, sub in enumerate(substitutes))
+
+    def legacy_timeline():
+        payloads = []
+        for i, status in enumerate(STATUS_ORDER):
+            color = get_status_color(status, current_status)
+            description = STATUS_DESCRIPTIONS.get(status, "No description available.")
+            text_color = "#2c3143"
+            dot_color = "gray"
+            line_color = "gray"
+            if status == current_status:
+                text_color = "#3781ad"
+                dot_color = "#3781ad"
+                line_color = "#3781ad"
+            elif color == "black":
+                dot_color = "#3781ad"
+                line_color = "#3781ad"
+            else:
+                text_color = "gray"
+            description_color = "gray"
+            location, timestamp = scans_by_status.get(status, (None, None))
+            formatted_timestamp_status = ""
+            if timestamp:
+                formatted_timestamp_status = timestamp.strftime("%m/%d/%Y %I:%M%p EST") if isinstance(timestamp, datetime.datetime) else "Timestamp not available"
+            if color == "gray":
+                display_text = description
+            elif location:
+                display_text = f"{location} - {formatted_timestamp_status}"
+            else:
+                display_text = description
+            if i < len(STATUS_ORDER) - 1:
+                status_html = f"""
+                    <div style="position: relative; display: flex; align-items: flex-start; margin-bottom: 10px;">
+                        <div style="width: 10px; height: 10px; border-radius: 50%; background-color: {dot_color}; margin-right: 15px; margin-top: 5px; position: relative; z-index: 1;"></div>
+                        <div style="position: absolute; top: 10px; left: 4px; width: 2px; height: calc(100% + 5px); background-color: {line_color}; z-index: 0;"></div>
+                        <div>
+                            <div style="font-weight: bold; color: {text_color};">{status}</div>
+                            <div style="font-size: 0.9em; color: {description_color};">{display_text}</div>
+                        </div>
+                    </div>
+                    """
+            else:
+                status_html = f"""
+                    <div style="position: relative; display: flex; align-items: flex-start; margin-bottom: 10px;">
+                        <div style="width: 10px; height: 10px; border-radius: 50%; background-color: {dot_color}; margin-right: 15px; margin-top: 5px; position: relative; z-index: 1;"></div>
+                        <div>
+                            <div style="font-weight: bold; color: {text_color};">{status}</div>
+                            <div style="font-size: 0.9em; color: {description_color};">{display_text}</div>
+                        </div>
+                    </div>
+                    """
+            payloads.append(status_html)
+        return payloads
+
+    def legacy_cards():
+        blue_color, star_color, green_color, red_color = "#53a69a", "#efad56", "#63b075", "#ef6658"
+        atrium_blue_color, black_color = "#3781ad", "#333333"
+        payloads = []
+        for i, substitute in enumerate(substitutes):
+            product_name = substitute.name
+            product_description = substitute.description
+            substitute_price = substitute.price
+            stock_quantity = substitute.stock_quantity
+            price_formatted = f"${substitute_price:.2f}"
+            cost_change_value = original_product_price - substitute_price
+            cost_change_text = f"Cost {'reduction' if cost_change_value > 0 else 'increase'} of ${abs(cost_change_value):.2f}"
+            cost_change_color = green_color if cost_change_value >= 0 else red_color
+            substitution_choice = substitute.choice
+            substitution_choice_color = green_color
+            shipping_status = substitute.shipping_status
+            shipping_status_color = green_color if shipping_status == "Ready to Ship" else red_color
+            review_count = review_counts[i % len(review_counts)]
+            star_count = star_counts[i % len(star_counts)]
+            delivery_date = delivery_dates[i % len(delivery_dates)]
+            payloads.append(f"""
+                <div class="substitution-item" style="border: 1px solid #ccc; border-radius: 15px; padding: 10px; margin-bottom: 10px; display: flex; flex-direction: column; height: 100%;">
+                    <div class="blue-box" style="background-color: {blue_color}; color: white; padding: 8px; border-radius: 10px; text-align: left; margin-bottom: 6px; flex-grow: 1; display: flex; flex-direction: column; justify-content: space-between;">
+                        <div>
+                            <b style="font-size: .95em; font-weight: 600; color: white; margin-bottom: 0px;">{product_name}</b>
+                            <p style="font-size: 0.75em; color: white; margin-bottom: 0px; line-height: 1.0;">{product_description}</p>
+                        </div>
+                        <b style="font-size: 0.75em; color: white; font-weight: 600; margin-bottom: 0px;">{price_formatted} per unit / {stock_quantity} in Stock</b>
+                    </div>
+                    <div class="white-box" style="padding: 0 10px; display: flex; flex-direction: column; flex-grow: 1; justify-content: space-between;">
+                        <div>
+                            <div style="display: flex; align-items: center; margin-bottom: 5px;">
+                                <div style="width: 10px; height: 10px; border-radius: 50%; background-color: {substitution_choice_color}; margin-right: 5px; font-size: 0.8em; line-height: 1; aspect-ratio: 1;"></div>
+                                <p style="font-size: 0.8em; color: {black_color}; margin-bottom: 0;">{substitution_choice}</p>
+                            </div>
+                            <div style="display: flex; align-items: center; margin-bottom: 5px;">
+                                <div style="width: 10px; height: 10px; border-radius: 50%; background-color: {cost_change_color}; margin-right: 5px; font-size: 0.8em; line-height: 1; aspect-ratio: 1;"></div>
+                                <p style="font-size: 0.8em; color: {black_color}; margin-bottom: 0; line-height: 1.1;">{cost_change_text} per unit</p>
+                            </div>
+                            <div style="display: flex; align-items: center; margin-bottom: 5px;">
+                                <div style="width: 10px; height: 10px; border-radius: 50%; background-color: {shipping_status_color}; margin-right: 5px; font-size: 0.8em; line-height: 1; aspect-ratio: 1;"></div>
+                                <p style="font-size: 0.8em; color: {black_color}; margin-bottom: 0;">{shipping_status}</p>
+                            </div>
+                            <br>
+                            <div style="display: flex; align-items: center; margin-top: 10px; margin-bottom: 5px;">
+                                <p style="font-size: 0.8em; color: {black_color}; margin-bottom: 0;"><span style="font-weight: bold;">Reviews ({review_count})</span></p>
+                                <span style="color: {star_color};">{'★' * star_count}</span>
+                            </div>
+                        </div>
+                        <div style="text-align: center;">
+                            <p style="font-size: 0.75em; font-style: italic; color: {black_color}; margin-top: 6; margin-bottom: 0;">Estimated Delivery Date</p>
+                            <p style="font-weight: bold; font-size: 1.2em; color: {atrium_blue_color}; margin-top: 0; margin-bottom: 10px;">{delivery_date}</p>
+                            <button style="background-color: #2c3143; color: white; font-size: 12px; font-weight: 600; border: none; padding: 12px 24px; border-radius: 20px; cursor: pointer;">Order</button>
+                        </div>
+                    </div>
+                </div>
+                """)
+        return payloads
+
+    def timed(fn, repeat=5000):
+        best = float("inf")
+        for _ in range(3):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            best = min(best, (time.perf_counter() - started) / repeat * 1e6)
+        return best
+
+    # A rerun renders from scratch on the first view of an order or a new scan (a miss), and
+    # reuses the payload on any other rerun of the same order (a hit).
+    print("section    old f-strings  template miss  template hit  at 0% / 50% / 90% hits")
+    for name, legacy, cold, warm in [
+        ("timeline", legacy_timeline, lambda: timeline_html.__wrapped__(current_status, first_scans),
+         lambda: timeline_html(current_status, first_scans)),
+        ("cards", legacy_cards, lambda: substitution_cards_html.__wrapped__(cards), lambda: substitution_cards_html(cards)),
+    ]:
+        old, miss, hit = timed(legacy), timed(cold), timed(warm)
+        mixed = " / ".join(f"{rate * hit + (1 - rate) * miss:.1f}" for rate in (0, 0.5, 0.9))
+        print(f"{name:<10} {old:>10.1f} us  {miss:>10.1f} us  {hit:>9.1f} us  {mixed} us")
@@ -0,0 +1,288 @@
+"""
+Query-budget regression harness for wismo_app.py and call_transcript.py.
+
+Each scenario drives one page rerun with Streamlit's AppTest against the local fake
+session (see local_session.py), wrapped in a ``QueryRecorder`` that logs every SQL
+statement with its fingerprint, row count and bytes returned. A scenario fails when it
+raises, or when it exceeds its declared query or byte budget.
+
+Budgets are per rerun in steady state: every scenario is run once unrecorded first, so
+process-wide caches such as the substitution index are already built. The order-page
+result cache (see warehouse_resilience.py) is cleared before the recorded run, so the
+budgets still cover the queries a page sends when its results are not cached.
+
+Cold-start scenarios instead run against fresh, empty process-wide state, as the first
+rerun after a server start does, and are recorded until the background loads they
+start have finished. Their budgets cover the first-load scans of the search index,
+substitution index, stall monitor, sentiment rollups and inventory snapshot.
+
+Usage:
+    python query_budget.py            # prints a report, exits non-zero on any failure
+    python query_budget.py -v         # also lists every recorded statement
+"""
+import contextlib
+import hashlib
+import importlib
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from unittest import mock
+
+import pandas as pd
+import pyarrow as pa
+
+QueryRecord = namedtuple("QueryRecord", ["fingerprint", "text", "rows", "bytes"])
+
+Scenario = namedtuple(
+    "Scenario",
+    ["name", "script", "query_params", "search_value", "max_queries", "max_bytes", "expected_error", "cold"],
+    defaults=[None, False],
+)
+
+SCENARIOS = [
+    Scenario("shipped order view", "wismo_app.py", {"customer_id": "CUST-0001"}, None, 2, 50_000),
+    Scenario("backordered order view", "wismo_app.py", {"customer_id": "CUST-0002"}, None, 2, 50_000),
+    Scenario("missing order view", "wismo_app.py", {}, "ORD-9999", 1, 5_000, "No matching order found."),
+    Scenario("customer name search", "wismo_app.py", {}, "customer 0001", 0, 1_000),
+    Scenario("sentiment view", "call_transcript.py", {"customer_id": "CUST-0001"}, None, 1, 50_000),
+    # Steady-state queries plus one full scan per first load: the stall monitor (shipped),
+    # inventory snapshot and substitution index (two), search index (two), rollups (sentiment)
+    Scenario("cold shipped order view", "wismo_app.py", {"customer_id": "CUST-0001"}, None, 3, 40_000, cold=True),
+    Scenario("cold backordered order view", "wismo_app.py", {"customer_id": "CUST-0002"}, None, 5, 40_000, cold=True),
+    Scenario("cold customer name search", "wismo_app.py", {}, "customer 0001", 2, 40_000, cold=True),
+    Scenario("cold sentiment view", "call_transcript.py", {"customer_id": "CUST-0001"}, None, 2, 40_000, cold=True),
+]
+
+# Process-wide caches, by module and attribute, that a cold start begins without.
+PROCESS_CACHES = [
+    ("search_index", "search_index", "SearchIndex"),
+    ("substitution_index", "substitution_index", "SubstitutionIndex"),
+    ("stalled_shipments", "stall_monitor", "StallMonitor"),
+    ("inventory_snapshot", "inventory_snapshot", "InventorySnapshot"),
+    ("warehouse_resilience", "order_cache", "ResultCache"),
+]
+
+
+###############################################################################
+# 1. Recording session wrapper
+###############################################################################
+def fingerprint(query):
+    """
+    Reduces SQL text to its shape, so the same statement with different literals matches.
+
+    Returns:
+        tuple: ``(short_hash, normalized_text)``.
+    """
+    normalized = re.sub(r"'(?:[^']|'')*'", "?", query)
+    normalized = re.sub(r"\b\d+(?:\.\d+)?\b", "?", normalized)
+    normalized = " ".join(normalized.split()).upper()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:10], normalized
+
+
+def measure(result):
+    """Returns ``(rows, bytes)`` for a query result of any of the shapes the apps fetch."""
+    if isinstance(result, pa.Table):
+        return result.num_rows, result.nbytes
+    if isinstance(result, pd.DataFrame):
+        return len(result), int(result.memory_usage(index=True, deep=True).sum())
+    if isinstance(result, list):
+        return len(result), sum(sys.getsizeof(value) for row in result for value in row)
+    if result is None:
+        return 0, 0
+    return 1, sum(sys.getsizeof(value) for value in result)
+
+
+class _RecordedDataFrame:
+    def __init__(self, recorder, query, inner):
+        self._recorder = recorder
+        self._query = query
+        self._inner = inner
+
+    def __getattr__(self, name):
+        action = getattr(self._inner, name)
+
+        def recorded(*args, **kwargs):
+            result = action(*args, **kwargs)
+            self._recorder.record(self._query, result)
+            return result
+
+        return recorded
+
+
+class _RecordedCursor:
+    def __init__(self, recorder, inner):
+        self._recorder = recorder
+        self._inner = inner
+        self._query = None
+
+    def execute(self, query, *args, **kwargs):
+        self._query = query
+        self._inner.execute(query, *args, **kwargs)
+        return self
+
+    def fetch_arrow_all(self, *args, **kwargs):
+        result = self._inner.fetch_arrow_all(*args, **kwargs)
+        self._recorder.record(self._query, result)
+        return result
+
+    def fetch_arrow_batches(self, *args, **kwargs):
+        rows = size = 0
+        for batch in self._inner.fetch_arrow_batches(*args, **kwargs):
+            rows += batch.num_rows
+            size += batch.nbytes
+            yield batch
+        self._recorder.records.append(QueryRecord(*fingerprint(self._query), rows, size))
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+class _RecordedConnection:
+    def __init__(self, recorder, inner):
+        self._recorder = recorder
+        self._inner = inner
+
+    def cursor(self):
+        return _RecordedCursor(self._recorder, self._inner.cursor())
+
+
+class QueryRecorder:
+    """
+    Wraps a Snowpark-like session and records every statement it executes.
+
+    Args:
+        session: The session to delegate to.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self.records = []
+        self.connection = _RecordedConnection(self, session.connection)
+
+    def sql(self, query):
+        return _RecordedDataFrame(self, query, self._session.sql(query))
+
+    def record(self, query, result):
+        rows, size = measure(result)
+        self.records.append(QueryRecord(*fingerprint(query), rows, size))
+
+    def total_bytes(self):
+        return sum(record.bytes for record in self.records)
+
+
+###############################################################################
+# 2. Scenarios
+###############################################################################
+@contextlib.contextmanager
+def cold_start():
+    """
+    Swaps every process-wide cache for an empty one, as in a freshly started server.
+
+    Yields:
+        list: The fresh instances, for ``wait_for_background``.
+    """
+    fresh = []
+    with contextlib.ExitStack() as stack:
+        for module_name, attribute, class_name in PROCESS_CACHES:
+            module = importlib.import_module(module_name)
+            instance = getattr(module, class_name)()
+            stack.enter_context(mock.patch.object(module, attribute, instance))
+            fresh.append(instance)
+        rollups = importlib.import_module("sentiment_rollups")
+        stack.enter_context(mock.patch.dict(rollups._rollups, clear=True))
+        fresh.append(rollups._rollups)
+        yield fresh
+
+
+def wait_for_background(instances, timeout=60):
+    """Waits until no instance has a background load or refresh running."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        busy = [instance for instance in instances
+                for candidate in (instance.values() if isinstance(instance, dict) else [instance])
+                if getattr(candidate, "_refreshing", False)]
+        if not busy:
+            return
+        time.sleep(0.05)
+
+
+def run_scenario(scenario, session):
+    """
+    Runs one page rerun against ``session`` and checks it for exceptions and errors.
+
+    Returns:
+        tuple: ``(recorder, failures)`` where ``failures`` is a list of messages.
+    """
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    recorder = QueryRecorder(session)
+
+    class _Connection:
+        def session(self):
+            return recorder
+
+    with mock.patch.object(st, "connection", lambda *args, **kwargs: _Connection()):
+        app = AppTest.from_file(scenario.script, default_timeout=60)
+        for key, value in scenario.query_params.items():
+            app.query_params[key] = value
+        if scenario.search_value is not None:
+            app.session_state["search_value"] = scenario.search_value
+        app.run()
+
+    failures = [f"raised {exception.value}" for exception in app.exception]
+    errors = [error.value for error in app.error]
+    if scenario.expected_error is not None:
+        if scenario.expected_error not in errors:
+            failures.append(f"did not show error {scenario.expected_error!r}")
+        errors = [error for error in errors if error != scenario.expected_error]
+    failures += [f"showed error {error!r}" for error in errors]
+    return recorder, failures
+
+
+def budget_failures(scenario, recorder):
+    """Returns messages for each budget the recorded queries exceed."""
+    failures = []
+    if len(recorder.records) > scenario.max_queries:
+        failures.append(f"{len(recorder.records)} queries > budget of {scenario.max_queries}")
+    if recorder.total_bytes() > scenario.max_bytes:
+        failures.append(f"{recorder.total_bytes():,} bytes > budget of {scenario.max_bytes:,}")
+    return failures
+
+
+def main(argv):
+    from local_session import LocalSession
+    from warehouse_resilience import order_cache
+
+    # Budgets describe warehouse traffic, so the optional local replica stays off.
+    os.environ.pop("WISMO_REPLICA_PATH", None)
+    verbose = "-v" in argv
+    session = LocalSession()
+    failed = 0
+    for scenario in SCENARIOS:
+        if scenario.cold:
+            with cold_start() as fresh:
+                recorder, failures = run_scenario(scenario, session)
+                wait_for_background(fresh)
+            failures += budget_failures(scenario, recorder)
+        else:
+            run_scenario(scenario, session)  # Warm process-wide caches
+            order_cache.clear()
+            recorder, failures = run_scenario(scenario, session)
+            failures += budget_failures(scenario, recorder)
+        status = "FAIL" if failures else "ok"
+        print(f"[{status:>4}] {scenario.name}: {len(recorder.records)}/{scenario.max_queries} queries, "
+              f"{recorder.total_bytes():,}/{scenario.max_bytes:,} bytes")
+        for failure in failures:
+            print(f"         - {failure}")
+        if verbose or failures:
+            for record in recorder.records:
+                print(f"         {record.fingerprint} rows={record.rows} bytes={record.bytes:,} {record.text[:90]}")
+        failed += bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,212 @@
+"""
+Single-flight request coalescing for warehouse queries.
+
+Every Streamlit session runs in the same server process, so when many agents open the
+same order at once they would each send an identical query to Snowflake. ``SingleFlight``
+lets the first caller (the leader) run the query while later callers with the same key
+wait for, and share, its result or its error.
+
+Only ordinary exceptions are shared. If the leader is interrupted instead (a Streamlit
+rerun or stop, ``KeyboardInterrupt``, ``SystemExit``), the interruption stays on the
+leader's thread and waiting callers get a ``CoalescedQueryAborted`` they can retry.
+"""
+import logging
+import threading
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# Seconds a waiting caller will block on someone else's in-flight query.
+QUERY_WAIT_TIMEOUT = 30.0
+
+
+class CoalescedQueryTimeout(TimeoutError):
+    """Raised when a waiting caller gives up on an in-flight query."""
+
+
+class CoalescedQueryAborted(RuntimeError):
+    """Raised in waiting callers when the leader was interrupted before finishing; safe to retry."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key.
+
+    Only one call per key is in flight at a time. Callers that arrive while it runs wait
+    for it and receive the same result, or have the same exception raised.
+    Interruptions of the leader are never raised in the waiters' threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"executed": 0, "saved": 0, "timeouts": 0, "errors": 0}
+
+    def do(self, key, fn, timeout=None):
+        """
+        Runs ``fn`` once for all concurrent callers using ``key``.
+
+        Args:
+            key (hashable): Identity of the call, e.g. normalized SQL text.
+            fn (callable): Zero-argument function doing the actual work.
+            timeout (float): Seconds a waiting caller blocks before giving up. The leader is never timed out.
+
+        Returns:
+            tuple: ``(result, shared)`` where ``shared`` is True if another caller ran ``fn``.
+
+        Raises:
+            CoalescedQueryTimeout: If a waiting caller's timeout expires first.
+            CoalescedQueryAborted: If the leader was interrupted while this caller waited.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            interrupted = None
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            except BaseException as e:
+                interrupted = e
+                call.error = CoalescedQueryAborted(f"The in-flight query was interrupted ({type(e).__name__}).")
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    self.stats["executed"] += 1
+                    if call.error is not None:
+                        self.stats["errors"] += 1
+                call.done.set()
+            if interrupted is not None:
+                raise interrupted
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        if not call.done.wait(timeout):
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise CoalescedQueryTimeout(f"Timed out after {timeout}s waiting for an in-flight query.")
+        with self._lock:
+            self.stats["saved"] += 1
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+
+# Process-wide instance shared by every Streamlit session.
+warehouse_flight = SingleFlight()
+
+
+def normalize_query(query):
+    """Collapses whitespace so equivalent query strings share one key."""
+    return " ".join(query.split())
+
+
+def coalesced(session, query, fetch, timeout=QUERY_WAIT_TIMEOUT, flight=warehouse_flight, guard=None):
+    """
+    Runs ``fetch(session, query)``, sharing the result with identical in-flight fetches.
+
+    Intended for fetchers returning immutable results (Row tuples, Arrow tables, see
+    warehouse_fetch.py), which waiting callers can share without copying.
+
+    Args:
+        session: Snowpark (or compatible) session used if this caller leads.
+        query (str): SQL text.
+        fetch (callable): ``fetch(session, query)`` returning the result.
+        timeout (float): Seconds to wait on another caller's fetch.
+        flight (SingleFlight): Coalescing group to use.
+        guard (callable): Runs the leader's fetch as ``guard(fetch, session, query)``, e.g. a
+            circuit breaker's ``call``, so it sees one call per warehouse query rather than one
+            per caller.
+
+    Returns:
+        The fetch result.
+    """
+    run = (lambda: fetch(session, query)) if guard is None else (lambda: guard(fetch, session, query))
+    result, shared = flight.do((fetch.__name__, normalize_query(query)), run, timeout)
+    if shared:
+        logger.debug(f"Coalesced warehouse query; {flight.stats['saved']} queries saved so far.")
+    return result
+
+
+if __name__ == "__main__":
+    # Concurrency check against the local fake session: many callers, one warehouse query.
+    from concurrent.futures import ThreadPoolExecutor
+
+    from local_session import LocalSession
+    from warehouse_fetch import fetch_rows
+
+    callers = 50
+    session = LocalSession(latency=0.3)
+    flight = SingleFlight()
+    query = """
+        SELECT o.ORDER_ID, o.ORDER_STATUS, s.TRACKING_NUMBER
+        FROM Orders o LEFT JOIN Shipments s ON o.ORDER_ID = s.ORDER_ID
+        WHERE o.ORDER_ID = 'ORD-0052'
+    """
+    start = threading.Barrier(callers)
+
+    def open_order(_):
+        start.wait()
+        return coalesced(session, query, fetch_rows, flight=flight)
+
+    with ThreadPoolExecutor(callers) as pool:
+        results = list(pool.map(open_order, range(callers)))
+    assert session.query_count == 1, session.query_count
+    assert all(result is results[0] for result in results)
+    assert flight.stats["saved"] == callers - 1, flight.stats
+
+    # Errors reach every waiting caller.
+    def open_broken(_):
+        start.wait()
+        try:
+            coalesced(session, "SELECT * FROM NO_SUCH_TABLE", fetch_rows, flight=flight)
+        except Exception as e:
+            return type(e).__name__
+        return None
+
+    with ThreadPoolExecutor(callers) as pool:
+        errors = list(pool.map(open_broken, range(callers)))
+    assert errors == ["OperationalError"] * callers, errors
+    assert session.query_count == 2, session.query_count
+
+    # Waiters give up after their timeout; the leader still finishes.
+    session.latency = 0.5
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(coalesced, session, query, fetch_rows, flight=flight)
+        threading.Event().wait(0.05)
+        waiter = pool.submit(coalesced, session, query, fetch_rows, timeout=0.1, flight=flight)
+        try:
+            waiter.result()
+            raise AssertionError("waiter should have timed out")
+        except CoalescedQueryTimeout:
+            pass
+        assert leader.result()
+
+    # An interrupted leader keeps its interruption; the waiter gets a retryable error.
+    def interrupted_fetch(session, query):
+        threading.Event().wait(0.2)
+        raise KeyboardInterrupt
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(coalesced, session, query, interrupted_fetch, flight=flight)
+        threading.Event().wait(0.05)
+        waiter = pool.submit(coalesced, session, query, interrupted_fetch, flight=flight)
+        for future, expected in ((leader, KeyboardInterrupt), (waiter, CoalescedQueryAborted)):
+            try:
+                future.result()
+                raise AssertionError(f"expected {expected.__name__}")
+            except expected:
+                pass
+
+    print(f"{callers} concurrent callers -> {session.query_count} warehouse queries; stats: {flight.stats}")
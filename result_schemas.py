@@ -0,0 +1,133 @@
+"""
+Typed schemas for the result sets the pages keep in memory.
+
+Each ``normalize_*`` function is applied exactly once, when a result is fetched. It fixes
+column names, folds bucket aliases, and converts columns to compact dtypes: categoricals
+with a fixed category order, 32-bit counts, and native
+datetimes. Renderers can then group and pivot without re-cleaning the data.
+"""
+import pandas as pd
+
+STATUS_ORDER = [
+    "Label Created",
+    "Shipment Information Received",
+    "Picked Up",
+    "Departed from Origin Facility",
+    "In Transit",
+    "Arrived at Carrier Facility",
+    "Out for Delivery",
+    "Delivered",
+]
+
+SENTIMENT_BUCKET_ORDER = ["Very Negative", "Negative", "Neutral", "Positive", "Very Positive"]
+
+# Upstream bucket names folded into the five displayed buckets.
+SENTIMENT_BUCKET_ALIASES = {
+    "Slightly Negative": "Negative",
+}
+
+
+def _ordered_categorical(values, order):
+    """Categorical in ``order``, with any unexpected values kept as trailing categories."""
+    extras = sorted(set(values.dropna().unique()) - set(order))
+    return pd.Categorical(values, categories=list(order) + extras, ordered=True)
+
+
+def normalize_sentiment(df):
+    """
+    Normalizes the per-conversation sentiment result of ``fetch_sentiment_data``.
+
+    Args:
+        df (pd.DataFrame): Raw query result, in any column-name case.
+
+    Returns:
+        pd.DataFrame: Lower-case columns; ``sentiment_bucket`` as an ordered categorical
+        with aliases folded; ``conversation_id`` categorical; ``call_date`` datetime;
+        counts as int32; ``percentage`` as float32.
+    """
+    df = df.rename(columns=str.lower)
+    if "sentiment_bucket" not in df.columns:
+        return df
+    df["sentiment_bucket"] = _ordered_categorical(
+        df["sentiment_bucket"].replace(SENTIMENT_BUCKET_ALIASES), SENTIMENT_BUCKET_ORDER
+    )
+    df["conversation_id"] = df["conversation_id"].astype("category")
+    df["call_date"] = pd.to_datetime(df["call_date"])
+    # int32, not the smallest fit: the page sums these into Python ints, and NumPy scalar
+    # promotion would keep a uint8 sum at uint8 and wrap it.
+    for column in ("bucket_line_count", "total_customer_lines"):
+        df[column] = df[column].astype("int32")
+    df["percentage"] = df["percentage"].astype("float32")
+    return df
+
+
+def normalize_tracking(df):
+    """
+    Normalizes a tracking history result (STATUS_UPDATE, LOCATION, TIMESTAMP, TRACKING_NUMBER).
+
+    Returns:
+        pd.DataFrame: ``STATUS_UPDATE`` as a categorical ordered by ``STATUS_ORDER``,
+        ``LOCATION`` and ``TRACKING_NUMBER`` categorical, ``TIMESTAMP`` datetime.
+    """
+    df = df.rename(columns=str.upper)
+    df["STATUS_UPDATE"] = _ordered_categorical(df["STATUS_UPDATE"], STATUS_ORDER)
+    df["LOCATION"] = df["LOCATION"].astype("category")
+    df["TRACKING_NUMBER"] = df["TRACKING_NUMBER"].astype("category")
+    df["TIMESTAMP"] = pd.to_datetime(df["TIMESTAMP"])
+    return df
+
+
+def concat_normalized(frames):
+    """
+    Concatenates normalized frames, merging categories so columns stay categorical.
+
+    ``pd.concat`` silently falls back to object dtype when categories differ. The first
+    frame's category order (e.g. ``STATUS_ORDER``) is kept, with newcomers appended.
+    """
+    combined = pd.concat(frames, ignore_index=True)
+    for column in frames[0].columns:
+        dtype = frames[0][column].dtype
+        if isinstance(dtype, pd.CategoricalDtype) and not isinstance(combined[column].dtype, pd.CategoricalDtype):
+            categories = list(dtype.categories)
+            seen = set(categories)
+            for frame in frames[1:]:
+                for category in frame[column].cat.categories:
+                    if category not in seen:
+                        seen.add(category)
+                        categories.append(category)
+            combined[column] = pd.Categorical(combined[column], categories=categories, ordered=dtype.ordered)
+    return combined
+
+
+if __name__ == "__main__":
+    # Memory per result and groupby/pivot time, raw object dtypes versus the normalized schema.
+    import time
+
+    import numpy as np
+
+    rng = np.random.default_rng(7)
+    rows = 200_000
+    raw = pd.DataFrame({
+        "CONVERSATION_ID": [f"CONV-{i:05d}" for i in rng.integers(0, 5_000, rows)],
+        "CALL_DATE": [f"2025-0{m}-1{d}" for m, d in zip(rng.integers(1, 10, rows), rng.integers(0, 10, rows))],
+        "SENTIMENT_BUCKET": rng.choice(["Very Negative", "Slightly Negative", "Neutral", "Positive", "Very Positive"], rows),
+        "BUCKET_LINE_COUNT": rng.integers(1, 40, rows),
+        "TOTAL_CUSTOMER_LINES": rng.integers(40, 80, rows),
+        "PERCENTAGE": rng.random(rows) * 100,
+    })
+    legacy = raw.rename(columns=str.lower)
+    legacy["sentiment_bucket"] = legacy["sentiment_bucket"].replace(SENTIMENT_BUCKET_ALIASES)
+    typed = normalize_sentiment(raw.copy())
+
+    def timed(fn, repeat=5):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    for name, df in (("object dtypes", legacy), ("typed schema", typed)):
+        memory = df.memory_usage(deep=True).sum() / 1024 ** 2
+        groupby_ms = timed(lambda: df.groupby(["conversation_id", "sentiment_bucket"], observed=True)["bucket_line_count"].sum())
+        pivot_ms = timed(lambda: df.pivot_table(index="conversation_id", columns="sentiment_bucket",
+                                                values="percentage", aggfunc="sum", observed=True))
+        print(f"{name:<14} {memory:>7.1f} MB  groupby {groupby_ms:>6.1f} ms  pivot {pivot_ms:>6.1f} ms")
@@ -0,0 +1,303 @@
+"""
+In-memory search over order IDs, tracking numbers and customer names.
+
+Order IDs and tracking numbers live in one sorted key array, so a prefix lookup is two
+binary searches. Customer names are split into lower-case tokens. A sorted token array
+answers prefix matches on the token being typed, and the exact range of a completed token
+is its posting list, sorted by order ID. A name lookup checks at most ``SCAN_LIMIT``
+candidate orders, so a keystroke stays within a few milliseconds even when two common
+tokens never occur together.
+
+The index is loaded in bulk on first use (see background_refresh.py). A background refresh then pulls orders
+placed since the newest order date seen, and shipments of orders from the last
+``RECENT_SHIPMENT_DAYS``; re-pulled entries are merged only once. Order IDs are not issued
+in sort order and shipments can be created long after their order, so a full reload every
+``FULL_RELOAD_SECONDS`` picks up anything the incremental pulls missed. Each refresh builds
+new arrays and swaps them in whole, so concurrent readers never see a half-built index.
+"""
+import bisect
+import datetime
+import logging
+import re
+import time
+from collections import namedtuple
+
+from background_refresh import BackgroundRefresh
+from warehouse_fetch import sql_literal
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# Seconds before a lookup triggers a background incremental refresh.
+REFRESH_SECONDS = 60
+
+# Seconds between full reloads, which pick up rows the incremental pulls missed.
+FULL_RELOAD_SECONDS = 900
+
+# Days of orders whose shipments every incremental refresh pulls again.
+RECENT_SHIPMENT_DAYS = 3
+
+# Suggestions returned per keystroke.
+SUGGESTION_LIMIT = 8
+
+# Candidate orders a name lookup checks at most, bounding its time per keystroke.
+SCAN_LIMIT = 1000
+
+Suggestion = namedtuple("Suggestion", ["kind", "key", "order_id", "label"])
+
+# Entries are "KEY\x00ORDER_ID" strings in one sorted list per index: a single list of
+# strings sorts and merges far faster than tuples, and a prefix is one contiguous range.
+_SEPARATOR = "\x00"
+
+_Snapshot = namedtuple("_Snapshot", ["id_keys", "name_keys", "customers"])
+
+ORDERS_QUERY = """
+    SELECT o.ORDER_ID, o.ORDER_DATE, c.CUSTOMER_NAME
+    FROM Orders o
+    JOIN Customers c ON o.CUSTOMER_ID = c.CUSTOMER_ID
+    {where}
+"""
+
+SHIPMENTS_QUERY = """
+    SELECT s.SHIPMENT_ID, s.TRACKING_NUMBER, s.ORDER_ID
+    FROM Shipments s
+    WHERE s.TRACKING_NUMBER IS NOT NULL {where}
+"""
+
+
+def _tokenize(text):
+    return [token for token in text.lower().replace(",", " ").split() if token]
+
+
+def _prefix_range(sorted_values, prefix):
+    start = bisect.bisect_left(sorted_values, prefix)
+    end = bisect.bisect_left(sorted_values, prefix + "\uffff")
+    return start, end
+
+
+def _merged(old, new):
+    """Returns sorted ``old`` with ``new`` merged in once, copying ``old`` in a few large slices."""
+    if not new:
+        return old
+    if not old:
+        return sorted(new)
+    merged, last = [], 0
+    for entry in dict.fromkeys(sorted(new)):
+        position = bisect.bisect_left(old, entry, last)
+        merged += old[last:position]
+        last = position
+        if position < len(old) and old[position] == entry:
+            continue
+        merged.append(entry)
+    merged += old[last:]
+    return merged
+
+
+class SearchIndex(BackgroundRefresh):
+    """
+    Prefix and token index for the order search box.
+
+    Args:
+        refresh_seconds (float): Age after which a lookup starts a background refresh.
+        full_reload_seconds (float): Age of the last full load after which a refresh reloads everything.
+    """
+
+    thread_name = "search-index-refresh"
+    description = "Search index"
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, full_reload_seconds=FULL_RELOAD_SECONDS):
+        super().__init__(refresh_seconds)
+        self.full_reload_seconds = full_reload_seconds
+        self.loaded_at = None
+        self.order_watermark = None
+        self._snapshot = _Snapshot([], [], {})
+
+    ###########################################################################
+    # Loading
+    ###########################################################################
+    def add(self, orders, shipments, replace=False):
+        """
+        Merges new rows into the index and swaps in the result.
+
+        Args:
+            orders (list): ``(order_id, customer_name)`` pairs.
+            shipments (list): ``(tracking_number, order_id)`` pairs.
+            replace (bool): Build from an empty index, dropping everything indexed before.
+        """
+        old = _Snapshot([], [], {}) if replace else self._snapshot
+        customers = old.customers
+        if orders:
+            customers = dict(customers)
+            customers.update(orders)
+        new_ids = [f"{order_id.upper()}{_SEPARATOR}{order_id}" for order_id, _ in orders]
+        new_ids += [f"{tracking_number.upper()}{_SEPARATOR}{order_id}" for tracking_number, order_id in shipments]
+        new_names = [f"{token}{_SEPARATOR}{order_id}"
+                     for order_id, customer_name in orders for token in set(_tokenize(customer_name or ""))]
+        self._snapshot = _Snapshot(_merged(old.id_keys, new_ids), _merged(old.name_keys, new_names), customers)
+
+    def refresh(self, session):
+        """Pulls recent orders and shipments, or everything on first load and when a full reload is due."""
+        full = self.loaded_at is None or time.time() - self.loaded_at > self.full_reload_seconds
+        order_where = shipment_where = ""
+        if not full and self.order_watermark is not None:
+            # Orders at the watermark are pulled again, so orders sharing its timestamp are never lost
+            recent = self.order_watermark - datetime.timedelta(days=RECENT_SHIPMENT_DAYS)
+            order_where = f"WHERE o.ORDER_DATE >= {sql_literal(self.order_watermark)}"
+            shipment_where = (f"AND s.ORDER_ID IN (SELECT ORDER_ID FROM Orders "
+                              f"WHERE ORDER_DATE >= {sql_literal(recent)})")
+        order_rows = session.sql(ORDERS_QUERY.format(where=order_where)).collect()
+        shipment_rows = session.sql(SHIPMENTS_QUERY.format(where=shipment_where)).collect()
+        self.add([(row.ORDER_ID, row.CUSTOMER_NAME) for row in order_rows],
+                 [(row.TRACKING_NUMBER, row.ORDER_ID) for row in shipment_rows], replace=full)
+        order_dates = [row.ORDER_DATE for row in order_rows if row.ORDER_DATE is not None]
+        if order_dates:
+            self.order_watermark = max(order_dates) if full else max(max(order_dates), self.order_watermark)
+        self.refreshed_at = time.time()
+        if full:
+            self.loaded_at = self.refreshed_at
+        logger.debug(f"Search index {'loaded' if full else 'refreshed'}: "
+                     f"{len(order_rows)} orders, {len(shipment_rows)} shipments")
+
+    ###########################################################################
+    # Lookups
+    ###########################################################################
+    def lookup(self, text, limit=SUGGESTION_LIMIT):
+        """
+        Returns suggestions for partially typed search text, without touching the warehouse.
+
+        Args:
+            text (str): An order ID or tracking number prefix, or words of a customer name.
+            limit (int): Maximum number of suggestions.
+
+        Returns:
+            list: ``Suggestion`` rows; exact ID and tracking number matches come first.
+        """
+        text = text.strip()
+        if not text:
+            return []
+        snapshot = self._snapshot
+        suggestions = []
+        start, end = _prefix_range(snapshot.id_keys, text.upper())
+        for entry in snapshot.id_keys[start:min(end, start + limit)]:
+            key, order_id = entry.split(_SEPARATOR)
+            customer_name = snapshot.customers.get(order_id, "")
+            if key == order_id.upper():
+                suggestions.append(Suggestion("order", key, order_id, f"{key} · {customer_name}"))
+            else:
+                suggestions.append(Suggestion("tracking", key, order_id, f"{key} → {order_id} · {customer_name}"))
+
+        tokens = _tokenize(text)
+        if len(suggestions) < limit and tokens:
+            # Walk the most selective range, checking completed tokens against their posting
+            # lists by binary search and the token being typed against the customer's name.
+            *complete, partial = tokens
+            keys = snapshot.name_keys
+            ranges = {token: _prefix_range(keys, token + _SEPARATOR) for token in complete}
+            ranges[None] = _prefix_range(keys, partial)
+            walked = min(ranges, key=lambda token: ranges[token][1] - ranges[token][0])
+            start, end = ranges.pop(walked)
+            checks = [(token + _SEPARATOR, *bounds) for token, bounds in ranges.items() if token is not None]
+            starts_partial = re.compile(r"(?:^|[\s,])" + re.escape(partial), re.IGNORECASE)
+            seen = {suggestion.order_id for suggestion in suggestions}
+            for entry in keys[start:min(end, start + SCAN_LIMIT)]:
+                order_id = entry.split(_SEPARATOR)[1]
+                if order_id in seen:
+                    continue
+                seen.add(order_id)
+                for prefix, low, high in checks:
+                    key = prefix + order_id
+                    position = bisect.bisect_left(keys, key, low, high)
+                    if position == high or keys[position] != key:
+                        break
+                else:
+                    customer_name = snapshot.customers[order_id]
+                    if walked is None or starts_partial.search(customer_name):
+                        suggestions.append(Suggestion("customer", customer_name, order_id,
+                                                      f"{customer_name} → {order_id}"))
+                        if len(suggestions) == limit:
+                            break
+        return suggestions
+
+    def suggest(self, session, text, limit=SUGGESTION_LIMIT):
+        """``lookup`` after making sure the index is loaded and reasonably fresh."""
+        self.ensure_fresh(session)
+        return self.lookup(text, limit)
+
+
+# Process-wide instance shared by every Streamlit session.
+search_index = SearchIndex()
+
+
+if __name__ == "__main__":
+    import random
+
+    rng = random.Random(7)
+    first_names = ["ana", "ben", "chloe", "dev", "elena", "farid", "grace", "hiro", "ines", "jon"]
+    last_names = ["smith", "garcia", "chen", "okafor", "novak", "silva", "kim", "patel", "berg", "moreau"]
+    order_count = 1_000_000
+    index = SearchIndex()
+    started = time.perf_counter()
+    index.add(
+        [(f"ORD-{i:07d}", f"{rng.choice(first_names)} {rng.choice(last_names)} {i % 5000}") for i in range(order_count)],
+        [(f"1Z{i:010d}", f"ORD-{i:07d}") for i in range(order_count)],
+    )
+    print(f"bulk load of {order_count:,} orders: {time.perf_counter() - started:.1f}s")
+    started = time.perf_counter()
+    index.add([(f"ORD-{order_count + i:07d}", f"new customer {i}") for i in range(100)], [])
+    print(f"incremental add of 100 orders: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    # "smith garcia" pairs two common tokens that never occur together
+    keystrokes = ["O", "OR", "ORD-", "ORD-00", "ORD-0012", "1Z00000", "1Z0000012345", "g", "gr", "grace",
+                  "grace ch", "grace chen", "grace chen 42", "elena sil", "smith garcia", "smith garcia 4"]
+    worst = 0.0
+    for text in keystrokes:
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            suggestions = index.lookup(text)
+            timings.append((time.perf_counter() - started) * 1000)
+        elapsed = sorted(timings)[2]
+        worst = max(worst, elapsed)
+        print(f"{text!r:<18} {len(suggestions)} suggestions in {elapsed:.2f} ms (median of 5, first {timings[0]:.2f} ms)")
+    print(f"worst keystroke: {worst:.2f} ms")
+    assert worst < 5, worst
+
+    # Against the local fake session: an order whose ID sorts below every indexed one is
+    # found by the incremental refresh, and a late shipment by the next full reload.
+    from local_session import LocalSession
+
+    session = LocalSession()
+    index = SearchIndex()
+    index.ensure_fresh(session)
+    session._conn.execute("INSERT INTO Orders VALUES ('ORD-0000', 'CUST-0001', 'Shipped', '2025-04-08 12:00:00', "
+                          "NULL, NULL, '2025-04-08 12:00:00')")
+    session._conn.execute("INSERT INTO Shipments VALUES ('SHP-LATE', 'ORD-0001', 'In Transit', '1ZLATE', "
+                          "'2025-04-08 12:00:00')")
+    index.refresh(session)
+    assert [s.order_id for s in index.lookup("ORD-0000")] == ["ORD-0000"] and not index.lookup("1ZLATE")
+    index.loaded_at -= index.full_reload_seconds + 1
+    index.refresh(session)
+    assert [s.order_id for s in index.lookup("1ZLATE")] == ["ORD-0001"]
+    assert len(index.lookup("ORD-000", limit=100)) == 10  # Re-pulled rows are indexed once
+    print("local session: low-sorting order found incrementally, late shipment after a full reload")
+
+    # ORDER_DATE declared as DATE comes back as ``datetime.date``, and the incremental
+    # refresh must still build its WHERE clause from it.
+    import sqlite3
+
+    sqlite3.register_converter("DAY", lambda raw: datetime.date.fromisoformat(raw.decode()))
+    session = LocalSession()
+    columns = [row[1] for row in session._conn.execute("PRAGMA table_info(Orders)")]
+    session._conn.executescript(f"""
+        CREATE TABLE Orders_days ({', '.join(c + ' DAY' if c == 'ORDER_DATE' else c for c in columns)});
+        INSERT INTO Orders_days SELECT {', '.join('date(ORDER_DATE)' if c == 'ORDER_DATE' else c for c in columns)} FROM Orders;
+        DROP TABLE Orders;
+        ALTER TABLE Orders_days RENAME TO Orders;
+    """)
+    index = SearchIndex()
+    index.ensure_fresh(session)
+    assert type(index.order_watermark) is datetime.date, index.order_watermark
+    session._conn.execute("INSERT INTO Orders VALUES ('ORD-0000', 'CUST-0001', 'Shipped', ?, NULL, NULL, "
+                          "'2025-04-08 12:00:00')", (index.order_watermark.isoformat(),))
+    index.refresh(session)
+    assert [s.order_id for s in index.lookup("ORD-0000")] == ["ORD-0000"]
+    print("local session: incremental refresh against a DATE watermark")
@@ -0,0 +1,263 @@
+"""
+Offline batch pipeline assigning sentiment buckets to call transcript lines.
+
+The buckets in ``CALL_TRANSCRIPTS`` come from an upstream process, so bucket definitions
+cannot be changed or re-applied locally. This pipeline re-derives them with a configurable
+scorer working on whole Arrow batches at a time:
+
+* ``ThresholdScorer`` cuts a numeric sentiment score column at fixed thresholds.
+* ``LexiconScorer`` scores free text against a word -> weight lexicon, then applies the
+  same thresholds.
+
+Input is streamed in chunks (``iter_parquet``, or ``fetch_arrow_batches`` from
+warehouse_fetch.py), and each bucketed chunk is handed to a sink that writes the
+assignments back (``ParquetSink``, ``SQLiteBucketSink``). Buckets are named with
+``SENTIMENT_BUCKET_ORDER``, so the output needs no alias mapping at render time.
+
+Usage:
+    python sentiment_bucketing.py                      # benchmark on 1M generated lines
+    python sentiment_bucketing.py in.parquet out.parquet [--column SENTIMENT_SCORE]
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from result_schemas import SENTIMENT_BUCKET_ORDER
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# Upper bounds (exclusive) of every bucket but the last, for scores in [-1, 1].
+DEFAULT_THRESHOLDS = [-0.6, -0.2, 0.2, 0.6]
+
+DEFAULT_LEXICON = {
+    "terrible": -1.0, "awful": -1.0, "angry": -0.9, "unacceptable": -0.9, "worst": -1.0,
+    "late": -0.5, "missing": -0.6, "broken": -0.7, "damaged": -0.7, "wrong": -0.5, "refund": -0.3,
+    "delay": -0.4, "delayed": -0.4, "frustrated": -0.8, "cancel": -0.5,
+    "okay": 0.1, "fine": 0.2, "thanks": 0.5, "thank": 0.5, "good": 0.6, "helpful": 0.7,
+    "great": 0.8, "perfect": 0.9, "excellent": 1.0, "love": 0.9, "appreciate": 0.7, "resolved": 0.6,
+}
+
+BUCKET_COLUMN = "SENTIMENT_BUCKET"
+BATCH_SIZE = 100_000
+
+
+###############################################################################
+# 1. Scorers
+###############################################################################
+class ThresholdScorer:
+    """
+    Buckets a numeric sentiment score column.
+
+    Args:
+        column (str): Score column, expected in [-1, 1].
+        thresholds (list): Ascending cut points; ``len(labels) - 1`` of them.
+        labels (list): Bucket names, most negative first.
+    """
+
+    def __init__(self, column="SENTIMENT_SCORE", thresholds=DEFAULT_THRESHOLDS, labels=SENTIMENT_BUCKET_ORDER):
+        if len(thresholds) != len(labels) - 1:
+            raise ValueError(f"{len(labels)} buckets need {len(labels) - 1} thresholds, got {len(thresholds)}.")
+        self.column = column
+        self.thresholds = np.asarray(thresholds, dtype="float64")
+        self.labels = pa.array(labels, type=pa.string())
+
+    def scores(self, batch):
+        return batch.column(self.column).to_numpy(zero_copy_only=False).astype("float64", copy=False)
+
+    def buckets(self, batch):
+        """Returns the batch's buckets as a dictionary-encoded Arrow array."""
+        scores = np.nan_to_num(self.scores(batch), nan=0.0)  # Missing scores count as neutral
+        indices = np.searchsorted(self.thresholds, scores, side="right").astype("int8")
+        return pa.DictionaryArray.from_arrays(pa.array(indices), self.labels)
+
+
+class LexiconScorer(ThresholdScorer):
+    """
+    Buckets free-text lines by the mean weight of their lexicon words.
+
+    Lines without any lexicon word score 0 (neutral).
+
+    Args:
+        column (str): Text column.
+        lexicon (dict): Lower-case word -> weight in [-1, 1].
+        thresholds (list): As for ``ThresholdScorer``.
+        labels (list): As for ``ThresholdScorer``.
+    """
+
+    def __init__(self, column="LINE_TEXT", lexicon=DEFAULT_LEXICON, thresholds=DEFAULT_THRESHOLDS,
+                 labels=SENTIMENT_BUCKET_ORDER):
+        super().__init__(column, thresholds, labels)
+        self.words = pa.array(list(lexicon), type=pa.string())
+        self.weights = np.asarray(list(lexicon.values()), dtype="float64")
+
+    def scores(self, batch):
+        text = pc.replace_substring_regex(pc.utf8_lower(batch.column(self.column)), r"[^a-z' ]+", " ")
+        tokens = pc.utf8_split_whitespace(text)
+        rows = pc.list_parent_indices(tokens).to_numpy()
+        word_index = pc.index_in(pc.list_flatten(tokens), value_set=self.words)
+        matched = word_index.is_valid().to_numpy(zero_copy_only=False)
+        rows = rows[matched]
+        weights = self.weights[word_index.drop_null().to_numpy()]
+        totals = np.bincount(rows, weights=weights, minlength=batch.num_rows)
+        counts = np.bincount(rows, minlength=batch.num_rows)
+        return np.divide(totals, counts, out=np.zeros(batch.num_rows), where=counts > 0)
+
+
+###############################################################################
+# 2. Streaming sources and sinks
+###############################################################################
+def iter_parquet(path, batch_size=BATCH_SIZE, columns=None):
+    """Streams a Parquet file as Arrow record batches."""
+    yield from pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns)
+
+
+class ParquetSink:
+    """Appends bucketed batches to a Parquet file; use as a context manager."""
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+
+    def __call__(self, batch):
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, batch.schema)
+        self._writer.write_batch(batch)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class SQLiteBucketSink:
+    """
+    Writes bucket assignments back to a transcript table keyed by conversation and line.
+
+    Args:
+        conn (sqlite3.Connection): Database holding the table, e.g. ``LocalSession._conn``.
+        table (str): Transcript table name.
+        keys (tuple): Columns identifying a line.
+    """
+
+    def __init__(self, conn, table="CALL_TRANSCRIPTS", keys=("CONVERSATION_ID", "LINE_NUMBER")):
+        self.conn = conn
+        self.keys = keys
+        where = " AND ".join(f"{key} = ?" for key in keys)
+        self.statement = f"UPDATE {table} SET sentiment_bucket = ? WHERE {where}"
+
+    def __call__(self, batch):
+        columns = [batch.column(BUCKET_COLUMN).cast(pa.string()).to_pylist()]
+        columns += [batch.column(key).to_pylist() for key in self.keys]
+        self.conn.executemany(self.statement, zip(*columns))
+        self.conn.commit()
+
+
+###############################################################################
+# 3. Pipeline
+###############################################################################
+def bucket_batches(batches, scorer):
+    """Yields each input batch with its ``SENTIMENT_BUCKET`` column set by ``scorer``."""
+    for batch in batches:
+        if isinstance(batch, pa.Table):
+            batch = batch.combine_chunks().to_batches()[0] if batch.num_rows else None
+        if batch is None or not batch.num_rows:
+            continue
+        names, arrays = batch.schema.names, list(batch.columns)
+        if BUCKET_COLUMN in names:
+            arrays[names.index(BUCKET_COLUMN)] = scorer.buckets(batch)
+        else:
+            names.append(BUCKET_COLUMN)
+            arrays.append(scorer.buckets(batch))
+        batch = pa.RecordBatch.from_arrays(arrays, names=names)
+        yield batch
+
+
+def run_pipeline(batches, scorer, sink):
+    """
+    Buckets a stream of batches and hands each result to ``sink``.
+
+    Args:
+        batches (iterable): Arrow record batches or tables.
+        scorer: ``ThresholdScorer`` or ``LexiconScorer``.
+        sink (callable): Called with every bucketed batch.
+
+    Returns:
+        dict: ``lines``, ``seconds``, ``lines_per_second`` and per-bucket ``counts``.
+    """
+    started = time.perf_counter()
+    lines = 0
+    counts = dict.fromkeys(scorer.labels.to_pylist(), 0)
+    for batch in bucket_batches(batches, scorer):
+        sink(batch)
+        lines += batch.num_rows
+        indices = batch.column(BUCKET_COLUMN).indices.to_numpy()
+        for label, count in zip(counts, np.bincount(indices, minlength=len(counts))):
+            counts[label] += int(count)
+    seconds = time.perf_counter() - started
+    logger.info(f"Bucketed {lines:,} lines in {seconds:.2f}s")
+    return {"lines": lines, "seconds": seconds, "lines_per_second": lines / seconds if seconds else 0.0,
+            "counts": counts}
+
+
+###############################################################################
+# 4. Benchmark data
+###############################################################################
+def generate_lines(lines, batch_size=BATCH_SIZE, seed=7):
+    """Yields record batches of synthetic transcript lines with a score and text per line."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(list(DEFAULT_LEXICON) + ["the", "order", "package", "is", "my", "was", "today",
+                                                    "delivery", "when", "will", "it", "arrive", "please"])
+    for start in range(0, lines, batch_size):
+        size = min(batch_size, lines - start)
+        words = vocabulary[rng.integers(0, len(vocabulary), (size, 8))]
+        text = [" ".join(row) for row in words]
+        yield pa.RecordBatch.from_arrays([
+            pa.array(np.char.add("CONV-", (rng.integers(0, 50_000, size)).astype(str))),
+            pa.array(np.arange(start, start + size, dtype="int64")),
+            pa.array(np.clip(rng.normal(0, 0.45, size), -1, 1)),
+            pa.array(text),
+        ], names=["CONVERSATION_ID", "LINE_NUMBER", "SENTIMENT_SCORE", "LINE_TEXT"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assign sentiment buckets to transcript lines offline.")
+    parser.add_argument("input", nargs="?", help="Parquet file of transcript lines (omit to benchmark).")
+    parser.add_argument("output", nargs="?", help="Parquet file to write the bucketed lines to.")
+    parser.add_argument("--column", default="SENTIMENT_SCORE", help="Numeric score column, or text column with --lexicon.")
+    parser.add_argument("--lexicon", action="store_true", help="Score text with the default lexicon.")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Benchmark size.")
+    args = parser.parse_args(argv)
+
+    scorer = LexiconScorer(args.column) if args.lexicon else ThresholdScorer(args.column)
+    if args.input:
+        if not args.output:
+            parser.error("output is required with an input file")
+        with ParquetSink(args.output) as sink:
+            stats = run_pipeline(iter_parquet(args.input), scorer, sink)
+        print(f"{stats['lines']:,} lines, {stats['lines_per_second']:,.0f} lines/s: {stats['counts']}")
+        return
+
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "lines.parquet")
+        with ParquetSink(source) as sink:
+            for batch in generate_lines(args.lines):
+                sink(batch)
+        for name, scorer in (("thresholds", ThresholdScorer()), ("lexicon", LexiconScorer())):
+            with ParquetSink(os.path.join(directory, f"{name}.parquet")) as sink:
+                stats = run_pipeline(iter_parquet(source), scorer, sink)
+            print(f"{name:<11} {stats['lines']:,} lines in {stats['seconds']:.2f}s "
+                  f"= {stats['lines_per_second']:,.0f} lines/s  {stats['counts']}")
+
+
+if __name__ == "__main__":
+    main()
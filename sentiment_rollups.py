@@ -0,0 +1,288 @@
+"""
+Daily and weekly sentiment rollups per customer, for account trend views.
+
+The rollups hold, per customer and period, the bucket line counts that call_transcript.py
+derives from raw transcript lines. For every conversation the customer spoke in, that is
+the bucket counts of all customer-side lines, plus the customer's own line count.
+``rollup_score`` over any run of periods therefore equals ``calculate_sentiment_score`` over
+the conversations in that window, and a trend reads one row per period instead of
+re-aggregating lines.
+
+Refreshes are incremental. The warehouse returns lines grouped by conversation, date,
+speaker and bucket, from the start of the week holding the newest call already rolled up.
+Every daily and weekly period from that point on is rebuilt and replaced, so a refresh is
+idempotent. Lines that arrive late for older weeks need ``rebuild``.
+"""
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from background_refresh import BackgroundRefresh
+from result_schemas import SENTIMENT_BUCKET_ALIASES, SENTIMENT_BUCKET_ORDER
+from warehouse_fetch import fetch_arrow
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# Seconds before a read triggers a background refresh.
+REFRESH_SECONDS = 300
+
+# Same weights and perfect-line weight as the Account Sentiment page.
+SENTIMENT_WEIGHTS = {"Very Negative": 1, "Negative": 2, "Neutral": 3, "Positive": 4, "Very Positive": 5}
+PERFECT_WEIGHT = 5
+
+GRANULARITIES = {"daily": "SENTIMENT_ROLLUP_DAILY", "weekly": "SENTIMENT_ROLLUP_WEEKLY"}
+
+# Bucket count columns; buckets outside SENTIMENT_BUCKET_ORDER (weight 0) go to OTHER_LINES.
+BUCKET_COLUMNS = {bucket: bucket.upper().replace(" ", "_") + "_LINES" for bucket in SENTIMENT_BUCKET_ORDER}
+OTHER_COLUMN = "OTHER_LINES"
+
+SOURCE_QUERY = """
+    SELECT CONVERSATION_ID, CALL_DATE, SPEAKER_ID, sentiment_bucket, COUNT(*) AS LINE_COUNT
+    FROM CALL_TRANSCRIPTS
+    WHERE IS_CUSTOMER = 'TRUE' {where}
+    GROUP BY CONVERSATION_ID, CALL_DATE, SPEAKER_ID, sentiment_bucket
+"""
+
+
+def period_start(dates, granularity):
+    """Start of the day, or of the Monday-based week, holding each date."""
+    days = pd.to_datetime(dates).dt.normalize()
+    if granularity == "weekly":
+        return days - pd.to_timedelta(days.dt.weekday, unit="D")
+    return days
+
+
+def rollup_score(rows, weights=SENTIMENT_WEIGHTS):
+    """
+    Sentiment score over rollup rows, computed exactly as ``calculate_sentiment_score``.
+
+    Args:
+        rows (pd.DataFrame): Rollup rows (any number of periods).
+        weights (dict): Bucket -> weight.
+
+    Returns:
+        int: Percentage of the perfect score, truncated like the page does.
+    """
+    total_bucket_score = sum(weights.get(bucket, 0) * int(rows[column].sum()) for bucket, column in BUCKET_COLUMNS.items())
+    perfect_score = int(rows["CUSTOMER_LINES"].sum()) * PERFECT_WEIGHT
+    return int((total_bucket_score / perfect_score) * 100) if perfect_score > 0 else 0
+
+
+def build_rollups(lines, granularity):
+    """
+    Aggregates grouped transcript lines (see ``SOURCE_QUERY``) into rollup rows.
+
+    Returns:
+        pd.DataFrame: One row per customer and period start.
+    """
+    lines = lines.rename(columns=str.upper)
+    lines["SENTIMENT_BUCKET"] = lines["SENTIMENT_BUCKET"].replace(SENTIMENT_BUCKET_ALIASES)
+    lines["BUCKET_COLUMN"] = lines["SENTIMENT_BUCKET"].map(BUCKET_COLUMNS).fillna(OTHER_COLUMN)
+    lines["PERIOD_START"] = period_start(lines["CALL_DATE"], granularity)
+
+    # Bucket counts of every customer-side line, per conversation and period
+    conversation_buckets = lines.pivot_table(index=["CONVERSATION_ID", "PERIOD_START"], columns="BUCKET_COLUMN",
+                                             values="LINE_COUNT", aggfunc="sum", fill_value=0)
+    conversation_buckets = conversation_buckets.reindex(columns=[*BUCKET_COLUMNS.values(), OTHER_COLUMN], fill_value=0)
+    # Each speaker's own lines; the speaker owns the conversation's bucket counts in their rollup
+    speaker_lines = lines.groupby(["CONVERSATION_ID", "PERIOD_START", "SPEAKER_ID"])["LINE_COUNT"].sum().rename("CUSTOMER_LINES")
+    contributions = speaker_lines.reset_index().join(conversation_buckets, on=["CONVERSATION_ID", "PERIOD_START"])
+
+    rollups = contributions.groupby(["SPEAKER_ID", "PERIOD_START"]).agg(
+        CONVERSATIONS=("CONVERSATION_ID", "nunique"),
+        CUSTOMER_LINES=("CUSTOMER_LINES", "sum"),
+        **{column: (column, "sum") for column in [*BUCKET_COLUMNS.values(), OTHER_COLUMN]},
+    ).reset_index().rename(columns={"SPEAKER_ID": "CUSTOMER_ID"})
+    rollups["PERIOD_START"] = rollups["PERIOD_START"].dt.date
+    return rollups
+
+
+class SentimentRollups(BackgroundRefresh):
+    """
+    SQLite-backed daily and weekly rollup tables, refreshed incrementally from the warehouse.
+
+    Args:
+        path (str): SQLite database file (``":memory:"`` keeps the rollups in process).
+        refresh_seconds (float): Age after which a read starts a background refresh.
+    """
+
+    thread_name = "sentiment-rollup-refresh"
+    description = "Sentiment rollups"
+
+    def __init__(self, path=":memory:", refresh_seconds=REFRESH_SECONDS):
+        super().__init__(refresh_seconds)
+        self._lock = threading.Lock()  # Guards the SQLite connection
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        counts = ", ".join(f"{column} INTEGER" for column in [*BUCKET_COLUMNS.values(), OTHER_COLUMN])
+        for table in GRANULARITIES.values():
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (CUSTOMER_ID TEXT, PERIOD_START TEXT, CONVERSATIONS INTEGER, "
+                f"CUSTOMER_LINES INTEGER, {counts}, PRIMARY KEY (CUSTOMER_ID, PERIOD_START))"
+            )
+        self._conn.commit()
+        self.watermark = self._conn.execute(f"SELECT MAX(PERIOD_START) FROM {GRANULARITIES['daily']}").fetchone()[0]
+
+    ###########################################################################
+    # Maintenance
+    ###########################################################################
+    def refresh(self, session):
+        """
+        Rebuilds every period from the start of the newest rolled-up week onwards.
+
+        Returns:
+            int: Number of grouped source rows read.
+        """
+        cutoff = None
+        if self.watermark is not None:
+            cutoff = period_start(pd.Series([self.watermark]), "weekly").iloc[0].date()
+        where = f"AND CALL_DATE >= '{cutoff.isoformat()}'" if cutoff else ""
+        lines = fetch_arrow(session, SOURCE_QUERY.format(where=where)).to_pandas()
+        with self._lock:
+            for granularity, table in GRANULARITIES.items():
+                if cutoff:
+                    self._conn.execute(f"DELETE FROM {table} WHERE PERIOD_START >= ?", (cutoff.isoformat(),))
+                else:
+                    self._conn.execute(f"DELETE FROM {table}")
+                if lines.empty:
+                    continue
+                rollups = build_rollups(lines.copy(), granularity)
+                rollups["PERIOD_START"] = rollups["PERIOD_START"].map(datetime.date.isoformat)
+                placeholders = ", ".join("?" for _ in rollups.columns)
+                self._conn.executemany(f"INSERT INTO {table} ({', '.join(rollups.columns)}) VALUES ({placeholders})",
+                                       rollups.itertuples(index=False, name=None))
+            self._conn.commit()
+            self.watermark = self._conn.execute(f"SELECT MAX(PERIOD_START) FROM {GRANULARITIES['daily']}").fetchone()[0]
+        self.refreshed_at = time.time()
+        logger.debug(f"Sentiment rollups refreshed from {cutoff or 'the beginning'}: {len(lines)} source rows")
+        return len(lines)
+
+    def rebuild(self, session):
+        """Rebuilds all rollups from scratch, e.g. after backfilled or re-bucketed transcripts."""
+        self.watermark = None
+        return self.refresh(session)
+
+    ###########################################################################
+    # Reads
+    ###########################################################################
+    def periods(self, customer_id, granularity="weekly", start=None, end=None):
+        """
+        Returns a customer's rollup rows in ``[start, end)``, oldest first.
+
+        Args:
+            customer_id (str): Customer (speaker) ID.
+            granularity (str): ``"daily"`` or ``"weekly"``.
+            start (datetime.date): First period start to include (default: all).
+            end (datetime.date): Period start to stop before (default: all).
+        """
+        query = f"SELECT * FROM {GRANULARITIES[granularity]} WHERE CUSTOMER_ID = ?"
+        params = [customer_id]
+        if start is not None:
+            query += " AND PERIOD_START >= ?"
+            params.append(start.isoformat())
+        if end is not None:
+            query += " AND PERIOD_START < ?"
+            params.append(end.isoformat())
+        with self._lock:
+            rows = pd.read_sql_query(query + " ORDER BY PERIOD_START", self._conn, params=params)
+        rows["PERIOD_START"] = pd.to_datetime(rows["PERIOD_START"])
+        return rows
+
+    def trend(self, customer_id, granularity="weekly", start=None, end=None, weights=SENTIMENT_WEIGHTS):
+        """
+        Per-period sentiment scores for a customer; cost grows with periods, not transcript lines.
+
+        Returns:
+            pd.DataFrame: ``PERIOD_START``, ``CONVERSATIONS``, ``CUSTOMER_LINES`` and ``SCORE``.
+        """
+        rows = self.periods(customer_id, granularity, start, end)
+        total_bucket_score = sum(weights.get(bucket, 0) * rows[column] for bucket, column in BUCKET_COLUMNS.items())
+        perfect_score = rows["CUSTOMER_LINES"] * PERFECT_WEIGHT
+        # Same float division and truncation as rollup_score, one period per row
+        rows["SCORE"] = (total_bucket_score / perfect_score.where(perfect_score > 0) * 100).fillna(0).astype(int)
+        return rows[["PERIOD_START", "CONVERSATIONS", "CUSTOMER_LINES", "SCORE"]]
+
+    def window_score(self, customer_id, start=None, end=None, granularity="daily", weights=SENTIMENT_WEIGHTS):
+        """Sentiment score over all periods in ``[start, end)``."""
+        return rollup_score(self.periods(customer_id, granularity, start, end), weights)
+
+
+_rollups = {}
+_rollups_lock = threading.Lock()
+
+
+def get_sentiment_rollups(path=":memory:"):
+    """Returns the process-wide rollups for ``path``, creating them on first use."""
+    with _rollups_lock:
+        if path not in _rollups:
+            _rollups[path] = SentimentRollups(path)
+        return _rollups[path]
+
+
+if __name__ == "__main__":
+    # Exactness against the page's per-line calculation, over full history and sub-windows,
+    # before and after an incremental refresh with newly arrived calls.
+    from local_session import LocalSession
+
+    session = LocalSession(customers=25, conversations_per_customer=30)
+    rollups = SentimentRollups()
+    print(f"initial load: {rollups.refresh(session)} grouped source rows")
+
+    def reference_score(customer_id, start=None, end=None):
+        _, rows = session._execute(
+            "SELECT CONVERSATION_ID, CALL_DATE, SPEAKER_ID, sentiment_bucket FROM CALL_TRANSCRIPTS WHERE IS_CUSTOMER = 'TRUE'")
+        lines = pd.DataFrame.from_records(rows, columns=["conversation_id", "call_date", "speaker_id", "sentiment_bucket"])
+        if start is not None:
+            lines = lines[lines["call_date"] >= pd.Timestamp(start)]
+        if end is not None:
+            lines = lines[lines["call_date"] < pd.Timestamp(end)]
+        lines["sentiment_bucket"] = lines["sentiment_bucket"].replace(SENTIMENT_BUCKET_ALIASES)
+        conversations = lines.loc[lines["speaker_id"] == customer_id, "conversation_id"].unique()
+        mine = lines[lines["conversation_id"].isin(conversations)]
+        total_bucket_score = sum(SENTIMENT_WEIGHTS.get(bucket, 0) for bucket in mine["sentiment_bucket"])
+        perfect_score = int((lines["speaker_id"] == customer_id).sum()) * PERFECT_WEIGHT
+        return int((total_bucket_score / perfect_score) * 100) if perfect_score > 0 else 0
+
+    def check(label):
+        # Weekly rollups answer Monday-aligned windows; daily rollups answer any window.
+        windows = [("weekly", None, None), ("weekly", datetime.date(2025, 2, 17), datetime.date(2025, 3, 17)),
+                   ("daily", None, None), ("daily", datetime.date(2025, 3, 1), None),
+                   ("daily", datetime.date(2025, 2, 20), datetime.date(2025, 3, 9))]
+        mismatches = 0
+        for c in range(1, 26):
+            customer_id = f"CUST-{c:04d}"
+            for granularity, start, end in windows:
+                if rollups.window_score(customer_id, start, end, granularity) != reference_score(customer_id, start, end):
+                    mismatches += 1
+        print(f"{label}: {mismatches} mismatches over {25 * len(windows)} customer windows")
+        assert mismatches == 0
+
+    check("full load")
+    new_lines = [(f"CONV-9{i:04d}", datetime.datetime(2025, 4, 9, 10), "CUST-0003" if i % 2 else "AGENT-01",
+                  "FALSE" if i % 2 == 0 else "TRUE", i, ["Very Positive", "Slightly Negative"][i % 3 == 0]) for i in range(40)]
+    session._conn.executemany("INSERT INTO CALL_TRANSCRIPTS VALUES (?, ?, ?, ?, ?, ?)", new_lines)
+    print(f"incremental refresh: {rollups.refresh(session)} grouped source rows")
+    check("after incremental refresh")
+    for c in range(1, 26):
+        trend = rollups.trend(f"CUST-{c:04d}", "daily")
+        periods = rollups.periods(f"CUST-{c:04d}", "daily")
+        assert list(trend["SCORE"]) == [rollup_score(periods.iloc[[i]]) for i in range(len(periods))]
+
+    started = time.perf_counter()
+    trend = rollups.trend("CUST-0003", "weekly")
+    print(f"weekly trend for CUST-0003 ({len(trend)} periods) in {(time.perf_counter() - started) * 1000:.1f} ms")
+    print(trend.tail().to_string(index=False))
+
+    # Sessions arriving together on a fresh process share one first load.
+    from concurrent.futures import ThreadPoolExecutor
+
+    session.latency = 0.2
+    fresh = SentimentRollups()
+    queries = session.query_count
+    with ThreadPoolExecutor(20) as pool:
+        list(pool.map(lambda _: fresh.ensure_fresh(session), range(20)))
+    assert session.query_count == queries + 1, session.query_count - queries
+    print(f"20 concurrent first reads -> {session.query_count - queries} source query")
@@ -0,0 +1,452 @@
+"""
+Bulk detector for stalled shipments over the Tracking table.
+
+The scan streams every carrier scan ordered by shipment and time, in Arrow chunks (see
+``fetch_arrow_batches`` in warehouse_fetch.py), and works on each chunk with vectorized
+NumPy operations. A shipment is an exception when:
+
+* the furthest status it has reached (by ``STATUS_ORDER`` rank) was reached longer ago
+  than that status's limit in ``STALL_LIMIT_HOURS``; or
+* a later scan reports an earlier status than one already reached (it moved backwards).
+
+Only the scans of the shipment straddling a chunk boundary are carried over to the next
+chunk, and exceptions are kept in a bounded heap of the worst ``top`` shipments. So
+memory stays flat however many scan events there are, and time grows linearly with them.
+
+The order page's ``StallMonitor`` also keeps every flagged shipment in sorted NumPy arrays
+keyed by tracking number (about 60 bytes each), so a lookup is a binary search and finds
+shipments the ranking left out. To keep those arrays bounded by recent volume rather than
+all history, the monitor scans only shipments with a scan in the last ``RECENT_DAYS``
+(their whole history, so furthest statuses stay right). Shipments silent for longer drop
+out of the page; the command line still scans the full history.
+"""
+import argparse
+import datetime
+import heapq
+import logging
+import time
+from collections import namedtuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from background_refresh import BackgroundRefresh
+from result_schemas import STATUS_ORDER
+from warehouse_fetch import fetch_arrow_batches, sql_literal
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# Hours a shipment may sit at its furthest status before it counts as stalled.
+# Delivered is terminal and never stalls.
+STALL_LIMIT_HOURS = {
+    "Label Created": 48,
+    "Shipment Information Received": 48,
+    "Picked Up": 24,
+    "Departed from Origin Facility": 36,
+    "In Transit": 72,
+    "Arrived at Carrier Facility": 36,
+    "Out for Delivery": 12,
+}
+
+# Added to the overdue ratio of a shipment that moved backwards, so those rank near the top.
+BACKWARDS_WEIGHT = 2.0
+
+# Exceptions kept, worst first.
+TOP_EXCEPTIONS = 1000
+
+# Seconds before the process-wide monitor rescans in the background.
+REFRESH_SECONDS = 900
+
+# Days back a shipment's last scan may be for the process-wide monitor to include it.
+RECENT_DAYS = 30
+
+TRACKING_SCAN_QUERY = """
+    SELECT SHIPMENT_ID, TRACKING_NUMBER, STATUS_UPDATE, TIMESTAMP
+    FROM Tracking
+    ORDER BY SHIPMENT_ID, TIMESTAMP
+"""
+
+# ``{since}`` is a SQL timestamp literal.
+RECENT_SCAN_QUERY = """
+    SELECT SHIPMENT_ID, TRACKING_NUMBER, STATUS_UPDATE, TIMESTAMP
+    FROM Tracking
+    WHERE SHIPMENT_ID IN (SELECT SHIPMENT_ID FROM Tracking WHERE TIMESTAMP >= {since})
+    ORDER BY SHIPMENT_ID, TIMESTAMP
+"""
+
+StalledShipment = namedtuple(
+    "StalledShipment",
+    ["shipment_id", "tracking_number", "status", "furthest_status", "stalled_hours", "limit_hours",
+     "moved_backwards", "last_scan", "severity"],
+)
+
+# ``flagged_shipments`` is None unless the detector was asked to keep every flagged shipment.
+ScanReport = namedtuple("ScanReport", ["exceptions", "shipments", "events", "flagged", "as_of", "seconds",
+                                       "flagged_shipments"])
+
+# Parallel arrays of every flagged shipment, sorted by tracking number.
+_FLAGGED_FIELDS = ["tracking_numbers", "shipment_ids", "rank", "furthest_rank", "stalled_us", "limit_us",
+                   "backwards", "last_us", "severity"]
+
+
+_STATUSES = pa.array(STATUS_ORDER, type=pa.string())
+_RANKS = len(STATUS_ORDER)
+_HOUR_US = 3600 * 1_000_000
+
+
+def _limits_us(limits):
+    """Per-rank stall limit in microseconds; terminal or unlisted statuses never stall."""
+    return np.array([limits[status] * _HOUR_US if status in limits else np.iinfo("int64").max
+                     for status in STATUS_ORDER], dtype="int64")
+
+
+class FlaggedShipments(namedtuple("FlaggedShipments", _FLAGGED_FIELDS)):
+    """Every flagged shipment of a scan, as sorted parallel arrays; see ``StallDetector``."""
+
+    def __len__(self):
+        return len(self.tracking_numbers)
+
+    def get(self, tracking_number):
+        """Returns the shipment's ``(severity, shipment_id, fields)`` entry, or None if it was not flagged."""
+        key = tracking_number.encode("ascii", "replace")
+        position = np.searchsorted(self.tracking_numbers, key)
+        if position == len(self) or self.tracking_numbers[position] != key:
+            return None
+        return (float(self.severity[position]), self.shipment_ids[position].decode(), (
+            tracking_number, int(self.rank[position]), int(self.furthest_rank[position]),
+            int(self.stalled_us[position]), int(self.limit_us[position]), bool(self.backwards[position]),
+            int(self.last_us[position])))
+
+
+def _stalled_shipment(item, limits):
+    """Builds a ``StalledShipment`` from a detector's ``(severity, shipment_id, fields)`` entry."""
+    severity, shipment_id, (tracking_number, rank, furthest_rank, stalled_us, limit_us, backwards, last_us) = item
+    return StalledShipment(
+        shipment_id, tracking_number, STATUS_ORDER[rank], STATUS_ORDER[furthest_rank],
+        round(stalled_us / _HOUR_US, 1), limits.get(STATUS_ORDER[furthest_rank]), backwards,
+        datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=last_us), round(severity, 2),
+    )
+
+
+class StallDetector:
+    """
+    Streams Tracking scans and keeps the worst stalled or backwards-moving shipments.
+
+    Args:
+        limits (dict): Status -> hours allowed at that status (see ``STALL_LIMIT_HOURS``).
+        as_of (datetime.datetime): Reference time for stall ages; defaults to now.
+        top (int): Exceptions kept.
+        keep_flagged (bool): Also keep every flagged shipment by tracking number, for lookups.
+            Memory then grows with the number of flagged shipments scanned.
+    """
+
+    def __init__(self, limits=STALL_LIMIT_HOURS, as_of=None, top=TOP_EXCEPTIONS, keep_flagged=False):
+        self.limits = limits
+        self.as_of = as_of or datetime.datetime.now()
+        self.top = top
+        self._limits_us = _limits_us(limits)
+        self._as_of_us = int(pa.scalar(self.as_of, type=pa.timestamp("us")).value)
+        self._heap = []  # (severity, shipment_id, fields) min-heap of the worst ``top``
+        self._flagged = [] if keep_flagged else None  # Per chunk, arrays in ``_FLAGGED_FIELDS`` order
+        self.shipments = 0
+        self.events = 0
+        self.flagged = 0
+
+    def _process(self, table):
+        """Evaluates complete shipments; ``table`` must hold every scan of the shipments in it."""
+        ranks = pc.index_in(table["STATUS_UPDATE"], value_set=_STATUSES)
+        table = table.filter(ranks.is_valid())  # Statuses outside STATUS_ORDER carry no rank
+        if not table.num_rows:
+            return
+        rank = pc.index_in(table["STATUS_UPDATE"], value_set=_STATUSES).to_numpy().astype("int64")
+        ts = table["TIMESTAMP"].cast(pa.timestamp("us")).cast(pa.int64()).to_numpy()
+        ids = table["SHIPMENT_ID"]
+        starts_mask = np.ones(table.num_rows, dtype=bool)
+        if table.num_rows > 1:
+            starts_mask[1:] = pc.not_equal(ids[1:], ids[:-1]).to_numpy(zero_copy_only=False)
+        starts = np.flatnonzero(starts_mask)
+        ends = np.r_[starts[1:], table.num_rows] - 1
+        group = np.cumsum(starts_mask) - 1
+
+        # Running furthest rank per shipment: offset each group above the previous one so a
+        # single accumulate never leaks a maximum across shipments.
+        furthest = np.maximum.accumulate(rank + group * _RANKS) - group * _RANKS
+        backwards = np.add.reduceat((rank < furthest).astype("int64"), starts) > 0
+        previous = np.r_[-1, furthest[:-1]]
+        advanced = starts_mask | (furthest > previous)
+        advanced_at = np.maximum.reduceat(np.where(advanced, ts, np.iinfo("int64").min), starts)
+
+        furthest_rank = furthest[ends]
+        stalled_us = self._as_of_us - advanced_at
+        limit_us = self._limits_us[furthest_rank]
+        overdue = stalled_us > limit_us
+        flagged = overdue | backwards
+        self.shipments += len(starts)
+        self.events += table.num_rows
+        self.flagged += int(flagged.sum())
+        if not flagged.any():
+            return
+
+        severity = np.where(limit_us < np.iinfo("int64").max, stalled_us / limit_us.clip(min=1), 0.0)
+        severity = np.where(overdue, severity, 0.0) + BACKWARDS_WEIGHT * backwards
+        if self._flagged is not None:
+            self._keep_flagged(table, np.flatnonzero(flagged), ends, rank, furthest_rank, stalled_us, limit_us,
+                               backwards, ts, severity)
+        candidates = np.flatnonzero(flagged)
+        if len(candidates) > self.top:
+            candidates = candidates[np.argpartition(-severity[candidates], self.top)[:self.top]]
+        threshold = self._heap[0][0] if len(self._heap) == self.top else -np.inf
+        candidates = candidates[severity[candidates] > threshold]
+        if not len(candidates):
+            return
+
+        rows = ends[candidates]
+        shipment_ids = ids.take(pa.array(rows)).to_pylist()
+        tracking_numbers = table["TRACKING_NUMBER"].take(pa.array(rows)).to_pylist()
+        for i, shipment_id, tracking_number in zip(candidates, shipment_ids, tracking_numbers):
+            item = (float(severity[i]), shipment_id, (tracking_number, int(rank[ends[i]]), int(furthest_rank[i]),
+                                                      int(stalled_us[i]), int(limit_us[i]), bool(backwards[i]),
+                                                      int(ts[ends[i]])))
+            if len(self._heap) < self.top:
+                heapq.heappush(self._heap, item)
+            elif item[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def _keep_flagged(self, table, flagged, ends, rank, furthest_rank, stalled_us, limit_us, backwards, ts, severity):
+        rows = ends[flagged]
+        # IDs and tracking numbers are ASCII
+        tracking_numbers, shipment_ids = (
+            np.asarray(pc.fill_null(table[name].take(pa.array(rows)), "").to_numpy(zero_copy_only=False), dtype="S")
+            for name in ("TRACKING_NUMBER", "SHIPMENT_ID"))
+        self._flagged.append((tracking_numbers, shipment_ids, rank[rows].astype("int8"),
+                              furthest_rank[flagged].astype("int8"), stalled_us[flagged], limit_us[flagged],
+                              backwards[flagged], ts[rows], severity[flagged]))
+
+    def flagged_shipments(self):
+        """Every flagged shipment so far, sorted by tracking number; None unless ``keep_flagged``."""
+        if self._flagged is None:
+            return None
+        if not self._flagged:
+            return FlaggedShipments(*(np.array([], dtype=dtype) for dtype in
+                                      ("S1", "S1", "int8", "int8", "int64", "int64", "bool", "int64", "float64")))
+        columns = [np.concatenate(arrays) for arrays in zip(*self._flagged)]
+        order = np.argsort(columns[0], kind="stable")
+        return FlaggedShipments(*(column[order] for column in columns))
+
+    def scan(self, batches):
+        """
+        Consumes a stream of scans ordered by ``SHIPMENT_ID`` then ``TIMESTAMP``.
+
+        Args:
+            batches (iterable): Arrow tables or record batches with the ``TRACKING_SCAN_QUERY`` columns.
+
+        Returns:
+            ScanReport: The ranked exceptions and scan totals.
+        """
+        started = time.perf_counter()
+        carry = None
+        for batch in batches:
+            table = pa.Table.from_batches([batch]) if isinstance(batch, pa.RecordBatch) else batch
+            if not table.num_rows:
+                continue
+            if carry is not None:
+                table = pa.concat_tables([carry, table.cast(carry.schema)])
+            table = table.combine_chunks()
+            # The last shipment may continue in the next batch; hold its scans back.
+            ids = table["SHIPMENT_ID"]
+            last = ids[-1].as_py()
+            tail = table.num_rows - 1
+            while tail > 0 and ids[tail - 1].as_py() == last:
+                tail -= 1
+            carry = table.slice(tail)
+            self._process(table.slice(0, tail))
+        if carry is not None:
+            self._process(carry.combine_chunks())
+        return ScanReport(self.exceptions(), self.shipments, self.events, self.flagged, self.as_of,
+                          time.perf_counter() - started, self.flagged_shipments())
+
+    def exceptions(self):
+        """The kept exceptions, worst first."""
+        return [_stalled_shipment(item, self.limits) for item in sorted(self._heap, reverse=True)]
+
+
+def scan_tracking(session, limits=STALL_LIMIT_HOURS, as_of=None, top=TOP_EXCEPTIONS, keep_flagged=False,
+                  since=None):
+    """Runs a ``StallDetector`` over the whole Tracking table, or the shipments scanned since ``since``."""
+    query = TRACKING_SCAN_QUERY if since is None else RECENT_SCAN_QUERY.format(since=sql_literal(since))
+    report = StallDetector(limits, as_of, top, keep_flagged).scan(fetch_arrow_batches(session, query))
+    logger.info(f"Stall scan: {report.events:,} scans, {report.shipments:,} shipments, "
+                f"{report.flagged:,} flagged in {report.seconds:.2f}s")
+    return report
+
+
+###############################################################################
+# Process-wide monitor for the order page
+###############################################################################
+class StallMonitor(BackgroundRefresh):
+    """
+    Latest stall scan, shared by every session and rerun in the background.
+
+    Lookups see every flagged shipment scanned in the last ``recent_days``; the ranked
+    ``report.exceptions`` only feed the sidebar list.
+
+    Args:
+        refresh_seconds (float): Age after which a lookup starts a background rescan.
+        limits (dict): Status -> hours allowed at that status (see ``STALL_LIMIT_HOURS``).
+        top (int): Exceptions ranked for the sidebar list.
+        recent_days (float): Days back a shipment's last scan may be for it to be scanned.
+    """
+
+    thread_name = "stall-scan"
+    description = "Stall scan"
+    load_in_background = True  # The scan is too slow for a page to wait on
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, limits=STALL_LIMIT_HOURS, top=TOP_EXCEPTIONS,
+                 recent_days=RECENT_DAYS):
+        super().__init__(refresh_seconds)
+        self.limits = limits
+        self.top = top
+        self.recent_days = recent_days
+        self.report = None
+        self._flagged = None
+
+    def refresh(self, session):
+        since = datetime.datetime.now() - datetime.timedelta(days=self.recent_days)
+        report = scan_tracking(session, self.limits, top=self.top, keep_flagged=True, since=since)
+        self._flagged = report.flagged_shipments
+        self.report = report
+        self.refreshed_at = time.time()
+
+    def lookup(self, session, tracking_number):
+        """
+        Returns the exception for a tracking number, if the latest scan flagged it.
+
+        Args:
+            session: Snowflake session used for a background rescan.
+            tracking_number (str): The order's tracking number.
+
+        Returns:
+            StalledShipment: Or None if it is not flagged, or no scan has finished yet.
+        """
+        self.ensure_fresh(session)
+        item = None if self._flagged is None else self._flagged.get(tracking_number)
+        return None if item is None else _stalled_shipment(item, self.limits)
+
+
+# Process-wide instance shared by every Streamlit session.
+stall_monitor = StallMonitor()
+
+
+###############################################################################
+# Command line and benchmark
+###############################################################################
+def generate_scans(shipments, start, batch_size=1_000_000, seed=7):
+    """Yields Arrow tables of synthetic scans, ordered by shipment then time, about 4.5 per shipment."""
+    rng = np.random.default_rng(seed)
+    per_batch = max(1, batch_size // 5)
+    start_us = int(pa.scalar(start, type=pa.timestamp("us")).value)
+    for first in range(0, shipments, per_batch):
+        count = min(per_batch, shipments - first)
+        lengths = rng.integers(1, len(STATUS_ORDER) + 1, count)
+        group = np.repeat(np.arange(count), lengths)
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+        rank = np.arange(len(group)) - np.repeat(offsets, lengths)
+        backwards = rng.random(len(group)) < 0.002
+        rank = np.where(backwards & (rank > 1), rank - 2, rank)
+        base = start_us + rng.integers(0, 10 * 24, count) * _HOUR_US
+        ts = np.repeat(base, lengths) + rank.clip(min=0) * 20 * _HOUR_US + np.arange(len(group)) % 7
+        ids = np.char.add("SHP-", (first + group).astype("U10"))
+        yield pa.table({
+            "SHIPMENT_ID": pa.array(ids),
+            "TRACKING_NUMBER": pa.array(np.char.add("1Z", (first + group).astype("U10"))),
+            "STATUS_UPDATE": pa.DictionaryArray.from_arrays(pa.array(rank.astype("int8")), _STATUSES),
+            "TIMESTAMP": pa.array(ts, type=pa.timestamp("us")),
+        })
+
+
+def _check_monitor(session):
+    """Self-checks on the local session: lookups past the ranked top, and a scan with no stalls."""
+    from unittest import mock
+
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    import stalled_shipments
+
+    # The demo scans are dated around 2025-04-08; this window reaches back to the first of them.
+    first_scan = datetime.datetime.fromisoformat(session._conn.execute("SELECT MIN(TIMESTAMP) FROM Tracking").fetchone()[0])
+    everything = (datetime.datetime.now() - first_scan).days + 1
+    monitor = StallMonitor(top=1, recent_days=everything)
+    monitor.refresh(session)
+    flagged = monitor.report.flagged_shipments
+    assert len(monitor.report.exceptions) == 1 and len(flagged) == monitor.report.flagged > 1
+    for tracking_number in flagged.tracking_numbers:
+        tracking_number = tracking_number.decode()
+        assert monitor.lookup(session, tracking_number).tracking_number == tracking_number
+    assert monitor.lookup(session, "1Z-NOT-FLAGGED") is None
+    print(f"monitor: {len(flagged)} flagged shipments found by lookup, {len(monitor.report.exceptions)} ranked")
+
+    # A window drops the shipments last scanned before it, but keeps the whole history of
+    # the others, so they are flagged as in the full scan.
+    last_scans = sorted(datetime.datetime.fromisoformat(row[0]) for row in session._conn.execute(
+        "SELECT MAX(TIMESTAMP) FROM Tracking GROUP BY SHIPMENT_ID"))
+    cutoff = last_scans[len(last_scans) // 2]
+    recent = scan_tracking(session, keep_flagged=True, since=cutoff)
+    recent_events = session._conn.execute(
+        "SELECT COUNT(*) FROM Tracking WHERE SHIPMENT_ID IN (SELECT SHIPMENT_ID FROM Tracking WHERE TIMESTAMP >= ?)",
+        (cutoff,)).fetchone()[0]
+    assert recent.shipments == sum(scan >= cutoff for scan in last_scans), recent.shipments
+    assert recent.events == recent_events < monitor.report.events
+    kept = set(recent.flagged_shipments.tracking_numbers)
+    assert 0 < len(kept) < len(flagged) and kept <= set(flagged.tracking_numbers)
+    print(f"recent window: {recent.shipments} of {monitor.report.shipments} shipments, "
+          f"{len(kept)} of {len(flagged)} flagged")
+
+    # No stalls anywhere: the order page still renders, with an empty sidebar list.
+    calm = StallMonitor(limits={status: 10 ** 6 for status in STATUS_ORDER}, recent_days=everything)
+    calm.refresh(session)
+    assert calm.report.exceptions == [] and not len(calm.report.flagged_shipments), calm.report.flagged
+
+    class _Connection:
+        def session(self):
+            return session
+
+    with mock.patch.object(stalled_shipments, "stall_monitor", calm), \
+            mock.patch.object(st, "connection", lambda *args, **kwargs: _Connection()):
+        app = AppTest.from_file("wismo_app.py", default_timeout=60)
+        app.query_params["customer_id"] = "CUST-0001"
+        app.run()
+    assert not app.exception and not app.warning and app.dataframe[0].value.empty, [e.value for e in app.exception]
+    print("no stalls: order page renders with an empty stalled-shipments list")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank stalled shipments from tracking scans.")
+    parser.add_argument("--shipments", type=int, default=0,
+                        help="Benchmark on this many generated shipments instead of the local demo session.")
+    parser.add_argument("--top", type=int, default=20, help="Exceptions to print.")
+    args = parser.parse_args(argv)
+
+    if args.shipments:
+        # Generated batches are released as the scan moves on, so the Arrow pool's peak
+        # shows the scan's working set; it should not grow with the number of shipments.
+        as_of = datetime.datetime(2025, 4, 15)
+        pool = pa.default_memory_pool()
+        report = StallDetector(as_of=as_of, top=args.top).scan(
+            generate_scans(args.shipments, as_of - datetime.timedelta(days=10)))
+        print(f"{report.events:,} scans, {report.shipments:,} shipments: {report.seconds:.2f}s "
+              f"= {report.events / report.seconds:,.0f} scans/s, {report.flagged:,} flagged, "
+              f"peak Arrow memory {pool.max_memory() / 2 ** 20:.0f} MB")
+    else:
+        from local_session import LocalSession
+
+        session = LocalSession(orders=500)
+        report = scan_tracking(session, as_of=datetime.datetime(2025, 4, 8, 12), top=args.top)
+        _check_monitor(session)
+    for exception in report.exceptions[:args.top]:
+        print(exception)
+
+
+if __name__ == "__main__":
+    main()
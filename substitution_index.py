@@ -0,0 +1,164 @@
+"""
+Precomputed, in-memory ranking of substitute products.
+
+The index is built in bulk from PRODUCTS and PRODUCT_SUBSTITUTIONS and maps every
+original product ID to a ranked tuple of ``SubstituteEntry`` rows, so a backordered
+order view is a dictionary lookup instead of a warehouse join. It is shared by every
+session in the process and rebuilt in the background once it is older than
+``REFRESH_SECONDS``; readers keep using the previous index until the new one is swapped in.
+"""
+import logging
+import time
+from collections import namedtuple
+
+from background_refresh import BackgroundRefresh
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# Seconds before the index is rebuilt from the warehouse.
+REFRESH_SECONDS = 300
+
+# Stock at or above this ships right away; anything lower (but above zero) is "low".
+LOW_STOCK_THRESHOLD = 10
+
+# How much each ranking signal contributes to a substitute's score (higher ranks first).
+RANKING_WEIGHTS = {
+    "priority": 4.0,      # 1 / SUBSTITUTION_PRIORITY, so the curated order still dominates
+    "stock": 1.0,         # Stock depth, capped at STOCK_CAP
+    "price": 2.0,         # Relative saving versus the original (negative when dearer)
+    "availability": 3.0,  # In stock at all
+}
+STOCK_CAP = 100
+
+SubstituteEntry = namedtuple(
+    "SubstituteEntry",
+    ["product_id", "name", "description", "price", "stock_quantity", "priority", "score",
+     "choice", "shipping_status"],
+)
+
+PRODUCTS_QUERY = """
+    SELECT PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRICE, STOCK_QUANTITY
+    FROM PRODUCTS
+"""
+
+SUBSTITUTIONS_QUERY = """
+    SELECT ORIGINAL_PRODUCT_ID, SUBSTITUTE_PRODUCT_ID, SUBSTITUTION_PRIORITY
+    FROM PRODUCT_SUBSTITUTIONS
+"""
+
+
+def shipping_status(stock_quantity):
+    """Returns the card's shipping label for a stock level."""
+    if stock_quantity >= LOW_STOCK_THRESHOLD:
+        return "Ready to Ship"
+    if stock_quantity > 0:
+        return "Low quantity available"
+    return "Not Ready to Ship"
+
+
+def rank_substitutes(products_df, substitutions_df):
+    """
+    Scores and ranks every substitute of every product.
+
+    Args:
+        products_df (pd.DataFrame): PRODUCTS rows (see ``PRODUCTS_QUERY``).
+        substitutions_df (pd.DataFrame): PRODUCT_SUBSTITUTIONS rows (see ``SUBSTITUTIONS_QUERY``).
+
+    Returns:
+        dict: Original product ID -> tuple of ``SubstituteEntry``, best first.
+    """
+    products = products_df.set_index("PRODUCT_ID")
+    ranked = substitutions_df.join(products[["PRICE"]], on="ORIGINAL_PRODUCT_ID")
+    ranked = ranked.rename(columns={"PRICE": "ORIGINAL_PRICE"}).join(products, on="SUBSTITUTE_PRODUCT_ID", how="inner")
+
+    price = ranked["PRICE"].astype(float)
+    original_price = ranked["ORIGINAL_PRICE"].astype(float)
+    stock = ranked["STOCK_QUANTITY"].fillna(0).astype(int)
+    saving = ((original_price - price) / original_price.where(original_price > 0)).fillna(0).clip(-1, 1)
+    ranked["SCORE"] = (
+        RANKING_WEIGHTS["priority"] / ranked["SUBSTITUTION_PRIORITY"].clip(lower=1)
+        + RANKING_WEIGHTS["stock"] * stock.clip(upper=STOCK_CAP) / STOCK_CAP
+        + RANKING_WEIGHTS["price"] * saving
+        + RANKING_WEIGHTS["availability"] * (stock > 0)
+    )
+    ranked["STOCK_QUANTITY"] = stock
+    ranked = ranked.sort_values(["ORIGINAL_PRODUCT_ID", "SCORE", "SUBSTITUTION_PRIORITY"],
+                                ascending=[True, False, True])
+
+    index = {}
+    for original_id, group in ranked.groupby("ORIGINAL_PRODUCT_ID", sort=False):
+        index[original_id] = tuple(
+            SubstituteEntry(
+                product_id, name, description, float(price), int(stock_quantity), int(priority), float(score),
+                "Top Substitution Choice" if rank == 0 else "Secondary Substitution",
+                shipping_status(stock_quantity),
+            )
+            for rank, (product_id, name, description, price, stock_quantity, priority, score) in enumerate(zip(
+                group["SUBSTITUTE_PRODUCT_ID"], group["PRODUCT_NAME"], group["PRODUCT_DESCRIPTION"],
+                group["PRICE"], group["STOCK_QUANTITY"], group["SUBSTITUTION_PRIORITY"], group["SCORE"],
+            ))
+        )
+    return index
+
+
+class SubstitutionIndex(BackgroundRefresh):
+    """
+    Process-wide substitute ranking, rebuilt periodically from the warehouse.
+
+    Args:
+        refresh_seconds (float): Age after which a lookup triggers a background rebuild.
+    """
+
+    thread_name = "substitution-index-refresh"
+    description = "Substitution index"
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS):
+        super().__init__(refresh_seconds)
+        self._index = None
+
+    def refresh(self, session):
+        """Rebuilds the index from the warehouse and swaps it in."""
+        started = time.perf_counter()
+        index = rank_substitutes(session.sql(PRODUCTS_QUERY).to_pandas(),
+                                 session.sql(SUBSTITUTIONS_QUERY).to_pandas())
+        self._index = index
+        self.refreshed_at = time.time()
+        logger.info(f"Substitution index rebuilt: {len(index)} products in {time.perf_counter() - started:.3f}s")
+
+    def lookup(self, session, product_id):
+        """
+        Returns the ranked substitutes for a product.
+
+        The first lookup in the process builds the index; later ones never wait on the
+        warehouse and at most start a background rebuild.
+
+        Args:
+            session: Snowflake session used if the index has to be (re)built.
+            product_id (str): The original (backordered) product.
+
+        Returns:
+            tuple: ``SubstituteEntry`` rows, best first; empty if there are none, or while
+            the index could not be built.
+        """
+        if not self.ensure_fresh(session):
+            return ()
+        return self._index.get(product_id, ())
+
+
+# Process-wide instance shared by every Streamlit session.
+substitution_index = SubstitutionIndex()
+
+
+if __name__ == "__main__":
+    from local_session import LocalSession
+
+    session = LocalSession(products=5000)
+    substitution_index.lookup(session, "PROD-0001")
+    lookups = 100_000
+    started = time.perf_counter()
+    for i in range(lookups):
+        substitution_index.lookup(session, f"PROD-{i % 5000 + 1:04d}")
+    elapsed = time.perf_counter() - started
+    print(f"{lookups:,} lookups in {elapsed:.3f}s ({elapsed / lookups * 1e6:.2f} us each)")
+    for entry in substitution_index.lookup(session, "PROD-0001"):
+        print(entry)
@@ -0,0 +1,162 @@
+"""
+Fetch helpers that skip pandas unless a DataFrame is actually needed.
+
+Lookups that read a few fields per row get plain Snowpark ``Row`` tuples from
+``fetch_rows``. Bulk results come back as Arrow data from ``fetch_arrow`` (or
+``fetch_arrow_batches`` for streaming), and callers convert to pandas only at the point
+where DataFrame operations are needed. Rows and Arrow tables are effectively immutable,
+so coalesced callers can share them without copying.
+"""
+import datetime
+import time
+import tracemalloc
+
+import pyarrow as pa
+
+
+def fetch_rows(session, query):
+    """
+    Runs a query and returns its rows as lightweight tuples.
+
+    Args:
+        session: Snowpark (or compatible) session.
+        query (str): SQL text.
+
+    Returns:
+        list: ``Row`` tuples with attribute access by column name. Treat as read-only.
+    """
+    return session.sql(query).collect()
+
+
+def fetch_arrow(session, query):
+    """
+    Runs a query and returns the result as an Arrow table, without building a DataFrame.
+
+    Args:
+        session: Snowpark (or compatible) session.
+        query (str): SQL text.
+
+    Returns:
+        pyarrow.Table: The result, empty (but never None) when no rows match.
+    """
+    cursor = session.connection.cursor()
+    try:
+        cursor.execute(query)
+        return cursor.fetch_arrow_all(force_return_table=True)
+    finally:
+        cursor.close()
+
+
+def fetch_arrow_batches(session, query):
+    """
+    Streams a query's result as Arrow record batches, for results too large to hold at once.
+
+    Args:
+        session: Snowpark (or compatible) session.
+        query (str): SQL text.
+
+    Yields:
+        pyarrow.Table: Successive chunks of the result.
+    """
+    cursor = session.connection.cursor()
+    try:
+        cursor.execute(query)
+        yield from cursor.fetch_arrow_batches()
+    finally:
+        cursor.close()
+
+
+def sql_literal(value):
+    """
+    Quotes a value for splicing into SQL text, such as a watermark in a ``WHERE`` clause.
+
+    Args:
+        value: A string, number, ``datetime.date`` or ``datetime.datetime``. DATE columns
+            come back as ``date``, which has no ``isoformat(' ')``.
+
+    Returns:
+        str: The quoted literal, with embedded quotes doubled.
+    """
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        value = value.isoformat(" ") if isinstance(value, datetime.datetime) else value.isoformat()
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+###############################################################################
+# Measurements
+###############################################################################
+def _measure(fn, repeat):
+    """Returns (seconds per call, peak Python-heap bytes, Arrow-pool bytes still allocated)."""
+    fn()  # Warm up caches, e.g. Row types
+    arrow_before = pa.total_allocated_bytes()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - started) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak, pa.total_allocated_bytes() - arrow_before
+
+
+if __name__ == "__main__":
+    # Per-view cost of the real fetch paths against the local fake session with a warehouse
+    # round trip: the old ``session.sql(...).to_pandas()`` versus ``fetch_rows`` (collect)
+    # for lookups and ``fetch_arrow`` (fetch_arrow_all) for the tracking poll, including
+    # the step where the page reads the result.
+    from local_session import LocalSession
+
+    latency = 0.02
+    session = LocalSession(latency=latency, orders=200)
+    order_query = """
+        SELECT o.ORDER_ID, o.ORDER_STATUS, o.ORDER_DATE, s.SHIPMENT_STATUS, s.TRACKING_NUMBER,
+               o.EXPECTED_DELIVERY_DATE, oli.PRODUCT_ID
+        FROM Orders o
+        LEFT JOIN Shipments s ON o.ORDER_ID = s.ORDER_ID
+        JOIN ORDER_LINE_ITEMS oli ON o.ORDER_ID = oli.ORDER_ID
+        WHERE o.ORDER_ID = 'ORD-0052'
+    """
+    products_query = """
+        SELECT PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, PRICE
+        FROM PRODUCTS WHERE PRODUCT_ID IN ('PROD-0001', 'PROD-0002')
+    """
+    poll_query = """
+        SELECT t.STATUS_UPDATE, t.LOCATION, t.TIMESTAMP, t.TRACKING_NUMBER
+        FROM Tracking t JOIN Shipments s ON t.SHIPMENT_ID = s.SHIPMENT_ID
+        WHERE s.ORDER_ID = 'ORD-0052' AND t.TIMESTAMP > '2030-01-01' ORDER BY t.TIMESTAMP ASC
+    """
+
+    def order_pandas():
+        return session.sql(order_query).to_pandas()["ORDER_STATUS"].iloc[0]
+
+    def order_rows():
+        return fetch_rows(session, order_query)[0].ORDER_STATUS
+
+    def products_pandas():
+        return session.sql(products_query).to_pandas()["PRICE"].iloc[0]
+
+    def products_rows():
+        return fetch_rows(session, products_query)[0].PRICE
+
+    def poll_pandas():
+        df = session.sql(poll_query).to_pandas()
+        return None if df.empty else df
+
+    def poll_arrow():
+        table = fetch_arrow(session, poll_query)
+        return table.to_pandas() if table.num_rows else None
+
+    views = [
+        ("order lookup", order_pandas, order_rows),
+        ("product lookup", products_pandas, products_rows),
+        ("tracking poll", poll_pandas, poll_arrow),
+    ]
+    print(f"{latency * 1000:.0f} ms round trip; time per view and client time above the round trip")
+    print(f"{'view':<16} {'to_pandas':>18} {'new path':>18} {'py heap old -> new':>24}")
+    for name, legacy, lean in views:
+        legacy_time, legacy_peak, _ = _measure(legacy, 100)
+        lean_time, lean_peak, _ = _measure(lean, 100)
+        print(f"{name:<16} {legacy_time * 1e3:>6.2f} ms ({(legacy_time - latency) * 1e6:>5.0f}us) "
+              f"{lean_time * 1e3:>6.2f} ms ({(lean_time - latency) * 1e6:>5.0f}us) "
+              f"{legacy_peak / 1024:>10.1f} KB -> {lean_peak / 1024:.1f} KB")
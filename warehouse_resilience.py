@@ -0,0 +1,445 @@
+"""
+Stale-while-revalidate serving and a circuit breaker for order-page queries.
+
+``ResultCache`` keeps the last result of every order-page query for the whole process.
+A fresh entry is served straight from memory. For a stale entry, a background refresh
+starts and the caller waits a short budget for it. If the warehouse does not answer
+within that budget, the caller gets the cached result, marked with its age, and the
+refresh finishes in the background.
+
+``CircuitBreaker`` counts consecutive slow warehouse calls and calls that failed because the
+warehouse was unreachable, timed out or overloaded (``is_outage``). SQL, programming and
+authentication errors pass through uncounted: a malformed search is not an outage. Once the count
+reaches its threshold the breaker opens: calls fail fast with ``CircuitOpenError`` for a
+cool-down window, and the cache serves whatever it holds. After the cool-down, one probe
+call is let through. If it succeeds the breaker closes; if it fails the breaker opens again.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from snowflake.connector import errors as connector_errors
+from snowflake.snowpark.exceptions import (SnowparkFetchDataException, SnowparkQueryCancelledException,
+                                           SnowparkSQLException)
+
+from query_coalescing import coalesced, normalize_query
+
+logger = logging.getLogger("streamlit-snowflake")
+
+# A cached result younger than this is served without contacting the warehouse.
+FRESH_SECONDS = 15.0
+
+# Oldest cached result that may still be served while the warehouse is slow or down.
+MAX_STALE_SECONDS = 3600.0
+
+# Seconds a caller waits for the refresh of a stale entry before taking the cached result.
+STALE_WAIT_SECONDS = 0.75
+
+# Cached results kept, least recently used evicted first.
+MAX_ENTRIES = 4096
+
+# Consecutive failures (errors or slow calls) that open the breaker.
+FAILURE_THRESHOLD = 3
+
+# Seconds the breaker stays open before letting a probe call through.
+COOLDOWN_SECONDS = 30.0
+
+# A call slower than this counts as a failure, even though it returned.
+SLOW_CALL_SECONDS = 10.0
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Errors meaning the warehouse is unreachable, timing out or overloaded.
+OUTAGE_ERRORS = (
+    ConnectionError, TimeoutError,
+    connector_errors.OperationalError, connector_errors.InterfaceError,
+    connector_errors.InternalServerError, connector_errors.BadGatewayError,
+    connector_errors.ServiceUnavailableError, connector_errors.GatewayTimeoutError,
+    connector_errors.RequestTimeoutError, connector_errors.TooManyRequests,
+    connector_errors.OtherHTTPRetryableError, connector_errors.RequestExceedMaxRetryError,
+    SnowparkQueryCancelledException, SnowparkFetchDataException,
+)
+
+# Snowflake error codes of statements cancelled by a statement or warehouse timeout.
+TIMEOUT_ERROR_CODES = frozenset({604, 630})
+
+# ``age`` is None for results fetched during this call; ``stale`` marks served-from-cache fallbacks.
+Served = namedtuple("Served", ["result", "age", "stale"])
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the warehouse while the breaker is open."""
+
+
+###############################################################################
+# 1. Circuit breaker
+###############################################################################
+def is_outage(error):
+    """
+    Whether a failed warehouse call says the warehouse is down rather than the query wrong.
+
+    Args:
+        error (Exception): What the call raised.
+
+    Returns:
+        bool: True for connectivity, timeout and overload errors, which the breaker counts.
+    """
+    if isinstance(error, SnowparkSQLException):
+        if error.conn_error is not None:
+            return is_outage(error.conn_error)
+        return error.sql_error_code in TIMEOUT_ERROR_CODES
+    if isinstance(error, connector_errors.ProgrammingError):
+        return error.errno in TIMEOUT_ERROR_CODES
+    return isinstance(error, OUTAGE_ERRORS)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing warehouse for a cool-down window.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the breaker.
+        cooldown_seconds (float): Seconds the breaker stays open before a probe.
+        slow_call_seconds (float): Calls taking longer count as failures.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, cooldown_seconds=COOLDOWN_SECONDS,
+                 slow_call_seconds=SLOW_CALL_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    def retry_in(self):
+        """Seconds until the next probe is allowed, 0 unless the breaker is open."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown_seconds - time.time())
+
+    def _admit(self):
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.cooldown_seconds:
+                self.state = HALF_OPEN
+                logger.info("Warehouse circuit half-open, probing.")
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._probing):
+                self._probing = self.state == HALF_OPEN
+                self.stats["calls"] += 1
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def _record(self, ok, slow):
+        with self._lock:
+            self._probing = False
+            if slow:
+                self.stats["slow_calls"] += 1
+            if ok and not slow:
+                if self.state != CLOSED:
+                    logger.info("Warehouse circuit closed.")
+                self.state, self.failures = CLOSED, 0
+                return
+            self.stats["failures"] += 1
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.stats["opened"] += 1
+                    logger.warning(f"Warehouse circuit open for {self.cooldown_seconds:.0f}s "
+                                   f"after {self.failures} failed or slow calls.")
+                self.state, self.opened_at = OPEN, time.time()
+
+    def _release(self):
+        with self._lock:
+            self._probing = False
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls ``fn`` unless the breaker is open, recording whether it failed or was slow.
+
+        Wrap the warehouse call itself, not a coalesced one (see ``coalesced``'s ``guard``),
+        so a failure shared by many waiting callers is recorded once. Errors that are not
+        outages (see ``is_outage``) and interrupted calls (e.g. a Streamlit rerun) free the
+        probe slot without counting as a failure.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with a probe already in flight.
+        """
+        if not self._admit():
+            raise CircuitOpenError(f"Warehouse temporarily unavailable, retrying in {self.retry_in():.0f}s.")
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_outage(e):
+                self._record(ok=False, slow=False)
+            else:
+                self._release()
+            raise
+        except BaseException:
+            self._release()
+            raise
+        self._record(ok=True, slow=time.perf_counter() - started > self.slow_call_seconds)
+        return result
+
+
+###############################################################################
+# 2. Stale-while-revalidate result cache
+###############################################################################
+class _Entry:
+    def __init__(self, result, fetched_at):
+        self.result = result
+        self.fetched_at = fetched_at
+        self.refresh = None  # Event set when an in-flight background refresh ends
+
+
+class ResultCache:
+    """
+    Process-wide last-known results of warehouse queries, served stale when the warehouse is not.
+
+    Intended for fetchers returning immutable results (Row tuples, Arrow tables, see
+    warehouse_fetch.py), which every session can share without copying.
+
+    Args:
+        breaker (CircuitBreaker): Guards every warehouse call made through the cache.
+        fresh_seconds (float): Age below which an entry is served without a refresh.
+        max_stale_seconds (float): Age beyond which an entry is never served.
+        stale_wait_seconds (float): Budget a caller waits on the refresh of a stale entry.
+        max_entries (int): Entries kept before the least recently used are evicted.
+    """
+
+    def __init__(self, breaker=None, fresh_seconds=FRESH_SECONDS, max_stale_seconds=MAX_STALE_SECONDS,
+                 stale_wait_seconds=STALE_WAIT_SECONDS, max_entries=MAX_ENTRIES):
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.stale_wait_seconds = stale_wait_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"fresh_hits": 0, "misses": 0, "revalidated": 0, "stale_served": 0,
+                      "refreshes": 0, "refresh_failures": 0, "evictions": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _store(self, key, result):
+        with self._lock:
+            self._entries[key] = _Entry(result, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _load(self, session, query, fetch):
+        return coalesced(session, query, fetch, guard=self.breaker.call)
+
+    def _refresh(self, key, entry, session, query, fetch):
+        try:
+            self._store(key, self._load(session, query, fetch))
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            self._count("refresh_failures")
+            logger.warning(f"Background refresh failed, serving cached result: {e}")
+        finally:
+            entry.refresh.set()
+            entry.refresh = None
+
+    def _start_refresh(self, key, entry, session, query, fetch):
+        """Starts a background refresh of ``entry`` unless one is running; returns its done event."""
+        with self._lock:
+            if entry.refresh is None:
+                entry.refresh = threading.Event()
+                self.stats["refreshes"] += 1
+                threading.Thread(target=self._refresh, args=(key, entry, session, query, fetch),
+                                 name="result-cache-refresh", daemon=True).start()
+            return entry.refresh
+
+    def fetch(self, session, query, fetch):
+        """
+        Returns a query result, from memory when it is fresh enough or the warehouse is struggling.
+
+        Args:
+            session: Snowpark (or compatible) session used for warehouse calls.
+            query (str): SQL text.
+            fetch (callable): ``fetch(session, query)``, e.g. ``fetch_rows`` or ``fetch_arrow``.
+
+        Returns:
+            Served: The result, its age in seconds (None if fetched now) and whether it is stale.
+
+        Raises:
+            CircuitOpenError: If the breaker is open and nothing usable is cached.
+        """
+        key = (fetch.__name__, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        age = None if entry is None else time.time() - entry.fetched_at
+        if entry is not None and age > self.max_stale_seconds:
+            entry, age = None, None
+
+        if entry is None:
+            self._count("misses")
+            result = self._load(session, query, fetch)
+            self._store(key, result)
+            return Served(result, None, False)
+
+        if age <= self.fresh_seconds:
+            self._count("fresh_hits")
+            return Served(entry.result, age, False)
+
+        if not self.breaker.retry_in():  # Closed, or due for a probe
+            done = self._start_refresh(key, entry, session, query, fetch)
+            if done.wait(self.stale_wait_seconds):
+                with self._lock:
+                    refreshed = self._entries.get(key)
+                if refreshed is not None and refreshed is not entry:
+                    self._count("revalidated")
+                    return Served(refreshed.result, None, False)
+        self._count("stale_served")
+        return Served(entry.result, time.time() - entry.fetched_at, True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        """Breaker state and cache counters, e.g. for a load-test report or a log line."""
+        breaker = self.breaker
+        with self._lock:
+            entries = len(self._entries)
+            stats = dict(self.stats)
+        return {"breaker_state": breaker.state, "breaker_retry_in_seconds": round(breaker.retry_in(), 1),
+                "consecutive_failures": breaker.failures, **{f"breaker_{name}": value for name, value in breaker.stats.items()},
+                "cache_entries": entries, **stats}
+
+
+# Process-wide instance shared by every Streamlit session.
+order_cache = ResultCache()
+
+
+if __name__ == "__main__":
+    # Scripted outage against the local fake session: slow warehouse, failing warehouse, recovery.
+    from local_session import LocalSession
+    from warehouse_fetch import fetch_rows
+
+    session = LocalSession()
+    cache = ResultCache(CircuitBreaker(failure_threshold=3, cooldown_seconds=0.5, slow_call_seconds=1.0),
+                        fresh_seconds=0.2, stale_wait_seconds=0.1)
+    query = "SELECT ORDER_ID, ORDER_STATUS FROM Orders WHERE ORDER_ID = 'ORD-0052'"
+
+    served = cache.fetch(session, query, fetch_rows)
+    assert not served.stale and served.result[0].ORDER_STATUS == "Shipped"
+    assert cache.fetch(session, query, fetch_rows).age is not None  # Fresh hit, no query
+    assert session.query_count == 1
+
+    # Slow warehouse: the stale result comes back within the wait budget, well before the
+    # warehouse answers; the refresh lands later.
+    time.sleep(0.25)
+    session.latency = 0.6
+    started = time.perf_counter()
+    served = cache.fetch(session, query, fetch_rows)
+    elapsed = time.perf_counter() - started
+    assert served.stale and elapsed < session.latency, (served, elapsed)
+    for thread in threading.enumerate():
+        if thread.name == "result-cache-refresh":
+            thread.join()
+    queries = session.query_count
+    served = cache.fetch(session, query, fetch_rows)  # The background refresh was stored
+    assert not served.stale and served.age < cache.fresh_seconds and session.query_count == queries
+    print(f"slow warehouse: stale result served in {elapsed * 1000:.0f} ms, refreshed in the background")
+
+    # Many sessions sharing one failed query count as one breaker failure, and callers that
+    # give up waiting on the in-flight query count as none.
+    from concurrent.futures import ThreadPoolExecutor
+
+    from query_coalescing import CoalescedQueryTimeout
+
+    session.latency = 0.2
+    session.fault = connector_errors.ServiceUnavailableError(msg="warehouse queue overloaded")
+    shared = ResultCache(CircuitBreaker(failure_threshold=3))
+    start = threading.Barrier(10)
+
+    def failed_fetch(_):
+        start.wait()
+        try:
+            shared.fetch(session, "SELECT ORDER_ID FROM Orders WHERE ORDER_ID = 'ORD-0007'", fetch_rows)
+        except connector_errors.ServiceUnavailableError as e:
+            return e
+
+    with ThreadPoolExecutor(10) as threads:
+        errors = list(threads.map(failed_fetch, range(10)))
+    assert all(isinstance(error, connector_errors.ServiceUnavailableError) for error in errors), errors
+    assert shared.breaker.failures == 1 and shared.breaker.state == CLOSED, shared.metrics()
+
+    session.fault = None
+    slow_query = "SELECT ORDER_ID FROM Orders WHERE ORDER_ID = 'ORD-0008'"
+    leader = threading.Thread(target=shared.fetch, args=(session, slow_query, fetch_rows))
+    leader.start()
+    time.sleep(0.05)
+    try:
+        coalesced(session, slow_query, fetch_rows, timeout=0.01, guard=shared.breaker.call)
+        raise AssertionError("the waiter should have timed out")
+    except CoalescedQueryTimeout:
+        pass
+    leader.join()
+    assert shared.breaker.failures == 0 and shared.breaker.stats["failures"] == 1, shared.metrics()
+    print(f"10 callers sharing one failed query: {shared.breaker.stats['failures']} breaker failure")
+
+    # Failing warehouse: three failures open the breaker; then no queries, stale results only.
+    session.latency = 0.0
+    session.fault = connector_errors.ServiceUnavailableError(msg="warehouse queue overloaded")
+    for i in range(3):
+        try:
+            cache.fetch(session, f"SELECT ORDER_ID FROM Orders WHERE ORDER_ID = 'ORD-000{i + 1}'", fetch_rows)
+        except connector_errors.ServiceUnavailableError:
+            pass
+    assert cache.breaker.state == OPEN, cache.metrics()
+    queries = session.query_count
+    time.sleep(0.25)
+    served = cache.fetch(session, query, fetch_rows)
+    assert served.stale and session.query_count == queries
+    try:
+        cache.fetch(session, "SELECT ORDER_ID FROM Orders WHERE ORDER_ID = 'ORD-0009'", fetch_rows)
+        raise AssertionError("an uncached query should fail fast while the breaker is open")
+    except CircuitOpenError as e:
+        print(f"breaker open: {e}")
+    assert session.query_count == queries
+
+    # Recovery: after the cool-down one probe goes through and closes the breaker.
+    session.fault = None
+    time.sleep(0.5)
+    served = cache.fetch(session, query, fetch_rows)
+    time.sleep(0.1)
+    assert cache.breaker.state == CLOSED, cache.metrics()
+    print(f"recovered: {cache.metrics()}")
+
+    # Malformed searches are not outages: SQL and authentication errors pass through without
+    # opening the breaker, while a statement timeout still counts.
+    import sqlite3
+
+    for bad_id in ["ORD-1'", "ORD-2'", "ORD-3'"]:
+        try:
+            cache.fetch(session, f"SELECT ORDER_ID FROM Orders WHERE ORDER_ID = '{bad_id}'", fetch_rows)
+            raise AssertionError("the malformed query should have failed")
+        except sqlite3.OperationalError:
+            pass
+    session.fault = connector_errors.ProgrammingError(msg="SQL compilation error", errno=1003)
+    for i in range(3):
+        try:
+            cache.fetch(session, f"SELECT ORDER_ID FROM Orders WHERE ORDER_ID = 'ORD-001{i}'", fetch_rows)
+        except connector_errors.ProgrammingError:
+            pass
+    assert cache.breaker.state == CLOSED and cache.breaker.failures == 0, cache.metrics()
+    assert not is_outage(SnowparkSQLException("Authentication token has expired", sql_error_code=390114))
+    assert is_outage(SnowparkSQLException("Statement reached its statement or warehouse timeout",
+                                          sql_error_code=630))
+    session.fault = None
+    print("6 SQL errors: breaker still closed")